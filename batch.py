@@ -0,0 +1,194 @@
+"""Generate stories for every prompt in a JSONL file, without the Streamlit app.
+
+Each line is a JSON object with a "prompt" and optional per-item options:
+
+    {"prompt": "A lighthouse keeper finds a message in a bottle", "chapters": 3, "model": "meta-llama/llama-3.1-70b-instruct"}
+
+Options are "chapters" (at most this many chapters), "model", "use_async",
+"use_cache", "structured_output", "speculative_acts", "drafts_per_act",
+"max_concurrency", "context_tokens", "reuse_structure" and
+"structure_similarity"; an
+"id" is copied to the metadata record. Every item writes one
+stories/story_*.md, and one JSON record per item is appended to the metadata
+file as it finishes.
+
+    python batch.py prompts.jsonl --parallel 4
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+from similarity_cache import SIMILARITY_THRESHOLD
+from story_context import ContextBudget
+from story_pipeline import STORIES_FOLDER, new_story_file, write_story
+
+# Per-item option names, mapped to the `write_story` options they set
+ITEM_OPTIONS = {
+    "chapters": "max_chapters",
+    "model": "model_name",
+    "use_async": "use_async",
+    "use_cache": "use_cache",
+    "structured_output": "structured_output",
+    "speculative_acts": "speculative_acts",
+    "drafts_per_act": "drafts_per_act",
+    "max_concurrency": "max_concurrency",
+    "max_act_tokens": "max_act_tokens",
+    "deadline": "deadline",
+    "reuse_structure": "reuse_structure",
+    "structure_similarity": "structure_similarity",
+}
+
+
+class BatchError(ValueError):
+    """A line of the prompt file cannot be used"""
+
+
+def read_items(path):
+    """Items of a JSONL prompt file; lines that cannot be parsed become BatchError items"""
+    items = []
+    with open(path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                if not isinstance(item, dict) or not str(item.get("prompt") or "").strip():
+                    raise BatchError("expected an object with a non-empty \"prompt\"")
+            except ValueError as e:
+                item = {"error": BatchError(f"{path}:{line_number}: {e}")}
+            item["line"] = line_number
+            items.append(item)
+    return items
+
+
+def item_options(item, defaults):
+    """`write_story` options of an item: the command-line defaults overridden by the item"""
+    options = dict(defaults)
+    for name, option in ITEM_OPTIONS.items():
+        if name in item:
+            options[option] = item[name]
+    context_tokens = item.get("context_tokens", options.pop("context_tokens", None))
+    if context_tokens:
+        options["context_budget"] = ContextBudget(recent_tokens=context_tokens, blueprint_tokens=context_tokens)
+    return options
+
+
+def trace_totals(story_file):
+    """Call and token totals from the trace report that `write_story` leaves next to the story"""
+    try:
+        with open(story_file.with_name(story_file.stem + ".trace.json"), "r") as f:
+            return json.load(f)["totals"]
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def run_item(item, defaults, folder):
+    """Write the story of one item and return its metadata record"""
+    record = {"line": item["line"], "id": item.get("id"), "prompt": item.get("prompt"), "started_at": datetime.now().isoformat()}
+    started = time.monotonic()
+    story_file = None
+    try:
+        if "error" in item:
+            raise item["error"]
+        options = item_options(item, defaults)
+        record["options"] = {name: value for name, value in options.items() if name != "context_budget"}
+        story_file = new_story_file(item["prompt"], folder)
+        write_story(item["prompt"], story_file=story_file, **options)
+        record["status"] = "done"
+    except Exception as e:
+        record["status"] = "failed"
+        record["error"] = "".join(traceback.format_exception_only(type(e), e)).strip()
+    record["seconds"] = round(time.monotonic() - started, 3)
+    if story_file is not None:
+        record["story_file"] = str(story_file)
+        record.update({name: value for name, value in trace_totals(story_file).items() if name in ("calls", "prompt_tokens", "completion_tokens")})
+    return record
+
+
+def run_batch(path, parallel=2, defaults=None, folder=STORIES_FOLDER, metadata_path=None, out=sys.stderr):
+    """Run every item of a prompt file, `parallel` stories at a time; returns the metadata records"""
+    items = read_items(path)
+    if metadata_path is None:
+        metadata_path = Path(folder) / f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+    Path(metadata_path).parent.mkdir(parents=True, exist_ok=True)
+    records = []
+    lock = threading.Lock()
+    started = time.monotonic()
+    with open(metadata_path, "a") as metadata, ThreadPoolExecutor(max_workers=parallel) as pool:
+        futures = [pool.submit(run_item, item, defaults or {}, folder) for item in items]
+        for future in as_completed(futures):
+            record = future.result()
+            with lock:
+                records.append(record)
+                metadata.write(json.dumps(record) + "\n")
+                metadata.flush()
+            elapsed = time.monotonic() - started
+            done = sum(record["status"] == "done" for record in records)
+            print(
+                f"[{len(records)}/{len(items)}] {record['status']} line {record['line']} in {record['seconds']:.1f}s"
+                f" ({done / elapsed * 3600:.1f} stories/hour so far)"
+                + (f": {record['error']}" if record["status"] == "failed" else f" -> {record['story_file']}"),
+                file=out,
+            )
+    print_summary(records, time.monotonic() - started, metadata_path, out)
+    return records
+
+
+def print_summary(records, elapsed, metadata_path, out=sys.stderr):
+    done = [record for record in records if record["status"] == "done"]
+    completion_tokens = sum(record.get("completion_tokens", 0) for record in done)
+    print(
+        f"{len(done)} of {len(records)} stories written in {elapsed:.1f}s "
+        f"({len(done) / elapsed * 3600 if elapsed else 0.0:.1f} stories/hour, "
+        f"{sum(record.get('calls', 0) for record in done)} model calls, "
+        f"{sum(record.get('prompt_tokens', 0) for record in done)} prompt and {completion_tokens} completion tokens, "
+        f"{completion_tokens / elapsed if elapsed else 0.0:.1f} completion tokens/s); metadata in {metadata_path}",
+        file=out,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("prompts", help="JSONL file with one {\"prompt\": ...} object per line")
+    parser.add_argument("--parallel", type=int, default=2, help="stories generated at the same time")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="model calls at the same time within one story")
+    parser.add_argument("--use-async", action="store_true", help="run model calls on the shared event loop")
+    parser.add_argument("--no-cache", action="store_true", help="do not reuse cached completions")
+    parser.add_argument("--structured-output", action="store_true", help="ask for chapter and act JSON in the generating calls")
+    parser.add_argument("--speculative-acts", action="store_true", help="draft the acts of a chapter in parallel and bridge the seams that need it")
+    parser.add_argument("--drafts-per-act", type=int, default=1, help="drafts of every act to choose the best from (with --speculative-acts)")
+    parser.add_argument("--context-tokens", type=int, help="bound act prompts to about this many verbatim context tokens")
+    parser.add_argument("--max-chapters", type=int, help="write at most this many chapters of every story")
+    parser.add_argument("--max-act-tokens", type=int, help="cut every act off at this many completion tokens")
+    parser.add_argument("--deadline", type=float, help="seconds a story should take; chapters are dropped from the end of its plan to fit")
+    parser.add_argument("--no-structure-reuse", action="store_true", help="analyse the structure of every prompt, even if a similar one was analysed before")
+    parser.add_argument("--structure-similarity", type=float, default=SIMILARITY_THRESHOLD, help="similarity from which an earlier prompt's structure analysis is reused")
+    parser.add_argument("--output", default=str(STORIES_FOLDER), help="folder for the stories")
+    parser.add_argument("--metadata", help="JSONL file for the per-item records (default: <output>/batch_<time>.jsonl)")
+    parser.add_argument("--models", help="routing config with the models of each stage (default: $STORY_MODELS or models.json)")
+    args = parser.parse_args()
+    if args.models:
+        os.environ["STORY_MODELS"] = args.models
+    defaults = {
+        "max_concurrency": args.max_concurrency,
+        "use_async": args.use_async,
+        "use_cache": not args.no_cache,
+        "structured_output": args.structured_output,
+        "speculative_acts": args.speculative_acts,
+        "drafts_per_act": args.drafts_per_act,
+        "context_tokens": args.context_tokens,
+        "max_chapters": args.max_chapters,
+        "max_act_tokens": args.max_act_tokens,
+        "deadline": args.deadline,
+        "reuse_structure": not args.no_structure_reuse,
+        "structure_similarity": args.structure_similarity,
+    }
+    records = run_batch(args.prompts, args.parallel, defaults, args.output, args.metadata)
+    sys.exit(0 if all(record["status"] == "done" for record in records) else 1)
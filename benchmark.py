@@ -0,0 +1,228 @@
+"""Benchmark the whole story pipeline offline, against the deterministic mock model.
+
+`MockChatModel` replaces the module-level model, with configurable latency,
+generation speed and completion lengths (or completions replayed from the
+checkpoints of real runs). The stories are written headless, several at a
+time like `batch.py` does, and the run reports stories/hour, p50/p95 latency
+of every stage, peak memory and prompt tokens. Every run is appended to a
+results file, so changes to the pipeline can be compared run against run:
+
+    python benchmark.py --stories 8 --parallel 4 --label baseline
+    python benchmark.py --stories 8 --parallel 4 --use-async --label async
+    python benchmark.py --compare
+"""
+import argparse
+import glob
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import story_pipeline
+from checkpoint import read_results
+from governor import Governor
+from mock_model import MockChatModel
+from story_pipeline import new_story_file, write_story
+
+RESULTS_PATH = Path("benchmarks") / "results.jsonl"
+# Stages in pipeline order, for the report; stages not listed come after them
+STAGE_ORDER = ["structure", "structure_summary", "blueprint_draft", "blueprint", "chapters", "acts", "acts_json", "draft", "bridge", "act"]
+# `write_story` options a benchmark run can set
+RUN_OPTIONS = ["max_concurrency", "use_async", "structured_output", "speculative_acts", "drafts_per_act", "max_chapters"]
+
+
+def percentile(values, share):
+    """Nearest-rank percentile of `values` (share between 0 and 1)"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, round(share * len(ordered) + 0.5) - 1))]
+
+
+def recordings_from_checkpoints(paths):
+    """Completions of real runs, by stage, from their checkpoints (for `MockChatModel.recordings`)"""
+    recordings = {}
+    for path in paths:
+        for key, value in read_results(path):
+            stage = key.split("/")[0]
+            if stage == "chapters":
+                value = json.dumps({"chapters": value})
+            elif stage == "acts_json":
+                value = json.dumps(value)
+            elif stage == "draft":
+                stage = "act"
+            elif stage == "bridge":
+                value = value.get("bridge") if isinstance(value, dict) else None
+            if isinstance(value, str) and value.strip():
+                recordings.setdefault(stage, []).append(value)
+    return recordings
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(model, stories=4, parallel=2, options=None, label=None):
+    """Write `stories` stories with `model` standing in for the provider; returns the result record"""
+    options = dict(options or {})
+    previous_model, previous_governor = story_pipeline.model, story_pipeline.governor
+    story_pipeline.model = model
+    # Only the pipeline is measured, so the provider's rate limits are lifted
+    story_pipeline.governor = Governor(requests_per_minute=None, tokens_per_minute=None)
+    stage_seconds = {}
+    totals = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+    failures = []
+    lock = threading.Lock()
+
+    def write(folder, index):
+        prompt = f"benchmark story {index}"
+        try:
+            story_file = new_story_file(prompt, folder)
+            write_story(prompt, story_file=story_file, use_cache=False, **options)
+        except Exception as e:
+            with lock:
+                failures.append(repr(e))
+            return
+        with open(story_file.with_name(story_file.stem + ".trace.json"), "r") as f:
+            trace = json.load(f)
+        with lock:
+            for name in totals:
+                totals[name] += trace["totals"].get(name, 0)
+            for span in trace["spans"]:
+                if span["calls"]:
+                    stage_seconds.setdefault(span["stage"], []).append(span["wall_seconds"])
+
+    tracemalloc.start()
+    started = time.monotonic()
+    try:
+        with tempfile.TemporaryDirectory() as folder, ThreadPoolExecutor(max_workers=parallel) as pool:
+            list(pool.map(lambda index: write(folder, index), range(stories)))
+        elapsed = time.monotonic() - started
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+        story_pipeline.model, story_pipeline.governor = previous_model, previous_governor
+    done = stories - len(failures)
+    order = {stage: index for index, stage in enumerate(STAGE_ORDER)}
+    return {
+        "label": label,
+        "commit": git_commit(),
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+        "stories": stories,
+        "parallel": parallel,
+        "options": options,
+        "model": {name: getattr(model, name) for name in ("latency", "latency_spread", "token_delay", "words", "words_spread", "chapters", "seed")},
+        "replayed": bool(model.recordings),
+        "failed": failures,
+        "seconds": round(elapsed, 3),
+        "stories_per_hour": round(done / elapsed * 3600, 1) if elapsed else 0.0,
+        "stages": {
+            stage: {"calls": len(seconds), "p50": round(percentile(seconds, 0.5), 3), "p95": round(percentile(seconds, 0.95), 3)}
+            for stage, seconds in sorted(stage_seconds.items(), key=lambda item: order.get(item[0], len(order)))
+        },
+        # Python allocations traced during the run; max_rss_mb is the whole process, imports included
+        "peak_memory_mb": round(peak_bytes / 2 ** 20, 1),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        **totals,
+        "prompt_tokens_per_story": round(totals["prompt_tokens"] / done) if done else 0,
+    }
+
+
+def store_result(record, path=RESULTS_PATH):
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def load_results(path=RESULTS_PATH):
+    try:
+        with open(path, "r") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def print_result(record, previous=None, out=sys.stdout):
+    """Report of one run; with `previous` (a comparable earlier run), the change of the headline numbers"""
+    def change(name):
+        if previous is None or not previous.get(name):
+            return ""
+        return f" ({record[name] / previous[name] - 1:+.0%} vs {previous.get('label') or previous['finished_at']})"
+
+    print(f"{record['stories'] - len(record['failed'])} of {record['stories']} stories in {record['seconds']:.1f}s: "
+          f"{record['stories_per_hour']:.1f} stories/hour{change('stories_per_hour')}", file=out)
+    print(f"peak memory {record['peak_memory_mb']:.1f} MB traced, {record['max_rss_mb']:.1f} MB max RSS{change('peak_memory_mb')}", file=out)
+    print(f"{record['calls']} calls, {record['prompt_tokens']} prompt tokens ({record['prompt_tokens_per_story']} per story"
+          f"{change('prompt_tokens_per_story')}), {record['completion_tokens']} completion tokens", file=out)
+    print(f"{'stage':<20}{'calls':>7}{'p50 s':>9}{'p95 s':>9}", file=out)
+    for stage, row in record["stages"].items():
+        print(f"{stage:<20}{row['calls']:>7}{row['p50']:>9.3f}{row['p95']:>9.3f}", file=out)
+    for failure in record["failed"]:
+        print(f"failed: {failure}", file=out)
+
+
+def comparable(record, other):
+    """Whether two runs measured the same workload"""
+    return all(record[name] == other[name] for name in ("stories", "parallel", "model", "replayed"))
+
+
+def print_comparison(records, out=sys.stdout):
+    """One line per stored run, oldest first"""
+    print(f"{'finished':<21}{'label':<18}{'commit':<10}{'stories/h':>10}{'act p50':>9}{'act p95':>9}{'peak MB':>9}{'prompt tok/story':>18}", file=out)
+    for record in records:
+        act = record["stages"].get("act", {})
+        print(f"{record['finished_at']:<21}{(record['label'] or '')[:17]:<18}{record['commit'] or '':<10}{record['stories_per_hour']:>10.1f}"
+              f"{act.get('p50', 0.0):>9.3f}{act.get('p95', 0.0):>9.3f}{record['peak_memory_mb']:>9.1f}{record['prompt_tokens_per_story']:>18}", file=out)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stories", type=int, default=4, help="stories written")
+    parser.add_argument("--parallel", type=int, default=2, help="stories written at the same time")
+    parser.add_argument("--chapters", type=int, default=3, help="chapters per story")
+    parser.add_argument("--latency", type=float, default=0.2, help="median seconds before the first token of a call")
+    parser.add_argument("--latency-spread", type=float, default=0.3, help="log-normal sigma of the first-token latency")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="generation speed of the mock model (0 for instant)")
+    parser.add_argument("--words", type=int, default=600, help="mean words of a prose completion")
+    parser.add_argument("--words-spread", type=float, default=0.2, help="relative standard deviation of completion lengths")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the mock model's latencies and lengths")
+    parser.add_argument("--replay", nargs="*", default=[], help="checkpoints (globs) of real runs whose completions are replayed")
+    parser.add_argument("--max-concurrency", type=int, default=4, help="model calls at the same time within one story")
+    parser.add_argument("--use-async", action="store_true", help="run model calls on the shared event loop")
+    parser.add_argument("--structured-output", action="store_true", help="ask for chapter and act JSON in the generating calls")
+    parser.add_argument("--speculative-acts", action="store_true", help="draft the acts of a chapter in parallel")
+    parser.add_argument("--drafts-per-act", type=int, default=1, help="drafts of every act (with --speculative-acts)")
+    parser.add_argument("--label", help="name of this run in the results file")
+    parser.add_argument("--results", default=str(RESULTS_PATH), help="JSONL file the results are appended to")
+    parser.add_argument("--compare", action="store_true", help="only list the stored results")
+    args = parser.parse_args()
+    if args.compare:
+        print_comparison(load_results(args.results))
+        sys.exit(0)
+    recordings = recordings_from_checkpoints(path for pattern in args.replay for path in glob.glob(pattern))
+    model = MockChatModel(
+        latency=args.latency, latency_spread=args.latency_spread, token_delay=1 / args.tokens_per_second if args.tokens_per_second else 0.0,
+        words=args.words, words_spread=args.words_spread, chapters=args.chapters, seed=args.seed, recordings=recordings,
+    )
+    options = {
+        "max_concurrency": args.max_concurrency,
+        "use_async": args.use_async,
+        "structured_output": args.structured_output,
+        "speculative_acts": args.speculative_acts,
+        "drafts_per_act": args.drafts_per_act,
+        "max_chapters": args.chapters,
+    }
+    record = run_benchmark(model, args.stories, args.parallel, options, args.label)
+    earlier = [other for other in load_results(args.results) if comparable(record, other)]
+    print_result(record, earlier[-1] if earlier else None)
+    store_result(record, args.results)
@@ -0,0 +1,88 @@
+"""Compare sequential and speculative (drafted in parallel) act writing on the offline mock model.
+
+Every mode writes the same stories with `MockChatModel` standing in for the
+provider, so the numbers only reflect the pipeline: how long until each
+chapter is complete, how many calls and tokens it took, and how many seams
+needed a bridging call.
+
+    python benchmark_acts.py --stories 3 --chapters 3 --latency 0.5 --token-delay 0.002
+"""
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import story_pipeline
+from governor import Governor
+from mock_model import MockChatModel
+from story_pipeline import new_story_file, write_story
+
+# (name, StoryRun options) of every mode compared
+MODES = [
+    ("sequential", {}),
+    ("speculative", {"speculative_acts": True}),
+    ("speculative best-of-2", {"speculative_acts": True, "drafts_per_act": 2}),
+]
+
+
+def run_mode(options, prompts, folder, max_concurrency, max_chapters):
+    """Write every prompt with `options`; returns the measurements of the mode"""
+    chapter_seconds = []
+    story_seconds = []
+    totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "bridges": 0}
+    for prompt in prompts:
+        started = time.monotonic()
+        finished = {}
+
+        def on_progress(message, fraction):
+            # "Chapter 2, act 3 written": the chapter is complete once its last act is
+            if message.startswith("Chapter ") and message.endswith("act 3 written"):
+                finished[message.split(",")[0]] = time.monotonic() - started
+
+        story_file = new_story_file(prompt, folder)
+        write_story(prompt, story_file=story_file, on_progress=on_progress, use_cache=False,
+                    max_concurrency=max_concurrency, max_chapters=max_chapters, **options)
+        story_seconds.append(time.monotonic() - started)
+        chapter_seconds.extend(finished.values())
+        with open(story_file.with_name(story_file.stem + ".trace.json"), "r") as f:
+            trace = json.load(f)
+        for name in ("calls", "prompt_tokens", "completion_tokens"):
+            totals[name] += trace["totals"][name]
+        totals["bridges"] += sum(span["calls"] for span in trace["spans"] if span["stage"] == "bridge")
+    return {
+        "story_seconds": statistics.mean(story_seconds),
+        "chapter_seconds": statistics.mean(chapter_seconds) if chapter_seconds else 0.0,
+        **totals,
+    }
+
+
+def print_results(results):
+    baseline = results[0][1]
+    print(f"{'mode':<24}{'story s':>9}{'chapter s':>11}{'calls':>7}{'prompt tok':>12}{'compl. tok':>12}{'bridges':>9}{'tokens vs seq':>15}")
+    for name, row in results:
+        tokens = row["prompt_tokens"] + row["completion_tokens"]
+        extra = tokens / (baseline["prompt_tokens"] + baseline["completion_tokens"]) - 1
+        print(f"{name:<24}{row['story_seconds']:>9.2f}{row['chapter_seconds']:>11.2f}{row['calls']:>7}"
+              f"{row['prompt_tokens']:>12}{row['completion_tokens']:>12}{row['bridges']:>9}{extra:>+15.0%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stories", type=int, default=2, help="stories written per mode")
+    parser.add_argument("--chapters", type=int, default=3, help="chapters per story")
+    parser.add_argument("--latency", type=float, default=0.3, help="seconds before the first token of every call")
+    parser.add_argument("--token-delay", type=float, default=0.002, help="seconds per generated word")
+    parser.add_argument("--words", type=int, default=600, help="words of every prose completion")
+    parser.add_argument("--max-concurrency", type=int, default=12, help="model calls at the same time within one story")
+    args = parser.parse_args()
+    story_pipeline.model = MockChatModel(latency=args.latency, token_delay=args.token_delay, words=args.words, chapters=args.chapters)
+    # The provider's rate limits would make later modes wait for quota used by earlier ones
+    story_pipeline.governor = Governor(requests_per_minute=None, tokens_per_minute=None)
+    prompts = [f"benchmark story {index}" for index in range(args.stories)]
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for name, options in MODES:
+            results.append((name, run_mode(options, prompts, Path(folder) / name.replace(" ", "_"), args.max_concurrency, args.chapters)))
+    print_results(results)
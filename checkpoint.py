@@ -0,0 +1,208 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+CHECKPOINT_SUFFIX = ".checkpoint.jsonl"
+
+# (mtime, size) and summary of every checkpoint `unfinished_checkpoints` has read, by path
+_summaries = {}
+_summaries_lock = threading.Lock()
+
+
+def checkpoint_path(story_file):
+    """Checkpoint log that sits next to a `stories/story_*.md` file"""
+    story_file = Path(story_file)
+    return story_file.with_name(story_file.stem + CHECKPOINT_SUFFIX)
+
+
+def encode_key(key):
+    """Task keys such as ("act", 2, 0) become "act/2/0" in the log"""
+    if isinstance(key, tuple):
+        return "/".join(str(part) for part in key)
+    return str(key)
+
+
+class Checkpoint:
+    """Results of the finished pipeline stages of one story, in an append-only JSON Lines log.
+
+    The first line names the prompt and story file; every recorded stage
+    appends one line (and `finish` a last one), so saving a stage costs the
+    size of that stage and a crash loses at most the stages that were still
+    running. A line torn by a crash is cut off on load. Only the offset of each
+    result is kept in memory; `get` reads the result back from the log.
+    """
+
+    def __init__(self, path, prompt, story_file, offsets=None, finished=False):
+        self.path = Path(path)
+        self.prompt = prompt
+        self.story_file = Path(story_file)
+        self.finished = finished
+        self._offsets = dict(offsets or {})
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_story(cls, story_file, prompt):
+        """Start an empty checkpoint for a new story"""
+        checkpoint = cls(checkpoint_path(story_file), prompt, story_file)
+        checkpoint.save()
+        return checkpoint
+
+    @classmethod
+    def load(cls, path):
+        path = Path(path)
+        offsets, finished = {}, False
+        with open(path, "rb") as f:
+            header = json.loads(f.readline())
+            while True:
+                offset = f.tell()
+                line = f.readline()
+                if not line:
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                if record is None or not line.endswith(b"\n"):
+                    # Torn by a crash mid-write: drop it, so later records are not appended after it
+                    f.close()
+                    os.truncate(path, offset)
+                    break
+                if "key" in record:
+                    offsets[record["key"]] = offset
+                elif record.get("finished"):
+                    finished = True
+        return cls(path, header["prompt"], header["story_file"], offsets, finished)
+
+    def __contains__(self, key):
+        with self._lock:
+            return encode_key(key) in self._offsets
+
+    def __len__(self):
+        with self._lock:
+            return len(self._offsets)
+
+    def keys(self):
+        with self._lock:
+            return list(self._offsets)
+
+    def get(self, key, default=None):
+        with self._lock:
+            offset = self._offsets.get(encode_key(key))
+        if offset is None:
+            return default
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return json.loads(f.readline())["value"]
+
+    def items(self):
+        """(key, result) of every recorded stage, read from the log one at a time"""
+        with self._lock:
+            offsets = dict(self._offsets)
+        with open(self.path, "rb") as f:
+            for key, offset in offsets.items():
+                f.seek(offset)
+                yield key, json.loads(f.readline())["value"]
+
+    def record(self, key, value):
+        """Store the result of a finished stage"""
+        key = encode_key(key)
+        line = json.dumps({"key": key, "value": value}) + "\n"
+        with self._lock:
+            self._offsets[key] = self._append(line)
+
+    def finish(self):
+        """Mark the story as complete so it is no longer offered for resuming"""
+        with self._lock:
+            self._append(json.dumps({"finished": True}) + "\n")
+            self.finished = True
+
+    def save(self):
+        """(Re)write the log with the header alone, through a temporary file"""
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = self.path.with_name(self.path.name + ".tmp")
+            with open(temp_path, "w") as f:
+                f.write(json.dumps({"prompt": self.prompt, "story_file": str(self.story_file)}) + "\n")
+            os.replace(temp_path, self.path)
+            self._offsets = {}
+            self.finished = False
+
+    def _append(self, line):
+        # Caller must hold self._lock; returns the offset of the line
+        with open(self.path, "ab") as f:
+            offset = f.tell()
+            f.write(line.encode("utf-8"))
+        return offset
+
+
+def read_results(path):
+    """(key, result) of every stage in a checkpoint, without changing the file"""
+    with open(path, "rb") as f:
+        f.readline()
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                return
+            if "key" in record:
+                yield record["key"], record["value"]
+
+
+class CheckpointSummary:
+    """What listing a checkpoint needs, without reading its results"""
+
+    __slots__ = ("path", "prompt", "story_file", "stages", "finished")
+
+    def __init__(self, path, prompt, story_file, stages, finished):
+        self.path = Path(path)
+        self.prompt = prompt
+        self.story_file = Path(story_file)
+        self.stages = stages
+        self.finished = finished
+
+
+def summarize(path):
+    """Prompt, story file, number of stages and whether it is finished, of one checkpoint"""
+    path = Path(path)
+    stages, finished = 0, False
+    with open(path, "rb") as f:
+        header = json.loads(f.readline())
+        # Records are counted by their prefix; the (possibly large) results are never parsed
+        for line in f:
+            if line.startswith(b'{"key": '):
+                stages += 1
+            elif line.startswith(b'{"finished": true}'):
+                finished = True
+    return CheckpointSummary(path, header["prompt"], header["story_file"], stages, finished)
+
+
+def unfinished_checkpoints(stories_folder):
+    """Checkpoints of stories that stopped before their last act, most recent first.
+
+    Summaries are kept between calls and only checkpoints whose size or
+    modification time changed are read again, so listing them on every rerun
+    of the app does not grow with the number of stories written.
+    """
+    folder = Path(stories_folder)
+    paths = list(folder.glob("story_*" + CHECKPOINT_SUFFIX))
+    summaries = []
+    with _summaries_lock:
+        for gone in set(_summaries) - set(paths):
+            del _summaries[gone]
+    for path in sorted(paths, key=lambda path: path.name, reverse=True):
+        try:
+            stat = path.stat()
+            with _summaries_lock:
+                cached = _summaries.get(path)
+            if cached is not None and cached[0] == (stat.st_mtime_ns, stat.st_size):
+                summary = cached[1]
+            else:
+                summary = summarize(path)
+                with _summaries_lock:
+                    _summaries[path] = ((stat.st_mtime_ns, stat.st_size), summary)
+        except (OSError, ValueError, KeyError):
+            continue
+        if not summary.finished:
+            summaries.append(summary)
+    return summaries
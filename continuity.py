@@ -0,0 +1,88 @@
+"""Local checks for acts drafted in parallel: does a draft follow on from the text before it, and which draft is best.
+
+Nothing here calls the model; both checks are word statistics over the seam
+between two acts, so they cost microseconds next to a model call.
+"""
+import re
+
+WORD_RE = re.compile(r"[A-Za-z][A-Za-z'’-]*")
+SENTENCE_END_RE = re.compile(r"[.!?…\"”]\s+|\n+")
+# Words read on each side of the seam between two acts
+SEAM_WORDS = 400
+# Share of a draft's opening word 5-grams that may repeat the text before it
+MAX_RETOLD = 0.08
+# Length a full act aims for ("at least 3 pages")
+TARGET_WORDS = 1200
+# Openings that mean the model talked about the act instead of writing it
+PREAMBLE_RE = re.compile(r"^\s*(here is|here's|sure|certainly|act \d|chapter \d|\*\*act)", re.IGNORECASE)
+STOPWORDS = frozenset("""
+a about after again against all also an and any are as at be because been before being between both but by can
+could did do does doing down during each few for from further had has have having he her here hers herself him
+himself his how i if in into is it its itself just me more most my myself no nor not now of off on once only or
+other our ours out over own same she should so some such than that the their theirs them themselves then there
+these they this those through to too under until up very was we were what when where which while who whom why
+will with would you your yours yourself act chapter story scene
+""".split())
+
+
+def words(text):
+    return WORD_RE.findall(text)
+
+
+def character_names(text):
+    """Capitalized words that do not start a sentence and are not common words: mostly names of people and places"""
+    names = set()
+    for sentence in SENTENCE_END_RE.split(text):
+        for word in words(sentence)[1:]:
+            if word[0].isupper() and word.lower() not in STOPWORDS and len(word) > 2:
+                names.add(word.strip("'’"))
+    return names
+
+
+def shingles(tokens, size=5):
+    return {tuple(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+
+def continuity_issues(previous_text, draft):
+    """Reasons a draft does not follow on from `previous_text`, or an empty list if the seam looks fine"""
+    issues = []
+    previous_words = [word.lower() for word in words(previous_text)]
+    draft_head = " ".join(words(draft)[:SEAM_WORDS])
+    opening = shingles([word.lower() for word in words(draft_head)])
+    if opening:
+        retold = len(opening & shingles(previous_words)) / len(opening)
+        if retold > MAX_RETOLD:
+            issues.append(f"the next part retells {retold:.0%} of its opening from the text before it")
+    tail_names = character_names(" ".join(words(previous_text)[-SEAM_WORDS:]))
+    head_names = character_names(draft_head)
+    if tail_names and head_names and not tail_names & head_names:
+        issues.append(
+            f"the text so far ends with {', '.join(sorted(tail_names)[:5])} but the next part opens with "
+            f"{', '.join(sorted(head_names)[:5])} and none of them"
+        )
+    return issues
+
+
+def score_draft(draft, act_description):
+    """Cheap quality score of one act draft (higher is better).
+
+    Rewards covering the content words of the act description and reaching
+    the target length, penalizes repetitive text and meta preambles.
+    """
+    draft_words = [word.lower() for word in words(draft)]
+    if not draft_words:
+        return 0.0
+    wanted = {word.lower() for word in words(act_description or "")} - STOPWORDS
+    wanted = {word for word in wanted if len(word) > 3}
+    coverage = len(wanted & set(draft_words)) / len(wanted) if wanted else 1.0
+    length = min(1.0, len(draft_words) / TARGET_WORDS)
+    sample = draft_words[:TARGET_WORDS]
+    variety = len(set(sample)) / len(sample)
+    preamble = 0.2 if PREAMBLE_RE.match(draft) else 0.0
+    return 0.5 * coverage + 0.3 * length + 0.2 * variety - preamble
+
+
+def best_draft(drafts, act_description):
+    """Index of the best scoring draft; the first one wins ties"""
+    scores = [score_draft(draft, act_description) for draft in drafts]
+    return scores.index(max(scores))
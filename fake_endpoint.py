@@ -0,0 +1,170 @@
+"""Local OpenAI-compatible chat endpoint for exercising the pipeline without a provider.
+
+Answers /v1/chat/completions (plain and streamed) with `MockChatModel`'s canned
+responses, after a configurable delay, and rejects a share of requests with
+429 Too Many Requests (with a Retry-After header) or 503. Like providers with
+automatic prompt caching, it reports the leading content block of a message
+as cached tokens once it has seen that block before. Point the model at it
+with base_url="http://127.0.0.1:8765/v1".
+
+    python fake_endpoint.py --port 8765 --rate-limit 0.2 --delay 0.5
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from mock_model import MockChatModel
+from tokens import count_tokens
+
+
+class FakeEndpointHandler(BaseHTTPRequestHandler):
+    server_version = "FakeOpenAI/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        self.server.count("requests")
+
+        roll = self.server.random.random()
+        if roll < self.server.rate_limit:
+            self.server.count("rate_limited")
+            self._send_json(429, {"error": {"message": "Rate limit exceeded", "type": "rate_limit_error"}},
+                            headers={"Retry-After": str(self.server.retry_after)})
+            return
+        if roll < self.server.rate_limit + self.server.server_errors:
+            self.server.count("server_errors")
+            self._send_json(503, {"error": {"message": "Upstream overloaded", "type": "server_error"}})
+            return
+
+        time.sleep(self.server.delay + self.server.random.uniform(0, self.server.jitter))
+        messages = body.get("messages") or [{"content": ""}]
+        content = messages[-1].get("content") or ""
+        prompt = MockChatModel.content_text(content)
+        text = self.server.model.respond(prompt)
+        usage = {
+            "prompt_tokens": count_tokens(prompt),
+            "completion_tokens": count_tokens(text),
+            "prompt_tokens_details": {"cached_tokens": self.server.cached_prefix_tokens(content)},
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        model_name = body.get("model", "fake-model")
+        if body.get("stream"):
+            self._send_stream(model_name, text)
+        else:
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model_name,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_stream(self, model_name, text):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        for token in MockChatModel.tokens(text):
+            self._send_event(completion_id, model_name, {"content": token}, None)
+            if self.server.token_delay:
+                time.sleep(self.server.token_delay)
+        self._send_event(completion_id, model_name, {}, "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def _send_event(self, completion_id, model_name, delta, finish_reason):
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model_name,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+
+
+class FakeEndpoint(ThreadingHTTPServer):
+    """Threaded fake provider; `counters` tracks requests, rate-limited and failed responses"""
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, rate_limit=0.0, server_errors=0.0, delay=0.0, jitter=0.0,
+                 token_delay=0.0, retry_after=1, seed=None, model=None, verbose=False):
+        super().__init__((host, port), FakeEndpointHandler)
+        self.rate_limit = rate_limit
+        self.server_errors = server_errors
+        self.delay = delay
+        self.jitter = jitter
+        self.token_delay = token_delay
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.model = model or MockChatModel()
+        self.verbose = verbose
+        self.counters = {"requests": 0, "rate_limited": 0, "server_errors": 0}
+        self._prefixes = set()
+        self._lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def cached_prefix_tokens(self, content):
+        """Tokens of the message's first content block if an earlier request started with it"""
+        if not isinstance(content, list) or len(content) < 2:
+            return 0
+        prefix = MockChatModel.content_text(content[:1])
+        with self._lock:
+            if prefix in self._prefixes:
+                return count_tokens(prefix)
+            self._prefixes.add(prefix)
+        return 0
+
+    def start(self):
+        """Serve on a background thread and return self"""
+        threading.Thread(target=self.serve_forever, name="fake-endpoint", daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--server-errors", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds before each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random delay, up to this many seconds")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="seconds between streamed tokens")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After header sent with 429s")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    server = FakeEndpoint(args.host, args.port, args.rate_limit, args.server_errors, args.delay, args.jitter,
+                          args.token_delay, args.retry_after, args.seed, verbose=True)
+    print(f"Fake OpenAI endpoint on {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,291 @@
+import asyncio
+import itertools
+import random
+import threading
+import time
+from functools import lru_cache
+
+
+@lru_cache(maxsize=None)
+def retryable_errors():
+    """Errors worth another attempt; anything else (bad request, auth) fails straight away.
+
+    Looked up on first use, so importing the governor does not import the openai SDK.
+    """
+    import openai
+    return (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+        asyncio.TimeoutError,
+        TimeoutError,
+    )
+
+
+class CircuitOpenError(RuntimeError):
+    """The provider failed too often recently; calls are refused until the breaker half-opens"""
+
+
+class DeadlineExceeded(TimeoutError):
+    """A request could not finish (including retries) before its deadline"""
+
+
+class TokenBucket:
+    """Allows `rate` units per minute with bursts up to `capacity`.
+
+    `reserve` takes the units straight away, letting the balance go negative, and
+    returns how long the caller has to wait before using them. That keeps
+    waiting callers in order and works the same for threads and coroutines.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate / 60.0
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount=1):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def adjust(self, amount):
+        """Give back (positive) or charge (negative) units once the real cost is known"""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+    def take(self, amount=1):
+        """Take the units only if they are there now; never waits or goes negative"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens < amount:
+                return False
+            self._tokens -= amount
+            return True
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and lets one probe through after `reset_timeout` seconds"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probe = None
+        self._probes = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def before_call(self):
+        """Raise while the circuit is open; returns the probe's id when this call is the half-open probe, else None"""
+        with self._lock:
+            if self._opened_at is None:
+                return None
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probe is not None:
+                raise CircuitOpenError("Model provider circuit is open after repeated failures")
+            self._probe = next(self._probes)
+            return self._probe
+
+    def release(self, probe):
+        """End a probe that neither succeeded nor failed (deadline, cancellation), so another call can probe"""
+        with self._lock:
+            if probe is not None and self._probe == probe:
+                self._probe = None
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probe = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe = None
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class RetryBudget:
+    """Caps retries so a struggling provider is not flooded.
+
+    Retries refill at `per_minute` (in bursts of up to `capacity`), and each
+    successful request adds `ratio` of a retry on top, so a long run keeps
+    retrying at a steady pace instead of spending a fixed allowance once.
+    """
+
+    def __init__(self, ratio=0.2, per_minute=30, capacity=None):
+        self.ratio = ratio
+        self._bucket = TokenBucket(per_minute, capacity)
+
+    def deposit(self):
+        self._bucket.adjust(self.ratio)
+
+    def withdraw(self):
+        return self._bucket.take(1)
+
+
+def retry_after(error):
+    """Seconds the provider asked us to wait, from a Retry-After header"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class Governor:
+    """Shared gate for every model call: rate limits, retries with backoff, deadlines and a circuit breaker.
+
+    `call` (blocking) and `acall` (async) run `func` once the request and token
+    buckets allow it. Retryable errors are retried with full-jitter exponential
+    backoff while both the retry budget and the request deadline allow it; a
+    rate limit that says when to come back (Retry-After) is waited out without
+    spending the budget. Rate limits never count against the circuit breaker:
+    they mean the quota is in use, not that the provider is failing.
+    """
+
+    def __init__(self, requests_per_minute=60, tokens_per_minute=200_000, max_retries=5, base_delay=1.0,
+                 max_delay=60.0, deadline=600.0, failure_threshold=5, reset_timeout=30.0, retries_per_minute=30):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.budget = RetryBudget(per_minute=retries_per_minute)
+
+    def call(self, func, tokens=0, deadline=None, on_retry=None, max_retries=None):
+        """Run `func(timeout)` under the governor; `tokens` is the estimated cost for the tokens/min bucket.
+
+        `timeout` is the number of seconds left before the deadline; `func` must
+        pass it on as the request's timeout, since a blocking call cannot be cut
+        off from outside. `max_retries` overrides the governor's own limit for
+        this call, e.g. to give up sooner when there is a fallback model to try.
+        """
+        deadline = self._deadline(deadline)
+        retryable = retryable_errors()
+        attempt = 0
+        while True:
+            probe = self.breaker.before_call()
+            try:
+                time.sleep(self._admit(tokens, deadline))
+                try:
+                    result = func(self._remaining(deadline))
+                except retryable as e:
+                    delay = self._retry_delay(e, attempt, deadline, max_retries)
+                    if on_retry is not None:
+                        on_retry(e, delay)
+                except Exception:
+                    # The provider answered (e.g. a bad request), so it is not the provider that is failing
+                    self.breaker.record_success()
+                    raise
+                else:
+                    self._succeeded()
+                    return result
+            finally:
+                self.breaker.release(probe)
+            attempt += 1
+            time.sleep(delay)
+
+    async def acall(self, func, tokens=0, deadline=None, on_retry=None, max_retries=None):
+        """Async version of `call`; `func(timeout)` returns an awaitable, which is also cut off at the deadline"""
+        deadline = self._deadline(deadline)
+        retryable = retryable_errors()
+        attempt = 0
+        while True:
+            probe = self.breaker.before_call()
+            try:
+                await asyncio.sleep(self._admit(tokens, deadline))
+                try:
+                    timeout = self._remaining(deadline)
+                    result = await asyncio.wait_for(func(timeout), timeout)
+                except retryable as e:
+                    delay = self._retry_delay(e, attempt, deadline, max_retries)
+                    if on_retry is not None:
+                        on_retry(e, delay)
+                except Exception:
+                    self.breaker.record_success()
+                    raise
+                else:
+                    self._succeeded()
+                    return result
+            finally:
+                # Cancelled (e.g. a speculative act) or past its deadline: the probe must not keep the circuit shut
+                self.breaker.release(probe)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    def charge(self, estimated_tokens, actual_tokens):
+        """Correct the tokens/min bucket once the real size of a call is known"""
+        if self.tokens is not None:
+            self.tokens.adjust(estimated_tokens - actual_tokens)
+
+    def _deadline(self, deadline):
+        return time.monotonic() + (deadline if deadline is not None else self.deadline)
+
+    def _remaining(self, deadline):
+        return max(0.0, deadline - time.monotonic())
+
+    def _admit(self, tokens, deadline):
+        """Reserve capacity for one request and return how long to wait for it"""
+        wait = 0.0
+        if self.requests is not None:
+            wait = max(wait, self.requests.reserve(1))
+        if self.tokens is not None and tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        if time.monotonic() + wait > deadline:
+            # The request is not sent, so the capacity goes back to the calls queued behind it
+            if self.requests is not None:
+                self.requests.adjust(1)
+            if self.tokens is not None and tokens:
+                self.tokens.adjust(tokens)
+            raise DeadlineExceeded("Rate limits would delay the request past its deadline")
+        return wait
+
+    def _retry_delay(self, error, attempt, deadline, max_retries=None):
+        """Backoff before the next attempt, or re-raise when retrying is not allowed"""
+        # Timeouts, connection errors and 5xx count towards opening the circuit; a 429 does not
+        if getattr(error, "status_code", None) != 429:
+            self.breaker.record_failure()
+        requested = retry_after(error)
+        if attempt >= (self.max_retries if max_retries is None else max_retries):
+            raise error
+        # The provider said when to come back, so waiting that long does not add to its load
+        if requested is None and not self.budget.withdraw():
+            raise error
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        delay = max(delay, requested or 0.0)
+        if time.monotonic() + delay > deadline:
+            raise DeadlineExceeded(f"Gave up retrying before the deadline: {error!r}") from error
+        return delay
+
+    def _succeeded(self):
+        self.breaker.record_success()
+        self.budget.deposit()
+
+
+@lru_cache(maxsize=None)
+def shared_governor(**limits):
+    """One governor per set of limits per process, so concurrent stories share the provider quota"""
+    return Governor(**limits)
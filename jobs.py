@@ -0,0 +1,230 @@
+"""Background story jobs: a SQLite-backed queue and worker processes that drain it.
+
+The Streamlit app only submits jobs and polls their progress, so reruns and
+closed tabs no longer stop a story, and workers scale separately from the web
+front end. Start workers next to the app (they share the working directory):
+
+    python jobs.py --workers 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from pathlib import Path
+
+from checkpoint import checkpoint_path
+from run_context import RunContext
+from story_context import ContextBudget
+from story_pipeline import new_story_file, write_story
+
+JOBS_DB = Path("jobs") / "jobs.sqlite"
+# States a job goes through; "queued" and "running" jobs are active
+JOB_STATES = ("queued", "running", "done", "failed", "cancelled")
+
+
+class JobQueue:
+    """Story jobs in a SQLite table, shared by the app and any number of worker processes.
+
+    A worker that stops sending heartbeats for `stale_after` seconds is presumed
+    dead; its job goes back to the queue and resumes from the story's checkpoint.
+    """
+
+    def __init__(self, path=JOBS_DB, stale_after=300.0):
+        self.path = Path(path)
+        self.stale_after = stale_after
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit mode, so `claim` can take the write lock itself with BEGIN IMMEDIATE
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, prompt TEXT NOT NULL, options TEXT NOT NULL, status TEXT NOT NULL, "
+            "story_file TEXT, message TEXT, progress REAL NOT NULL DEFAULT 0, error TEXT, worker TEXT, "
+            "attempts INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, started_at REAL, "
+            "finished_at REAL, heartbeat_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def submit(self, prompt, **options):
+        """Queue a story; `options` are JSON-serializable `write_story` options. Returns the job id"""
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, prompt, options, status, message, created_at) VALUES (?, ?, ?, 'queued', 'Queued', ?)",
+                (job_id, prompt, json.dumps(options), time.time()),
+            )
+        return job_id
+
+    def claim(self, worker):
+        """Take the oldest queued job for `worker`, or return None if there is none"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, "
+                        "started_at = ?, heartbeat_at = ?, message = 'Started' WHERE id = ?",
+                        (worker, now, now, row["id"]),
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return None if row is None else self.get(row["id"])
+
+    def start(self, job_id, story_file):
+        """Record the story file a running job writes, so a requeued job can resume it"""
+        self._update(job_id, story_file=str(story_file), heartbeat_at=time.time())
+
+    def progress(self, job_id, message, fraction):
+        self._update(job_id, message=message, progress=fraction, heartbeat_at=time.time())
+
+    def heartbeat(self, job_id):
+        self._update(job_id, heartbeat_at=time.time())
+
+    def finish(self, job_id):
+        self._update(job_id, status="done", message="Story complete", progress=1.0, finished_at=time.time())
+
+    def fail(self, job_id, error):
+        self._update(job_id, status="failed", message="Failed", error=error, finished_at=time.time())
+
+    def cancel(self, job_id):
+        """Cancel a job that has not started yet; returns whether it was cancelled"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', message = 'Cancelled', finished_at = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+        return cursor.rowcount > 0
+
+    def requeue_stale(self):
+        """Put running jobs whose worker stopped sending heartbeats back in the queue"""
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL, message = 'Requeued after its worker stopped' "
+                "WHERE status = 'running' AND heartbeat_at < ?",
+                (time.time() - self.stale_after,),
+            )
+        return cursor.rowcount
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return None if row is None else self._job(row)
+
+    def jobs(self, limit=20):
+        """Most recently submitted jobs first"""
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._job(row) for row in rows]
+
+    def active_story_files(self):
+        """Story files that a queued or running job is (or will be) writing"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT story_file FROM jobs WHERE status IN ('queued', 'running') AND story_file IS NOT NULL"
+            ).fetchall()
+        return {Path(row["story_file"]) for row in rows}
+
+    def _update(self, job_id, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    @staticmethod
+    def _job(row):
+        job = dict(row)
+        job["options"] = json.loads(job["options"])
+        return job
+
+
+def story_options(options):
+    """`write_story` keyword arguments from the JSON options of a job"""
+    options = dict(options)
+    if options.get("context_budget") is not None:
+        options["context_budget"] = ContextBudget(**options["context_budget"])
+    return options
+
+
+def run_job(queue, job, heartbeat_interval=30.0):
+    """Run one claimed job to completion, reporting progress to the queue"""
+    story_file = Path(job["story_file"]) if job["story_file"] else new_story_file(job["prompt"])
+    resume_from = checkpoint_path(story_file) if job["story_file"] and checkpoint_path(story_file).exists() else None
+    queue.start(job["id"], story_file)
+
+    # Acts can take minutes, so liveness is signalled separately from progress
+    stopped = threading.Event()
+
+    def beat():
+        while not stopped.wait(heartbeat_interval):
+            queue.heartbeat(job["id"])
+
+    threading.Thread(target=beat, name=f"heartbeat-{job['id']}", daemon=True).start()
+    try:
+        write_story(
+            job["prompt"],
+            story_file=story_file,
+            resume_from=resume_from,
+            on_progress=lambda message, fraction: queue.progress(job["id"], message, fraction),
+            context=RunContext(f"job-{job['id']}"),
+            **story_options(job["options"]),
+        )
+    except Exception:
+        queue.fail(job["id"], traceback.format_exc())
+    else:
+        queue.finish(job["id"])
+    finally:
+        stopped.set()
+
+
+def run_worker(path=JOBS_DB, poll_interval=1.0, stop=None, once=False):
+    """Claim and run jobs until `stop` is set; with `once`, return as soon as the queue is empty"""
+    queue = JobQueue(path)
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    while stop is None or not stop.is_set():
+        queue.requeue_stale()
+        job = queue.claim(worker)
+        if job is None:
+            if once:
+                return
+            time.sleep(poll_interval)
+            continue
+        run_job(queue, job)
+
+
+def start_workers(count, path=JOBS_DB, poll_interval=1.0):
+    """Start `count` worker processes and return them"""
+    context = multiprocessing.get_context("spawn")
+    workers = []
+    for index in range(count):
+        process = context.Process(target=run_worker, args=(str(path), poll_interval), name=f"story-worker-{index + 1}", daemon=True)
+        process.start()
+        workers.append(process)
+    return workers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=1, help="worker processes to start")
+    parser.add_argument("--db", default=str(JOBS_DB), help="job queue database")
+    parser.add_argument("--poll", type=float, default=1.0, help="seconds between polls of an empty queue")
+    parser.add_argument("--once", action="store_true", help="exit once the queue is empty (single worker)")
+    args = parser.parse_args()
+    if args.once or args.workers == 1:
+        run_worker(args.db, args.poll, once=args.once)
+    else:
+        for process in start_workers(args.workers, args.db, args.poll):
+            process.join()
@@ -0,0 +1,180 @@
+import json
+import re
+
+FENCE_RE = re.compile(r"```(?:json|JSON)?\s*\n?(.*?)```", re.DOTALL)
+TRAILING_COMMA_RE = re.compile(r",(\s*[}\]])")
+LINE_COMMENT_RE = re.compile(r"^\s*//.*$", re.MULTILINE)
+ACT_KEY_RE = re.compile(r"act[\s_\-]*(\d+)", re.IGNORECASE)
+
+# Spellings models use for the act fields, mapped to the keys the pipeline reads
+ACT_FIELD_ALIASES = {
+    "description": "description",
+    "desc": "description",
+    "summary": "description",
+    "writingadvice": "writingAdvice",
+    "writing_advice": "writingAdvice",
+    "writing-advice": "writingAdvice",
+    "writing advice": "writingAdvice",
+    "advice": "writingAdvice",
+}
+ACT_FIELDS = ("description", "writingAdvice")
+
+
+class JsonRepairError(ValueError):
+    """No usable JSON object could be recovered from a completion"""
+
+
+def _balanced_object(text, start):
+    """The {...} block starting at `start`, matched while respecting strings"""
+    depth = 0
+    in_string = False
+    escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:index + 1]
+    # Unterminated: close what is open so a cut-off completion can still be read
+    return text[start:] + ("\"" if in_string else "") + "}" * depth
+
+
+def _candidates(text):
+    for fenced in FENCE_RE.findall(text):
+        yield fenced
+    yield text
+    start = text.find("{")
+    while start != -1:
+        yield _balanced_object(text, start)
+        start = text.find("{", start + 1)
+
+
+def extract_json(text):
+    """Parse the first JSON object in a completion, tolerating code fences, prose around it,
+    `//` comments, trailing commas and a missing closing brace"""
+    for candidate in _candidates(text):
+        candidate = candidate.strip()
+        if not candidate.startswith("{"):
+            continue
+        for attempt in (candidate, TRAILING_COMMA_RE.sub(r"\1", LINE_COMMENT_RE.sub("", candidate))):
+            try:
+                data = json.loads(attempt, strict=False)
+            except ValueError:
+                continue
+            if isinstance(data, dict):
+                return data
+    raise JsonRepairError(f"No JSON object found in completion: {text[:200]!r}")
+
+
+def normalize_acts(data):
+    """Acts keyed "act-1", "act-2", ... with "description" and "writingAdvice" fields.
+
+    Returns (acts, missing) where `missing` lists the (act key, field) pairs that
+    are absent or empty and have to be asked for again.
+    """
+    if isinstance(data.get("acts"), (dict, list)):
+        data = data["acts"]
+    if isinstance(data, list):
+        data = {f"act-{index + 1}": act for index, act in enumerate(data)}
+    acts = {}
+    for key, value in data.items():
+        match = ACT_KEY_RE.search(str(key))
+        if not match:
+            continue
+        fields = {}
+        if isinstance(value, dict):
+            for field, text in value.items():
+                name = ACT_FIELD_ALIASES.get(str(field).strip().lower())
+                if name and text:
+                    fields[name] = str(text).strip()
+        elif isinstance(value, str):
+            fields["description"] = value.strip()
+        acts[f"act-{int(match.group(1))}"] = fields
+    if not acts:
+        raise JsonRepairError("No acts found in JSON object")
+    acts = dict(sorted(acts.items(), key=lambda item: int(item[0].split("-")[1])))
+    missing = [(key, field) for key, fields in acts.items() for field in ACT_FIELDS if not fields.get(field)]
+    return acts, missing
+
+
+def complete_acts(acts, patch=None):
+    """Fill missing act fields from `patch` (a re-asked JSON object with just those fields).
+
+    Missing writing advice becomes None; a missing description is an error.
+    """
+    if patch:
+        try:
+            patched, _ = normalize_acts(patch)
+        except JsonRepairError:
+            patched = {}
+        for key, fields in patched.items():
+            if key in acts:
+                for field, text in fields.items():
+                    if not acts[key].get(field):
+                        acts[key][field] = text
+    for key, fields in acts.items():
+        if not fields.get("description"):
+            raise JsonRepairError(f"{key} has no description")
+        fields.setdefault("writingAdvice", None)
+    return acts
+
+
+def missing_fields_template(missing):
+    """JSON skeleton of the fields to ask for again"""
+    template = {}
+    for key, field in missing:
+        template.setdefault(key, {})[field] = "..."
+    return json.dumps(template, indent=2)
+
+
+def parse_acts(text):
+    """Acts from a completion, with keys and field names normalized"""
+    acts, _ = normalize_acts(extract_json(text))
+    return complete_acts(acts)
+
+
+def normalize_chapters(data):
+    """{"chapters": {title: description}} from the shapes models return for the chapter list"""
+    chapters = data.get("chapters", data)
+    if isinstance(chapters, list):
+        pairs = {}
+        for item in chapters:
+            if isinstance(item, dict):
+                title = item.get("title") or item.get("name")
+                description = item.get("description") or item.get("summary") or ""
+                if title:
+                    pairs[str(title)] = str(description)
+        chapters = pairs
+    if not isinstance(chapters, dict) or not chapters:
+        raise JsonRepairError("No chapters found in JSON object")
+    return {"chapters": {str(title): str(description) for title, description in chapters.items()}}
+
+
+def parse_chapters(text):
+    return normalize_chapters(extract_json(text))
+
+
+def split_blueprint(text):
+    """Separate a blueprint from the ```json chapter block asked for at its end.
+
+    Returns (blueprint, chapters) where chapters is None if no usable block was found.
+    """
+    for match in reversed(list(FENCE_RE.finditer(text))):
+        try:
+            chapters = parse_chapters(match.group(1))
+        except JsonRepairError:
+            continue
+        blueprint = (text[:match.start()] + text[match.end():]).strip()
+        return blueprint, chapters
+    return text, None
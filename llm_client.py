@@ -0,0 +1,36 @@
+import asyncio
+import threading
+from functools import lru_cache
+
+import httpx
+
+# Connection pool shared by every model call in the process
+POOL_LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+REQUEST_TIMEOUT = httpx.Timeout(600.0, connect=10.0)
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def shared_event_loop():
+    """Return the process-wide event loop that all async model calls run on"""
+    global _loop
+    with _loop_lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="llm-event-loop", daemon=True)
+            thread.start()
+            _loop = loop
+        return _loop
+
+
+@lru_cache(maxsize=None)
+def http_client():
+    """Pooled synchronous HTTP client shared by all models"""
+    return httpx.Client(limits=POOL_LIMITS, timeout=REQUEST_TIMEOUT)
+
+
+@lru_cache(maxsize=None)
+def http_async_client():
+    """Pooled async HTTP client shared by all models; only used from the shared event loop"""
+    return httpx.AsyncClient(limits=POOL_LIMITS, timeout=REQUEST_TIMEOUT)
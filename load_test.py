@@ -0,0 +1,163 @@
+"""Load test: many concurrent Streamlit sessions writing stories in one process, against the offline mock model.
+
+Every simulated session runs the real `story_generator.py` script through
+Streamlit's `AppTest` (so each has its own `st.session_state`) and writes one
+story with its own prompt. The test checks that the sessions stay isolated
+(every story file holds only its own session's acts, every session's log only
+its own story) and that throughput scales: N sessions at once must write
+stories at least `--min-scaling` × N times as fast as a single session.
+
+    python load_test.py --sessions 8
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import story_pipeline
+from checkpoint import checkpoint_path, read_results
+from governor import Governor
+from mock_model import MockChatModel
+
+APP = Path(__file__).resolve().with_name("story_generator.py")
+_compile_lock = threading.Lock()
+
+
+def serialize_compiles():
+    """Make simulated sessions compile the script one at a time.
+
+    A Streamlit server compiles the script once for all sessions, but every
+    `AppTest` run compiles it again, and CPython 3.11 can fail parsing in
+    several threads at once.
+    """
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+
+    get_bytecode = ScriptCache.get_bytecode
+    if getattr(get_bytecode, "serialized", False):
+        return
+
+    def serialized(self, script_path):
+        with _compile_lock:
+            return get_bytecode(self, script_path)
+
+    serialized.serialized = True
+    ScriptCache.get_bytecode = serialized
+
+
+def run_session(prompt, timeout):
+    """Write one story in a fresh simulated session; returns its `AppTest`"""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(str(APP), default_timeout=timeout).run()
+    app.text_input[0].input(prompt)
+    # Every call should reach the (mock) model
+    next(checkbox for checkbox in app.checkbox if checkbox.label == "Use response cache").uncheck()
+    next(button for button in app.button if button.label == "Generate Story").click()
+    return app.run()
+
+
+def run_sessions(prompts, timeout):
+    """Run one session per prompt, all at once; returns (apps by prompt, errors by prompt, seconds)"""
+    apps, errors = {}, {}
+
+    def session(prompt):
+        try:
+            apps[prompt] = run_session(prompt, timeout)
+        except Exception as e:
+            errors[prompt] = repr(e)
+
+    threads = [threading.Thread(target=session, args=(prompt,), name=f"session-{index}") for index, prompt in enumerate(prompts)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return apps, errors, time.monotonic() - started
+
+
+def isolation_problems(apps, errors):
+    """Everything that shows sessions leaking into each other (or failing); empty if they are isolated"""
+    problems = [f"{prompt!r}: {error}" for prompt, error in errors.items()]
+    contexts = {}
+    for prompt, app in apps.items():
+        if app.exception:
+            problems.append(f"{prompt!r}: {app.exception[0].message}")
+            continue
+        context = app.session_state["run_context"]
+        if len(context.stories) != 1:
+            problems.append(f"{prompt!r}: wrote {len(context.stories)} stories instead of 1")
+            continue
+        contexts[prompt] = context
+    if len({context.run_id for context in contexts.values()}) != len(contexts):
+        problems.append("sessions share a context")
+    texts = {prompt: context.story_file.read_text() for prompt, context in contexts.items()}
+    for prompt, context in contexts.items():
+        if not texts[prompt].startswith(f"# Story based on prompt: {prompt}\n"):
+            problems.append(f"{prompt!r}: {context.story_file.name} does not start with its prompt")
+        acts = [value for key, value in read_results(checkpoint_path(context.story_file)) if key.startswith("act/")]
+        if not acts:
+            problems.append(f"{prompt!r}: no acts in its checkpoint")
+        for act in acts:
+            holders = [other for other, text in texts.items() if act in text]
+            if holders != [prompt]:
+                problems.append(f"{prompt!r}: an act of its story is in the story files of {holders}")
+        for record in context.run_log.page(1, context.run_log.total):
+            strangers = [other for other in contexts if other != prompt and other in record.text]
+            if strangers:
+                problems.append(f"{prompt!r}: its log mentions the prompts of {strangers}")
+                break
+    # In the shared log file, each session's lines carry its id
+    log_path = next(iter(contexts.values())).run_log.path
+    lines = log_path.read_text(encoding="utf-8").splitlines() if log_path is not None and log_path.exists() else []
+    for prompt, context in contexts.items():
+        own = [line for line in lines if f"[{context.run_id}]" in line]
+        if not own:
+            problems.append(f"{prompt!r}: no lines tagged {context.run_id} in {log_path}")
+        if any(other in line for line in own for other in contexts if other != prompt):
+            problems.append(f"{prompt!r}: lines tagged {context.run_id} mention other sessions' prompts")
+    return problems
+
+
+def load_test(model, sessions, timeout=600.0):
+    """One session alone, then `sessions` at once; returns (single seconds, concurrent seconds, problems)"""
+    previous_model, previous_governor = story_pipeline.model, story_pipeline.governor
+    story_pipeline.model = model
+    # Only the app is measured, so the provider's rate limits are lifted
+    story_pipeline.governor = Governor(requests_per_minute=None, tokens_per_minute=None)
+    serialize_compiles()
+    try:
+        single_apps, single_errors, single_seconds = run_sessions(["load test warm-up session"], timeout)
+        apps, errors, seconds = run_sessions([f"load test session {index}" for index in range(sessions)], timeout)
+    finally:
+        story_pipeline.model, story_pipeline.governor = previous_model, previous_governor
+    return single_seconds, seconds, isolation_problems(single_apps, single_errors) + isolation_problems(apps, errors)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=8, help="sessions writing at the same time")
+    parser.add_argument("--chapters", type=int, default=2, help="chapters per story")
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token of every call")
+    parser.add_argument("--token-delay", type=float, default=0.001, help="seconds per generated word")
+    parser.add_argument("--words", type=int, default=300, help="words of every prose completion")
+    parser.add_argument("--min-scaling", type=float, default=0.5, help="share of linear throughput scaling that passes")
+    parser.add_argument("--timeout", type=float, default=600.0, help="seconds a session may take")
+    args = parser.parse_args()
+    model = MockChatModel(latency=args.latency, token_delay=args.token_delay, words=args.words, chapters=args.chapters)
+    # The app keeps its stories, jobs, logs and caches under the working directory
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        single, concurrent, problems = load_test(model, args.sessions, args.timeout)
+        os.chdir(APP.parent)
+    speedup = args.sessions * single / concurrent
+    print(f"1 session: {single:.2f}s, {3600 / single:.0f} stories/hour")
+    print(f"{args.sessions} sessions: {concurrent:.2f}s, {args.sessions * 3600 / concurrent:.0f} stories/hour "
+          f"({speedup:.1f}x, {speedup / args.sessions:.0%} of linear)")
+    for problem in problems:
+        print(f"isolation: {problem}")
+    failed = bool(problems) or speedup < args.min_scaling * args.sessions
+    print("FAILED" if failed else "passed")
+    sys.exit(1 if failed else 0)
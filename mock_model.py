@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+LOREM = (
+    "The lighthouse keeper climbed the spiral stairs as the storm rolled in from the sea, "
+    "counting each step the way her father had taught her, while below the harbour bells "
+    "rang out a warning nobody in the village seemed willing to hear."
+).split()
+
+# Phrases that identify the prompt of each pipeline stage, most specific first
+STAGE_MARKERS = [
+    ("chapters", "now generate the chapters json"),
+    ("blueprint_draft", "end your answer with the list of chapters as a json code block"),
+    ("acts_json", "converting detailed written acts into a structured JSON"),
+    ("acts_json", "give the three acts as a json object only"),
+    ("acts_json", "some fields are missing from them"),
+    ("bridge", "write the bridging passage"),
+    ("structure_summary", "summarize structure analysis"),
+    ("structure", "use the handbook below for choosing story structure"),
+    ("acts", "now generate three acts for chapter"),
+    ("blueprint", "now write out the blueprint"),
+]
+
+
+def prompt_stage(prompt):
+    """Pipeline stage a prompt belongs to; anything unrecognised is taken for an act"""
+    for stage, marker in STAGE_MARKERS:
+        if marker in prompt:
+            return stage
+    return "act"
+
+
+class MockChatModel(BaseChatModel):
+    """Offline, deterministic stand-in for `ChatOpenAI` that answers every pipeline prompt.
+
+    Chapter and act JSON prompts (and the structured-output variants of the
+    blueprint and act outline prompts) get well-formed JSON back, everything
+    else gets about `words` words of filler prose (`stage_words` sets the length
+    per stage), so the whole story pipeline can run (and be timed) without
+    network access. `recordings` maps stages to real completions to replay
+    instead. The first token arrives after `latency` seconds and every
+    following word after `token_delay` seconds; without streaming the whole
+    answer arrives at once. `latency_spread` and `words_spread` draw latencies
+    (log-normal) and lengths (normal, relative) around those values. Answers
+    and timings only depend on the prompt and `seed`, never on call order. A
+    call's `max_tokens` cuts the answer off after that many words.
+    """
+
+    model_name: str = "mock"
+    latency: float = 0.0
+    latency_spread: float = 0.0
+    token_delay: float = 0.0
+    words: int = 200
+    words_spread: float = 0.0
+    stage_words: dict = {"bridge": 60}
+    chapters: int = 3
+    recordings: dict = {}
+    seed: int = 0
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "mock-chat"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        result = self._result(messages, kwargs.get("max_tokens"))
+        time.sleep(self._duration(messages, result))
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        result = self._result(messages, kwargs.get("max_tokens"))
+        await asyncio.sleep(self._duration(messages, result))
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        prompt = self.content_text(messages[-1].content)
+        time.sleep(self._first_token_delay(prompt))
+        for index, token in enumerate(self.tokens(self.respond(prompt))[:kwargs.get("max_tokens")]):
+            if index:
+                time.sleep(self.token_delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        self.calls += 1
+        prompt = self.content_text(messages[-1].content)
+        await asyncio.sleep(self._first_token_delay(prompt))
+        for index, token in enumerate(self.tokens(self.respond(prompt))[:kwargs.get("max_tokens")]):
+            if index:
+                await asyncio.sleep(self.token_delay)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    def _result(self, messages, max_tokens=None):
+        text = self.respond(self.content_text(messages[-1].content))
+        if max_tokens:
+            # Word-sized tokens, cut off like a provider does at `max_tokens`
+            text = "".join(self.tokens(text)[:max_tokens])
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _duration(self, messages, result):
+        """Seconds a provider would take to produce the whole completion"""
+        tokens = len(self.tokens(result.generations[0].text))
+        return self._first_token_delay(self.content_text(messages[-1].content)) + self.token_delay * max(0, tokens - 1)
+
+    def _first_token_delay(self, prompt):
+        if not self.latency_spread:
+            return self.latency
+        return self.latency * self._random(prompt, "latency").lognormvariate(0.0, self.latency_spread)
+
+    def _random(self, prompt, purpose):
+        """Random numbers that only depend on the prompt, the purpose and `seed`"""
+        digest = hashlib.sha256(f"{self.seed}\x00{purpose}\x00{prompt}".encode("utf-8")).digest()
+        return random.Random(digest)
+
+    def _length(self, stage, rng):
+        words = self.stage_words.get(stage, self.words)
+        if self.words_spread:
+            words = round(rng.gauss(words, words * self.words_spread))
+        return max(1, words)
+
+    def respond(self, prompt):
+        """Build the canned (or replayed) completion for a prompt"""
+        stage = prompt_stage(prompt)
+        rng = self._random(prompt, "text")
+        if self.recordings.get(stage):
+            return rng.choice(self.recordings[stage])
+        if stage == "chapters":
+            chapters = {f"Chapter Title {i + 1}": self.prose(40) for i in range(self.chapters)}
+            return json.dumps({"chapters": chapters})
+        if stage == "blueprint_draft":
+            chapters = {f"Chapter Title {i + 1}": self.prose(40) for i in range(self.chapters)}
+            return f"{self.prose(self._length('blueprint', rng), seed=prompt)}\n\n```json\n{json.dumps({'chapters': chapters})}\n```"
+        if stage == "acts_json":
+            acts = {f"act-{i + 1}": {"description": self.prose(60), "writingAdvice": self.prose(20)} for i in range(3)}
+            return json.dumps(acts)
+        return self.prose(self._length(stage, rng), seed=prompt)
+
+    @staticmethod
+    def content_text(content):
+        """Text of a message's content, which may be a list of content blocks"""
+        if isinstance(content, list):
+            return "".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in content)
+        return content or ""
+
+    @staticmethod
+    def tokens(text):
+        """Split text into word-sized chunks that join back to exactly `text`"""
+        return re.findall(r"\S+\s*|\s+", text)
+
+    @staticmethod
+    def prose(words, seed=None):
+        """Filler text; with a `seed` the words are shuffled, so different prompts get different text"""
+        if seed is None:
+            return " ".join(LOREM[i % len(LOREM)] for i in range(words))
+        rng = random.Random(seed)
+        return " ".join(rng.choice(LOREM) for _ in range(words))
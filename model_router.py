@@ -0,0 +1,217 @@
+"""Model registry and router: which backend, model and settings serve each pipeline stage.
+
+A route is a fallback chain of groups; the models in one group are
+interchangeable and the one with the lowest observed latency goes first.
+Routes come from a JSON file such as
+
+    {
+      "backends": {
+        "openrouter": {"base_url": "https://openrouter.ai/api/v1", "requests_per_minute": 60},
+        "local": {"base_url": "http://127.0.0.1:8765/v1", "api_key": "local"}
+      },
+      "stages": {
+        "act": [[{"backend": "openrouter", "model": "meta-llama/llama-3.1-70b-instruct", "max_tokens": 4096},
+                 {"backend": "openrouter", "model": "mistralai/mixtral-8x22b-instruct", "max_tokens": 4096}],
+                {"backend": "local", "model": "stand-in"}],
+        "acts_json": [{"model": "meta-llama/llama-3.1-8b-instruct:free", "temperature": 0, "timeout": 60}]
+      }
+    }
+
+A model without a "backend" runs on the default client, and a stage without a
+route uses the default settings for that stage. `offline_config` routes every
+stage to a local OpenAI-compatible server such as `fake_endpoint.py`.
+"""
+import json
+import os
+import threading
+from functools import lru_cache
+
+from governor import CircuitOpenError, DeadlineExceeded, Governor, retryable_errors
+from llm_client import http_async_client, http_client
+# Weight of the newest call in a model's latency average
+LATENCY_SMOOTHING = 0.3
+# Latency charged for a failed call, so a failing model drops behind its equals
+FAILURE_SECONDS = 60.0
+
+
+@lru_cache(maxsize=None)
+def fallback_errors():
+    """Errors after which the next model in the chain is tried"""
+    return retryable_errors() + (CircuitOpenError, DeadlineExceeded)
+
+
+class ModelSpec:
+    """One way to serve a stage: backend, model and the sampling settings sent with each call"""
+
+    __slots__ = ("backend", "model", "temperature", "max_tokens", "timeout")
+
+    def __init__(self, backend=None, model=None, temperature=None, max_tokens=None, timeout=None):
+        self.backend = backend
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.timeout = timeout
+
+    @classmethod
+    def from_dict(cls, data, defaults=None):
+        """Spec from a config entry; settings it leaves out come from `defaults`"""
+        spec = cls(**{field: getattr(defaults, field) for field in cls.__slots__ if field != "backend"}) if defaults else cls()
+        for field in cls.__slots__:
+            if field in data:
+                setattr(spec, field, data[field])
+        return spec
+
+    def call_kwargs(self):
+        """Settings passed with each call, overriding the client's own"""
+        kwargs = {}
+        if self.temperature is not None:
+            kwargs["temperature"] = self.temperature
+        if self.max_tokens is not None:
+            kwargs["max_tokens"] = self.max_tokens
+        return kwargs
+
+    @property
+    def label(self):
+        return f"{self.backend or 'default'}:{self.model or 'default'}"
+
+    def __repr__(self):
+        return f"ModelSpec({self.label}, temperature={self.temperature}, max_tokens={self.max_tokens})"
+
+
+class Backend:
+    """An OpenAI-compatible endpoint with its own rate limits"""
+
+    def __init__(self, name, base_url, api_key=None, api_key_env="OPENAI_API_KEY", requests_per_minute=60,
+                 tokens_per_minute=200_000, default_model=None, temperature=None):
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.api_key_env = api_key_env
+        self.default_model = default_model
+        # Sampling temperature of the clients, where a call's spec does not set its own
+        self.temperature = temperature
+        self.governor = Governor(requests_per_minute=requests_per_minute, tokens_per_minute=tokens_per_minute)
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def client(self, model_name, timeout=None):
+        """Chat client for a model on this backend (created once, sharing the process connection pool)"""
+        model_name = model_name or self.default_model
+        with self._lock:
+            key = (model_name, timeout)
+            if key not in self._clients:
+                from langchain_openai import ChatOpenAI
+                settings = {} if self.temperature is None else {"temperature": self.temperature}
+                self._clients[key] = ChatOpenAI(
+                    base_url=self.base_url, model=model_name, max_retries=0, timeout=timeout,
+                    api_key=self.api_key or os.environ.get(self.api_key_env, ""),
+                    http_client=http_client(), http_async_client=http_async_client(), **settings,
+                )
+            return self._clients[key]
+
+
+class ModelRouter:
+    """Picks the models for each stage and learns their latencies.
+
+    `default_model(name)` returns the default client (for `name`, or the default
+    model if None) and `default_governor()` its governor; both are looked up
+    per call, so the default client can be replaced at runtime.
+    """
+
+    def __init__(self, default_model, default_governor, stage_defaults=None, backends=None, routes=None):
+        self.default_model = default_model
+        self.default_governor = default_governor
+        self.stage_defaults = stage_defaults or {}
+        self.backends = backends or {}
+        self.routes = routes or {}
+        self._latency = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, default_model, default_governor, stage_defaults=None):
+        backends = {name: Backend(name, **options) for name, options in config.get("backends", {}).items()}
+        stage_defaults = stage_defaults or {}
+        routes = {}
+        for stage, chain in config.get("stages", {}).items():
+            defaults = stage_defaults.get(stage)
+            routes[stage] = [
+                [ModelSpec.from_dict(entry, defaults) for entry in (group if isinstance(group, list) else [group])]
+                for group in chain
+            ]
+        for stage, groups in routes.items():
+            for group in groups:
+                for spec in group:
+                    if spec.backend is not None and spec.backend not in backends:
+                        raise ValueError(f"Stage {stage!r} uses unknown backend {spec.backend!r}")
+        return cls(default_model, default_governor, stage_defaults, backends, routes)
+
+    @classmethod
+    def from_file(cls, path, default_model, default_governor, stage_defaults=None):
+        with open(path, "r") as f:
+            return cls.from_config(json.load(f), default_model, default_governor, stage_defaults)
+
+    def candidates(self, stage, model_name=None):
+        """Specs to try for a stage, in order.
+
+        With `model_name` (a run that asked for a model) only that model on the
+        default client is used. Within a group the fastest model so far goes
+        first, and models whose circuit is open go to the back of the chain.
+        """
+        defaults = self.stage_defaults.get(stage) or ModelSpec()
+        if model_name is not None:
+            return [ModelSpec(None, model_name, defaults.temperature, defaults.max_tokens, defaults.timeout)]
+        groups = self.routes.get(stage) or [[defaults]]
+        ordered = []
+        for group in groups:
+            ordered.extend(sorted(group, key=self.latency))
+        available = [spec for spec in ordered if self.governor(spec).breaker.state != "open"]
+        return available + [spec for spec in ordered if spec not in available]
+
+    def model(self, spec):
+        if spec.backend is None:
+            return self.default_model(spec.model)
+        return self.backends[spec.backend].client(spec.model, spec.timeout)
+
+    def governor(self, spec):
+        if spec.backend is None:
+            return self.default_governor()
+        return self.backends[spec.backend].governor
+
+    def latency(self, spec):
+        """Smoothed seconds per call; models not tried yet count as fastest so they get measured"""
+        with self._lock:
+            return self._latency.get(spec.label, 0.0)
+
+    def record(self, spec, seconds, ok=True):
+        """Add the duration of a call; a failed call counts as at least `FAILURE_SECONDS`"""
+        if not ok:
+            seconds = max(seconds, FAILURE_SECONDS)
+        with self._lock:
+            previous = self._latency.get(spec.label)
+            self._latency[spec.label] = seconds if previous is None else previous + LATENCY_SMOOTHING * (seconds - previous)
+
+
+def offline_config(base_url="http://127.0.0.1:8765/v1"):
+    """Config that sends every stage to a local OpenAI-compatible server (e.g. `python fake_endpoint.py`)"""
+    return {
+        "backends": {"local": {"base_url": base_url, "api_key": "local", "default_model": "stand-in",
+                               "requests_per_minute": None, "tokens_per_minute": None}},
+        "stages": {stage: [{"backend": "local"}] for stage in (
+            "structure", "structure_summary", "blueprint", "blueprint_draft", "chapters", "acts", "acts_json", "act", "draft", "bridge",
+        )},
+    }
+
+
+@lru_cache(maxsize=None)
+def config_path():
+    """Routing config named by $STORY_MODELS, or models.json if it exists"""
+    path = os.environ.get("STORY_MODELS", "models.json")
+    return path if os.path.exists(path) else None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print a routing config that sends every stage to a local OpenAI-compatible server")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8765/v1")
+    print(json.dumps(offline_config(parser.parse_args().base_url), indent=2))
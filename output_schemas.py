@@ -0,0 +1,23 @@
+"""Pydantic schemas whose format instructions the chapter and act JSON prompts carry.
+
+Kept apart from the pipeline so pydantic and langchain are only imported when
+a prompt that needs them is first built.
+"""
+from langchain_core.pydantic_v1 import BaseModel, Field
+
+
+class Chapter(BaseModel):
+    title: str = Field(description="Title of the chapter")
+    description: str = Field(description="Description of the chapter")
+
+class Chapters(BaseModel):
+    chapters: dict[str, str] = Field(description="Dictionary of chapter titles and descriptions")
+
+class Act(BaseModel):
+    description: str = Field(description="Description of the act")
+    writing_advice: str = Field(description="Writing advice for the act")
+
+class Acts(BaseModel):
+    act_1: Act = Field(description="First act of the chapter")
+    act_2: Act = Field(description="Second act of the chapter")
+    act_3: Act = Field(description="Third act of the chapter")
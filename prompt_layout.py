@@ -0,0 +1,92 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class PromptParts:
+    """A prompt split into a stable `prefix` (instructions, handbook, blueprint) and a variable `suffix`.
+
+    Calls that share a prefix send it byte-for-byte identical at the start of
+    the message, which is what provider prefix (KV) caches can reuse.
+    """
+
+    __slots__ = ("prefix", "suffix")
+
+    def __init__(self, prefix, suffix=""):
+        self.prefix = prefix
+        self.suffix = suffix
+
+    @property
+    def text(self):
+        return self.prefix + self.suffix
+
+    def format(self, **values):
+        """Fill in both parts; each part ignores the values it does not use"""
+        return PromptParts(self.prefix.format(**values), self.suffix.format(**values))
+
+    def extend(self, suffix):
+        """The same prompt with more variable text at the end"""
+        return PromptParts(self.prefix, self.suffix + suffix)
+
+    def __repr__(self):
+        return f"PromptParts(prefix={len(self.prefix)} chars, suffix={len(self.suffix)} chars)"
+
+
+def prompt_text(prompt):
+    """Full text of a prompt given as a string or as `PromptParts`"""
+    return prompt.text if isinstance(prompt, PromptParts) else prompt
+
+
+def prompt_prefix(prompt):
+    return prompt.prefix if isinstance(prompt, PromptParts) else ""
+
+
+def prompt_messages(prompt, mark_cacheable=True):
+    """Chat messages for a prompt: one user message whose prefix is a separate content block.
+
+    With `mark_cacheable`, the prefix block carries an ephemeral `cache_control`
+    marker, which providers with explicit prompt caching need; providers that
+    cache prefixes automatically only need the prefix to come first.
+    """
+    if not isinstance(prompt, PromptParts) or not prompt.prefix:
+        return [{"role": "user", "content": prompt_text(prompt)}]
+    prefix_block = {"type": "text", "text": prompt.prefix}
+    if mark_cacheable:
+        prefix_block["cache_control"] = {"type": "ephemeral"}
+    content = [prefix_block]
+    if prompt.suffix:
+        content.append({"type": "text", "text": prompt.suffix})
+    return [{"role": "user", "content": content}]
+
+
+def cached_prompt_tokens(response):
+    """Prompt tokens the provider reports it served from its cache, or 0"""
+    usage = getattr(response, "usage_metadata", None) or {}
+    details = usage.get("input_token_details") or {}
+    if details.get("cache_read"):
+        return details["cache_read"]
+    token_usage = (getattr(response, "response_metadata", None) or {}).get("token_usage") or {}
+    return (token_usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+
+
+class PrefixTracker:
+    """Remembers recently sent prefixes, to estimate how much of a prompt a prefix cache could reuse"""
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def seen(self, prefix):
+        """Whether `prefix` was sent before (and remember it now)"""
+        if not prefix:
+            return False
+        digest = hashlib.sha256(prefix.encode("utf-8")).digest()
+        with self._lock:
+            if digest in self._seen:
+                self._seen.move_to_end(digest)
+                return True
+            self._seen[digest] = True
+            if len(self._seen) > self.capacity:
+                self._seen.popitem(last=False)
+            return False
@@ -0,0 +1,79 @@
+"""Per-run state: one `RunContext` per Streamlit session or background job, instead of module globals."""
+import threading
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from run_log import RunLog
+
+# Key of a session's context in `st.session_state`
+SESSION_KEY = "run_context"
+
+# Story files some context in this process is writing right now
+_writing = set()
+_writing_lock = threading.Lock()
+
+
+class RunContext:
+    """What one session or job owns while it writes stories: its id, its log, and the story it is on.
+
+    The Streamlit script keeps one in `st.session_state` (see `session_context`)
+    and `jobs.py` builds one per job id, then hands it to `generate_story` or
+    `write_story`. Each story gets its own `StoryWriter`, checkpoint and
+    `StoryRun`, referenced from here while it is being written, so any number of
+    sessions can write at once in one process without their logs or files
+    mixing. What is deliberately shared is process-wide: the model clients,
+    their governors and the response cache.
+    """
+
+    def __init__(self, run_id=None, run_log=None):
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.run_log = run_log if run_log is not None else RunLog(tag=self.run_id)
+        # Called with every new log record, e.g. to show it in the session's sidebar
+        self.on_record = None
+        self.story_file = None
+        self.writer = None
+        self.run = None
+        self.stories = []
+
+    def log(self, text):
+        record = self.run_log.add(text)
+        if self.on_record is not None:
+            self.on_record(record)
+        return record
+
+    @contextmanager
+    def writing(self, story_file, writer, run):
+        """Point the context at the story it writes in the block.
+
+        While the block runs the story counts as being written, so other
+        sessions do not offer it for resuming. Afterwards only `story_file`
+        stays, so a finished run and its writer are not kept alive by the session.
+        """
+        story_file = Path(story_file)
+        self.story_file = story_file
+        self.writer = writer
+        self.run = run
+        self.stories.append(story_file)
+        with _writing_lock:
+            _writing.add(story_file.resolve())
+        try:
+            yield self
+        finally:
+            self.writer = None
+            self.run = None
+            with _writing_lock:
+                _writing.discard(story_file.resolve())
+
+
+def session_context(session_state):
+    """Context of a Streamlit session, created on the session's first script run"""
+    if SESSION_KEY not in session_state:
+        session_state[SESSION_KEY] = RunContext(f"session-{uuid.uuid4().hex[:8]}")
+    return session_state[SESSION_KEY]
+
+
+def writing_story_files():
+    """Story files that sessions or jobs in this process are writing right now"""
+    with _writing_lock:
+        return set(_writing)
@@ -0,0 +1,89 @@
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+LOG_FILE = Path("logs") / "story_generator.log"
+
+
+@lru_cache(maxsize=None)
+def file_logger(path=str(LOG_FILE), max_bytes=5 * 1024 * 1024, backup_count=5):
+    """Logger that writes full log payloads to a rotating file (configured once per process)"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    logger = logging.getLogger(f"story_generator.{path}")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    logger.addHandler(handler)
+    return logger
+
+
+def log_file(logger):
+    """Path of the file `logger` writes to, or None if it has no file handler"""
+    for handler in logger.handlers:
+        if isinstance(handler, logging.FileHandler):
+            return Path(handler.baseFilename)
+    return None
+
+
+class LogRecord:
+    __slots__ = ("index", "created", "text", "length")
+
+    def __init__(self, index, created, text, length):
+        self.index = index
+        self.created = created
+        # At most `preview_chars` of the payload; `length` is the size of the whole of it
+        self.text = text
+        self.length = length
+
+
+class RunLog:
+    """Bounded log for the UI: keeps the last `capacity` records and sends every payload to a file.
+
+    Long payloads (blueprints, act texts) stay complete in the file only; the
+    records in memory keep their first `preview_chars`, so a session's buffer
+    stays small whatever is logged. With a
+    `tag` (the id of a session or job), every line in the file starts with it,
+    so runs sharing a process can be told apart.
+    """
+
+    def __init__(self, capacity=1000, preview_chars=300, logger=None, tag=None):
+        self.preview_chars = preview_chars
+        self.logger = logger if logger is not None else file_logger()
+        # Where full payloads end up, for the hint on cut previews
+        self.path = log_file(self.logger)
+        self.tag = tag
+        self.total = 0
+        self._records = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def add(self, text):
+        text = str(text)
+        self.logger.info(f"[{self.tag}] {text}" if self.tag else text)
+        with self._lock:
+            record = LogRecord(self.total, datetime.now(), text[:self.preview_chars], len(text))
+            self._records.append(record)
+            self.total += 1
+        return record
+
+    def preview(self, record):
+        if record.length > len(record.text):
+            where = f", full text in {self.path}" if self.path is not None else ""
+            return f"{record.text}… ({record.length} characters{where})"
+        return record.text
+
+    def page_count(self, page_size):
+        with self._lock:
+            return max(1, -(-len(self._records) // page_size))
+
+    def page(self, number, page_size):
+        """Records of page `number` (1 is the oldest page still held in memory)"""
+        with self._lock:
+            records = list(self._records)
+        start = (number - 1) * page_size
+        return records[start:start + page_size]
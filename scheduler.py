@@ -0,0 +1,192 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from llm_client import shared_event_loop
+
+
+class TaskGraph:
+    """Run callables on a thread pool as soon as the tasks they depend on have finished.
+
+    Each task is registered with `add(key, func, deps)`. Once every task in `deps`
+    is done, `func` is called with their results as positional arguments (in the
+    order of `deps`). Tasks may add further tasks while they run, which lets the
+    graph grow as the story pipeline discovers chapters and acts. `on_error` is
+    called with the key and error of every task that fails, including tasks
+    that never ran because a dependency failed.
+    """
+
+    def __init__(self, max_workers=4, on_error=None):
+        self.max_workers = max(1, int(max_workers))
+        self.on_error = on_error
+        self._cond = threading.Condition()
+        self._pending = {}  # key -> (func, deps) waiting on unfinished deps
+        self._running = set()
+        self._results = {}
+        self._errors = {}
+        self._ready_at = {}
+        self._closed = False
+        self._start_workers()
+
+    def add(self, key, func, deps=()):
+        """Register a task; it is started as soon as all of its dependencies are done"""
+        deps = tuple(deps)
+        with self._cond:
+            if key in self._pending or key in self._running or key in self._results or key in self._errors:
+                raise ValueError(f"Task {key!r} was already added")
+            self._pending[key] = (func, deps)
+            self._schedule_ready()
+        return key
+
+    def result(self, key, timeout=None):
+        """Block until the task `key` has finished and return its result (or raise its error)"""
+        with self._cond:
+            finished = self._cond.wait_for(lambda: key in self._results or key in self._errors or self._closed, timeout)
+            if key in self._errors:
+                raise self._errors[key]
+            if key in self._results:
+                return self._results[key]
+            if not finished:
+                raise TimeoutError(f"Task {key!r} did not finish within {timeout} seconds")
+            raise RuntimeError(f"Task graph was shut down before {key!r} finished")
+
+    def release(self, key):
+        """Drop the result of a finished task to free its memory; `result` and tasks added later get None for it"""
+        with self._cond:
+            if key in self._results:
+                self._results[key] = None
+
+    def queued_seconds(self, key):
+        """Seconds since `key` had all its dependencies done; read when the task starts to get its queue time"""
+        with self._cond:
+            ready_at = self._ready_at.get(key)
+        return time.monotonic() - ready_at if ready_at is not None else 0.0
+
+    def shutdown(self, cancel=False):
+        """Stop accepting work; with `cancel`, drop tasks that have not started yet"""
+        with self._cond:
+            self._closed = True
+            if cancel:
+                self._pending.clear()
+            self._cond.notify_all()
+        self._shutdown_workers(cancel)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown(cancel=exc_type is not None)
+
+    def _schedule_ready(self):
+        # Caller must hold self._cond
+        if self._closed:
+            return
+        changed = True
+        while changed:
+            changed = False
+            for key, (func, deps) in list(self._pending.items()):
+                failed = next((d for d in deps if d in self._errors), None)
+                if failed is not None:
+                    # Propagate the failure so anyone waiting on a dependent task is released
+                    del self._pending[key]
+                    self._fail(key, self._errors[failed])
+                    self._cond.notify_all()
+                    changed = True
+                elif all(d in self._results for d in deps):
+                    del self._pending[key]
+                    self._running.add(key)
+                    self._ready_at[key] = time.monotonic()
+                    args = [self._results[d] for d in deps]
+                    self._submit(key, func, args)
+
+    def _fail(self, key, error):
+        # Caller must hold self._cond
+        self._errors[key] = error
+        if self.on_error is not None:
+            self.on_error(key, error)
+
+    def _start_workers(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+
+    def _submit(self, key, func, args):
+        self._executor.submit(self._run, key, func, args)
+
+    def _shutdown_workers(self, cancel):
+        self._executor.shutdown(wait=not cancel, cancel_futures=cancel)
+
+    def _run(self, key, func, args):
+        try:
+            value = func(*args)
+        except BaseException as e:
+            self._finish(key, error=e)
+        else:
+            self._finish(key, value)
+
+    def _finish(self, key, value=None, error=None):
+        with self._cond:
+            self._running.discard(key)
+            if error is not None:
+                self._fail(key, error)
+            else:
+                self._results[key] = value
+            self._schedule_ready()
+            self._cond.notify_all()
+
+
+class AsyncTaskGraph(TaskGraph):
+    """Same interface as `TaskGraph`, but tasks are coroutine functions run on the shared event loop.
+
+    No threads are spent per task: at most `max_workers` coroutines of this graph
+    are awaiting the model at once, and many graphs (stories) share one loop.
+    """
+
+    def _start_workers(self):
+        self._loop = shared_event_loop()
+        self._semaphore = asyncio.Semaphore(self.max_workers)
+        self._futures = set()
+
+    def _submit(self, key, func, args):
+        future = asyncio.run_coroutine_threadsafe(self._arun(key, func, args), self._loop)
+        self._futures.add(future)
+        future.add_done_callback(self._futures.discard)
+
+    def _shutdown_workers(self, cancel):
+        if cancel:
+            for future in list(self._futures):
+                future.cancel()
+
+    async def _arun(self, key, func, args):
+        try:
+            async with self._semaphore:
+                value = await func(*args)
+        except BaseException as e:
+            self._finish(key, error=e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        else:
+            self._finish(key, value)
+
+
+class TokenStream:
+    """Thread-safe hand-off of text chunks from the task producing them to a reader on another thread"""
+
+    _DONE = object()
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def put(self, chunk):
+        self._queue.put(chunk)
+
+    def close(self):
+        """Signal that no more chunks will arrive"""
+        self._queue.put(self._DONE)
+
+    def __iter__(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is self._DONE:
+                return
+            yield chunk
@@ -0,0 +1,169 @@
+"""Offline similarity cache: reuse what was worked out for an earlier prompt that says nearly the same thing.
+
+Prompts are reduced to a set of features (their content words, lightly
+stemmed, and adjacent word pairs) and indexed with MinHash signatures split
+into LSH bands, all in SQLite. A lookup only compares the prompts that share
+a band with the new one, and returns the most similar one if its Jaccard
+similarity reaches the threshold. No model or network is involved.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import struct
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+
+# MinHash signature length, split into LSH bands of BAND_ROWS values; prompts sharing any band are
+# compared, which finds pairs above ~(1 / BANDS) ** (1 / BAND_ROWS) = 0.5 similarity almost surely
+SIGNATURE_SIZE = 64
+BAND_ROWS = 4
+BANDS = SIGNATURE_SIZE // BAND_ROWS
+# Jaccard similarity of prompt features above which an entry is reused
+SIMILARITY_THRESHOLD = 0.6
+_MERSENNE = (1 << 61) - 1
+_PERMUTATIONS = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE | 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE)
+    for i in range(SIGNATURE_SIZE)
+]
+WORD_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+# Words that say nothing about what a story prompt asks for
+STOPWORDS = frozenset("""
+a about an and are as at be but by can for from has have he her his i in into is it its me my of on or our she so
+that the their them then there they this to was we were what when where which while who will with would you your
+story stories tale write writing please want wants
+""".split())
+
+
+def features(text):
+    """Feature set of a prompt: content words without plural/verb endings, and adjacent pairs of them"""
+    words = [word for word in WORD_RE.findall(text.lower()) if word not in STOPWORDS]
+    stems = [re.sub(r"(ies|es|s|ing|ed)$", "", word) if len(word) > 4 else word for word in words]
+    return set(stems) | {f"{first} {second}" for first, second in zip(stems, stems[1:])}
+
+
+def signature(feature_set):
+    """MinHash signature of a feature set (SIGNATURE_SIZE values)"""
+    hashes = [int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "big") for feature in feature_set]
+    if not hashes:
+        return [_MERSENNE] * SIGNATURE_SIZE
+    return [min((a * value + b) % _MERSENNE for value in hashes) for a, b in _PERMUTATIONS]
+
+
+def band_keys(values):
+    """One hash per LSH band of a signature"""
+    return [
+        hashlib.blake2b(struct.pack(f">{BAND_ROWS}Q", *values[band * BAND_ROWS:(band + 1) * BAND_ROWS]), digest_size=8).hexdigest()
+        for band in range(BANDS)
+    ]
+
+
+def jaccard(first, second):
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+class Match:
+    """A stored entry whose prompt is similar to the one looked up"""
+
+    __slots__ = ("prompt", "value", "similarity")
+
+    def __init__(self, prompt, value, similarity):
+        self.prompt = prompt
+        self.value = value
+        self.similarity = similarity
+
+
+class SimilarityCache:
+    """JSON values stored under prompts, found again by prompts with similar features, in SQLite.
+
+    Entries are kept per `namespace` (e.g. the stage and the model that
+    produced them). Every lookup is counted, so `stats` gives the hit rate
+    across processes.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "id INTEGER PRIMARY KEY, namespace TEXT NOT NULL, prompt TEXT NOT NULL, features TEXT NOT NULL, "
+            "value TEXT NOT NULL, created_at REAL NOT NULL, used_at REAL, uses INTEGER NOT NULL DEFAULT 0, "
+            "UNIQUE (namespace, prompt));"
+            "CREATE TABLE IF NOT EXISTS bands (namespace TEXT NOT NULL, band TEXT NOT NULL, entry INTEGER NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS bands_lookup ON bands (namespace, band);"
+            "CREATE TABLE IF NOT EXISTS lookups (namespace TEXT PRIMARY KEY, hits INTEGER NOT NULL, misses INTEGER NOT NULL);"
+        )
+        self._conn.commit()
+
+    def lookup(self, namespace, prompt, threshold=SIMILARITY_THRESHOLD):
+        """The stored entry most similar to `prompt`, as a `Match`, if it reaches `threshold`; else None"""
+        wanted = features(prompt)
+        bands = [f"{index}:{key}" for index, key in enumerate(band_keys(signature(wanted)))]
+        best = None
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT DISTINCT e.id, e.prompt, e.features, e.value FROM bands b JOIN entries e ON e.id = b.entry "
+                f"WHERE b.namespace = ? AND b.band IN ({', '.join('?' * len(bands))})",
+                [namespace, *bands],
+            ).fetchall()
+            for entry, stored_prompt, stored_features, value in rows:
+                similarity = jaccard(wanted, set(json.loads(stored_features)))
+                if similarity >= threshold and (best is None or similarity > best[0]):
+                    best = (similarity, entry, stored_prompt, value)
+            self._conn.execute(
+                "INSERT INTO lookups (namespace, hits, misses) VALUES (?, ?, ?) "
+                "ON CONFLICT (namespace) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses",
+                (namespace, int(best is not None), int(best is None)),
+            )
+            if best is not None:
+                self._conn.execute("UPDATE entries SET used_at = ?, uses = uses + 1 WHERE id = ?", (time.time(), best[1]))
+            self._conn.commit()
+        if best is None:
+            return None
+        return Match(best[2], json.loads(best[3]), best[0])
+
+    def put(self, namespace, prompt, value):
+        """Store (or replace) the value worked out for a prompt"""
+        feature_set = features(prompt)
+        with self._lock:
+            old = self._conn.execute("SELECT id FROM entries WHERE namespace = ? AND prompt = ?", (namespace, prompt)).fetchone()
+            if old is not None:
+                self._conn.execute("DELETE FROM bands WHERE entry = ?", old)
+                self._conn.execute("DELETE FROM entries WHERE id = ?", old)
+            entry = self._conn.execute(
+                "INSERT INTO entries (namespace, prompt, features, value, created_at) VALUES (?, ?, ?, ?, ?)",
+                (namespace, prompt, json.dumps(sorted(feature_set)), json.dumps(value), time.time()),
+            ).lastrowid
+            self._conn.executemany(
+                "INSERT INTO bands (namespace, band, entry) VALUES (?, ?, ?)",
+                [(namespace, f"{index}:{key}", entry) for index, key in enumerate(band_keys(signature(feature_set)))],
+            )
+            self._conn.commit()
+
+    def stats(self, namespace=None):
+        """Entries, hits, misses and hit rate, of one namespace or of all of them"""
+        where, values = ("WHERE namespace = ?", (namespace,)) if namespace is not None else ("", ())
+        with self._lock:
+            entries = self._conn.execute(f"SELECT COUNT(*) FROM entries {where}", values).fetchone()[0]
+            hits, misses = self._conn.execute(f"SELECT COALESCE(SUM(hits), 0), COALESCE(SUM(misses), 0) FROM lookups {where}", values).fetchone()
+        lookups = hits + misses
+        return {"entries": entries, "hits": hits, "misses": misses, "hit_rate": hits / lookups if lookups else 0.0}
+
+    def clear(self):
+        with self._lock:
+            self._conn.executescript("DELETE FROM bands; DELETE FROM entries; DELETE FROM lookups;")
+            self._conn.commit()
+
+
+@lru_cache(maxsize=None)
+def shared_similarity_cache(path):
+    """One `SimilarityCache` per database file per process"""
+    return SimilarityCache(path)
@@ -0,0 +1,77 @@
+import re
+import threading
+
+from tokens import count_tokens, tail_tokens
+
+
+class ContextBudget:
+    """Keeps the context handed to each act prompt at a roughly constant size.
+
+    The text written earlier in the chapter is cut to its last `recent_tokens`
+    tokens, with the act descriptions standing in for what was cut. The
+    blueprint is cut to `blueprint_tokens`, keeping the paragraphs about the
+    current chapter and then the opening (synopsis, characters, setting).
+    The prompt sizes with and without the budget are tallied for `report`.
+    """
+
+    def __init__(self, recent_tokens=1500, blueprint_tokens=1500):
+        self.recent_tokens = recent_tokens
+        self.blueprint_tokens = blueprint_tokens
+        self.acts = 0
+        self.prompt_tokens = 0
+        self.full_prompt_tokens = 0
+        self._lock = threading.Lock()
+
+    def previous_text(self, previous_acts, earlier_descriptions):
+        """Text of the chapter so far, condensed to a summary plus a verbatim tail.
+
+        Acts are taken from the last one back, so only the ones the tail needs
+        are read from `previous_acts` (a sequence that may load them lazily).
+        """
+        recent = []
+        tokens = 0
+        for index in range(len(previous_acts) - 1, -1, -1):
+            recent.append("\n" + previous_acts[index])
+            tokens += count_tokens(recent[-1])
+            if tokens > self.recent_tokens:
+                break
+        else:
+            return "".join(reversed(recent))
+        summary = "\n".join(f"- {description}" for description in earlier_descriptions)
+        tail = tail_tokens("".join(reversed(recent)), self.recent_tokens)
+        return f"\nsummary of what has happened so far in this chapter:\n{summary}\n\nthe most recent text, continue directly from it:\n...{tail}"
+
+    def blueprint_for(self, blueprint, chapter_title):
+        """The parts of the blueprint that matter for one chapter, within the budget"""
+        if count_tokens(blueprint) <= self.blueprint_tokens:
+            return blueprint
+        paragraphs = [p for p in re.split(r"\n\s*\n", blueprint) if p.strip()]
+        title = chapter_title.lower()
+        keep = set()
+        used = 0
+        # Paragraphs about this chapter first, then the rest of the blueprint from the top
+        ranked = [i for i, p in enumerate(paragraphs) if title in p.lower()]
+        ranked += [i for i in range(len(paragraphs)) if i not in ranked]
+        for index in ranked:
+            size = count_tokens(paragraphs[index])
+            if used + size > self.blueprint_tokens:
+                continue
+            keep.add(index)
+            used += size
+        return "\n\n".join(paragraphs[i] for i in sorted(keep))
+
+    def record(self, prompt_tokens, full_prompt_tokens):
+        """Tally the size of an act prompt and what it would have been without the budget"""
+        with self._lock:
+            self.acts += 1
+            self.prompt_tokens += prompt_tokens
+            self.full_prompt_tokens += full_prompt_tokens
+
+    def report(self):
+        with self._lock:
+            saved = self.full_prompt_tokens - self.prompt_tokens
+            share = saved / self.full_prompt_tokens if self.full_prompt_tokens else 0.0
+            return (
+                f"{self.acts} act prompts used {self.prompt_tokens} tokens "
+                f"({self.full_prompt_tokens} without the context budget, {saved} saved, {share:.0%})"
+            )
@@ -0,0 +1,226 @@
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from urllib.parse import unquote
+
+from story_store import StoryStore
+
+LIBRARY_DB = Path("stories") / "library.sqlite"
+STORY_FILE_RE = re.compile(r"story_(\d{8}_\d{6})_(.*?)\.md")
+CHAPTER_HEADING_RE = re.compile(r"^## Chapter ", re.MULTILINE)
+CHAPTER_RE = re.compile(r"^## Chapter (\d+): (.*)$", re.MULTILINE)
+SEARCH_TERM_RE = re.compile(r"\w+")
+# "Title: ...", "**Title:** ...", "Story Title - ..." lines of a blueprint
+TITLE_RE = re.compile(r"^[\s#*_]*(?:story\s+)?title[\s*_]*[:\-][\s*_]*(.+?)[\s*_]*$", re.IGNORECASE | re.MULTILINE)
+STORY_FIELDS = ["story_file", "created_at", "prompt", "title", "chapters", "words", "size"]
+# Words of context around the matches in a search snippet
+SNIPPET_WORDS = 16
+
+
+def story_title(blueprint):
+    """Title the blueprint gives the story, or None"""
+    match = TITLE_RE.search(blueprint or "")
+    return match.group(1).strip("\"'“”") if match else None
+
+
+def match_expression(query):
+    """FTS5 query matching passages that contain every word of `query` (typed text is never parsed as FTS syntax)"""
+    return " ".join(f'"{term}"' for term in SEARCH_TERM_RE.findall(query))
+
+
+def chapter_passages(content):
+    """(chapter number, chapter title, text) of every chapter in a story file's text"""
+    headings = list(CHAPTER_RE.finditer(content))
+    for index, heading in enumerate(headings):
+        end = headings[index + 1].start() if index + 1 < len(headings) else len(content)
+        yield int(heading.group(1)), heading.group(2).strip(), content[heading.end():end].strip()
+
+
+def parse_story_file(story_file):
+    """(created_at, prompt) from a story file name, or None if it is not named like a story"""
+    match = STORY_FILE_RE.fullmatch(Path(story_file).name)
+    if not match:
+        return None
+    timestamp, encoded_prompt = match.groups()
+    return datetime.strptime(timestamp, "%Y%m%d_%H%M%S").timestamp(), unquote(encoded_prompt)
+
+
+class StoryLibrary:
+    """Index of the stories on disk (prompt, title, chapter and word counts, size) in SQLite.
+
+    Kept up to date as stories are written, so listing and searching the library
+    never reads the story files; `chapter` reads one chapter of a story from its
+    container, and only `body` reads a whole story file.
+    The text of every act also goes into an FTS5 index for `search`.
+    """
+
+    def __init__(self, path=LIBRARY_DB):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS stories ("
+            "story_file TEXT PRIMARY KEY, created_at REAL NOT NULL, prompt TEXT NOT NULL, title TEXT, "
+            "chapters INTEGER NOT NULL DEFAULT 0, words INTEGER NOT NULL DEFAULT 0, "
+            "size INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS stories_created ON stories (created_at)")
+        # One row per act (or per chapter, for files indexed by `sync`). The FTS5 table
+        # only holds the index; the text lives once, in `passages`, kept in sync by triggers
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS passages (
+                id INTEGER PRIMARY KEY, story_file TEXT NOT NULL, chapter INTEGER, chapter_title TEXT,
+                act INTEGER, text TEXT NOT NULL);
+            CREATE INDEX IF NOT EXISTS passages_story ON passages (story_file);
+            CREATE VIRTUAL TABLE IF NOT EXISTS passages_fts USING fts5(
+                chapter_title, text, content = 'passages', content_rowid = 'id', tokenize = 'porter unicode61');
+            CREATE TRIGGER IF NOT EXISTS passages_insert AFTER INSERT ON passages BEGIN
+                INSERT INTO passages_fts (rowid, chapter_title, text) VALUES (new.id, new.chapter_title, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS passages_delete AFTER DELETE ON passages BEGIN
+                INSERT INTO passages_fts (passages_fts, rowid, chapter_title, text)
+                VALUES ('delete', old.id, old.chapter_title, old.text);
+            END;
+        """)
+        self._conn.commit()
+
+    def start(self, story_file, prompt, content=""):
+        """Index a story that is being (re)written from scratch with `content`"""
+        story_file = Path(story_file)
+        parsed = parse_story_file(story_file)
+        created_at = parsed[0] if parsed else time.time()
+        with self._lock:
+            # A rewritten story (e.g. a resumed one) indexes its acts again as they are saved
+            self._conn.execute("DELETE FROM passages WHERE story_file = ?", (str(story_file),))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stories (story_file, created_at, prompt, title, chapters, words, size, updated_at) "
+                "VALUES (?, ?, ?, (SELECT title FROM stories WHERE story_file = ?), ?, ?, ?, ?)",
+                (str(story_file), created_at, prompt, str(story_file), *self._counts(content), len(content.encode("utf-8")), time.time()),
+            )
+            self._conn.commit()
+
+    def append(self, story_file, size=0, chapters=0, words=0):
+        """Add bytes, chapters and words written to an indexed story to its counts"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE stories SET chapters = chapters + ?, words = words + ?, size = size + ?, updated_at = ? WHERE story_file = ?",
+                (chapters, words, size, time.time(), str(story_file)),
+            )
+            self._conn.commit()
+
+    def add_passage(self, story_file, chapter, chapter_title, act, text):
+        """Make the text of an act searchable"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO passages (story_file, chapter, chapter_title, act, text) VALUES (?, ?, ?, ?, ?)",
+                (str(story_file), chapter, chapter_title, act, text),
+            )
+            self._conn.commit()
+
+    def search(self, query, limit=20):
+        """Best matching passages for `query`, with a snippet around the matches (marked in bold)"""
+        expression = match_expression(query)
+        if not expression:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT passages.story_file, stories.prompt, stories.title, passages.chapter, passages.chapter_title, "
+                "passages.act, snippet(passages_fts, 1, '**', '**', '…', ?) AS snippet "
+                "FROM passages_fts JOIN passages ON passages.id = passages_fts.rowid "
+                "JOIN stories ON stories.story_file = passages.story_file "
+                "WHERE passages_fts MATCH ? ORDER BY passages_fts.rank LIMIT ?",
+                (SNIPPET_WORDS, expression, limit),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def set_title(self, story_file, title):
+        with self._lock:
+            self._conn.execute("UPDATE stories SET title = ? WHERE story_file = ?", (title, str(story_file)))
+            self._conn.commit()
+
+    def sync(self, folder):
+        """Index story files that are missing from the library or changed outside of it; returns how many"""
+        with self._lock:
+            sizes = dict(self._conn.execute("SELECT story_file, size FROM stories"))
+        changed = 0
+        for story_file in Path(folder).glob("story_*.md"):
+            parsed = parse_story_file(story_file)
+            if parsed is None or sizes.get(str(story_file)) == story_file.stat().st_size:
+                continue
+            content = story_file.read_text(errors="replace")
+            # File names only hold the start of the prompt; the container has all of it
+            store = StoryStore.existing(story_file)
+            prompt = parsed[1]
+            if store is not None:
+                with store:
+                    prompt = store.manifest().get("prompt", prompt)
+            self.start(story_file, prompt, content)
+            for chapter, chapter_title, text in chapter_passages(content):
+                self.add_passage(story_file, chapter, chapter_title, None, text)
+            changed += 1
+        with self._lock:
+            # Stories deleted from disk leave the library too
+            missing = [(name,) for name in sizes if not Path(name).exists()]
+            self._conn.executemany("DELETE FROM stories WHERE story_file = ?", missing)
+            self._conn.executemany("DELETE FROM passages WHERE story_file = ?", missing)
+            self._conn.commit()
+        return changed + len(missing)
+
+    def count(self, query=None):
+        where, params = self._where(query)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM stories {where}", params).fetchone()[0]
+
+    def page(self, number, page_size, query=None):
+        """Stories of page `number` (1 is the newest), optionally only those whose prompt or title matches `query`"""
+        where, params = self._where(query)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(STORY_FIELDS)} FROM stories {where} ORDER BY created_at DESC, story_file DESC LIMIT ? OFFSET ?",
+                (*params, page_size, (number - 1) * page_size),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    @staticmethod
+    def body(story_file):
+        """Full text of a story, read from disk"""
+        return Path(story_file).read_text(errors="replace")
+
+    @staticmethod
+    def chapters(story_file):
+        """(chapter number, title) of a story, from its container; empty for stories written without one"""
+        store = StoryStore.existing(story_file)
+        if store is None:
+            return []
+        with store:
+            return store.chapters()
+
+    @staticmethod
+    def chapter(story_file, chapter_number):
+        """Text of one chapter of a story, read from its container alone"""
+        with StoryStore.existing(story_file) as store:
+            return store.chapter_markdown(chapter_number)
+
+    @staticmethod
+    def _counts(content):
+        return len(CHAPTER_HEADING_RE.findall(content)), len(content.split())
+
+    @staticmethod
+    def _where(query):
+        if not query:
+            return "", ()
+        pattern = "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return "WHERE prompt LIKE ? ESCAPE '\\' OR title LIKE ? ESCAPE '\\'", (pattern, pattern)
+
+
+@lru_cache(maxsize=None)
+def shared_library(path=str(LIBRARY_DB)):
+    """One `StoryLibrary` per database file per process"""
+    return StoryLibrary(path)
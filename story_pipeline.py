@@ -0,0 +1,1723 @@
+"""Story pipeline: prompts, model calls and the task graph of one story, without any UI.
+
+`story_generator.py` (the Streamlit app) and the background workers in `jobs.py`
+both drive it; `write_story` runs a whole story headless.
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+import time
+from contextlib import contextmanager
+from collections.abc import Sequence
+from pathlib import Path
+from urllib.parse import quote
+from functools import lru_cache, partial
+from scheduler import AsyncTaskGraph, TaskGraph, TokenStream
+from response_cache import cache_key, shared_cache
+from similarity_cache import SIMILARITY_THRESHOLD, shared_similarity_cache
+from contextvars import ContextVar
+from checkpoint import Checkpoint
+from story_writer import StoryWriter
+from story_store import StoryStore, store_path
+from story_plan import TOKENS_PER_WORD, PlannedCall, StageStats, StoryPlan
+from tokens import count_tokens
+from run_context import RunContext
+from story_library import LIBRARY_DB, shared_library, story_title
+from tracing import RunTrace, current_span
+from governor import shared_governor
+from model_router import Backend, ModelRouter, ModelSpec, config_path, fallback_errors
+import threading
+from prompt_layout import PrefixTracker, PromptParts, cached_prompt_tokens, prompt_messages, prompt_prefix, prompt_text
+from continuity import best_draft, continuity_issues, words
+from json_repair import JsonRepairError, complete_acts, extract_json, missing_fields_template, normalize_acts, parse_acts, parse_chapters, split_blueprint
+
+STORIES_FOLDER = Path("stories")
+# Characters of the URL-encoded prompt in a story's file name (the full prompt is in its container)
+FILE_NAME_PROMPT_CHARS = 150
+
+story_structure_chooser = PromptParts(
+    prefix="""
+use the handbook below for choosing story structure to determine which story structure is proper for the story given after it.
+explain your reasoning througly and in depth, reference similar popular works and how they aided your decision to use the structure you choose.
+here is the handbook:
+Introduction
+Selecting the right story structure is crucial for shaping a compelling narrative. Each structure offers unique benefits, guiding how your story unfolds and ensuring that it resonates with your audience. This handbook will help you understand various story structures and choose the one that best suits your narrative needs.
+
+
+
+Classic Story Structure Overview: The classic story structure is a foundational model used in storytelling. It consists of five key stages that guide the narrative from beginning to end.
+
+
+Sections:
+
+
+Exposition: Introduces the protagonist, their world, and their desires. Ends with the inciting incident.
+Rising Action: The protagonist faces challenges while pursuing their goal.
+Climax: The protagonist confronts the main conflict head-on.
+Falling Action: The consequences of the climax unfold.
+Resolution: The story concludes, resolving character arcs and conflicts.
+When to Use:
+Ideal for traditional narratives, particularly in genres like romance, drama, or adventure.
+
+
+
+Freytag’s Pyramid Overview: Named after 19th-century playwright Gustav Freytag, this structure emphasizes a tragic arc, often used in classical literature.
+
+
+Sections:
+
+
+Introduction: Establishes the protagonist's status quo and the inciting incident.
+Rising Action: The protagonist pursues their goal, with stakes heightening.
+Climax: A point of no return, leading to the protagonist's downfall.
+Falling Action: The protagonist faces the aftermath of the climax.
+Catastrophe: The protagonist reaches their lowest point, often ending in tragedy.
+When to Use:
+Best for tragic tales or stories with a somber tone, where the protagonist faces inevitable downfall.
+
+
+
+The Hero’s Journey Overview: Popularized by Joseph Campbell and adapted by Christopher Vogler, this structure follows a hero's transformative journey.
+
+
+Sections:
+
+
+The Ordinary World: Introduces the hero's normal life.
+Call to Adventure: The hero is presented with a challenge.
+Refusal of the Call: The hero hesitates to take on the challenge.
+Meeting the Mentor: A guide prepares the hero for their journey.
+Crossing the Threshold: The hero enters a new, unfamiliar world.
+Tests, Allies, Enemies: The hero faces challenges and makes allies.
+Approach to the Inmost Cave: The hero nears their goal.
+The Ordeal: The hero faces their greatest challenge.
+Reward: The hero achieves their goal or gains something significant.
+The Road Back: The hero returns home, often facing new challenges.
+Resurrection: The hero undergoes a final transformation.
+Return with the Elixir: The hero returns to their ordinary world, transformed.
+When to Use:
+Suitable for epic tales, fantasy, adventure, and stories where a protagonist undergoes significant transformation.
+
+
+
+Three Act Structure Overview: A widely used framework that divides the narrative into three distinct parts: beginning, middle, and end.
+
+
+Sections:
+
+
+Act 1: Setup
+Exposition: Establishes the protagonist's world.
+Inciting Incident: Sets the story in motion.
+Plot Point 1: The protagonist commits to the challenge.
+Act 2: Confrontation
+Rising Action: The protagonist encounters obstacles.
+Midpoint: A twist that raises the stakes.
+Plot Point 2: The protagonist faces a critical test.
+Act 3: Resolution
+Pre-Climax: The protagonist prepares for the final confrontation.
+Climax: The protagonist faces their greatest challenge.
+Denouement: The story concludes, revealing the outcome.
+When to Use:
+Ideal for stories with clear conflict and resolution, such as dramas, comedies, and action films.
+
+
+
+Dan Harmon's Story Circle Overview: A simplified version of the Hero’s Journey, focusing on character development within a cyclical narrative.
+
+
+Sections:
+
+
+Comfort Zone: The protagonist's normal life.
+Need/Want: The protagonist desires something.
+Unfamiliar Situation: The protagonist steps out of their comfort zone.
+Adaptation: The protagonist adjusts to new challenges.
+Obtaining the Goal: The protagonist achieves what they wanted.
+Paying the Price: The protagonist realizes the cost of their goal.
+Returning to Familiar: The protagonist returns to their old world.
+Change: The protagonist is changed by their journey.
+When to Use:
+Best for character-driven stories, especially in TV shows or episodic content where characters undergo gradual change.
+
+
+
+Fichtean Curve Overview: A tension-filled structure that skips initial exposition, starting with rising action and building through a series of crises.
+
+
+Sections:
+
+
+Inciting Incident: The story begins with a significant event.
+Rising Action/Multiple Crises: The protagonist faces a series of escalating challenges.
+Climax: The protagonist confronts the story’s central conflict.
+Falling Action: The aftermath of the climax.
+Resolution: The story concludes with a new normal.
+When to Use:
+Perfect for stories with intense drama and suspense, such as thrillers or novels heavy in flashbacks.
+
+
+
+Save the Cat Beat Sheet Overview: Developed by Blake Snyder, this structure is prescriptive, with specific beats that occur at precise points in the narrative.
+
+
+Sections:
+
+
+Opening Image: Sets the tone of the story.
+Setup: Establishes the protagonist's world and desires.
+Theme Stated: Hints at the story's deeper meaning.
+Catalyst: The inciting incident.
+Debate: The protagonist hesitates before taking action.
+Break into Two: The protagonist begins their journey.
+B Story: A subplot that supports the main theme.
+Fun and Games: The story delivers on its premise.
+Midpoint: A twist that raises the stakes.
+Bad Guys Close In: The protagonist faces increasing challenges.
+All Is Lost: The protagonist hits rock bottom.
+Dark Night of the Soul: The protagonist reflects and regroups.
+Break into Three: The protagonist makes a final attempt to succeed.
+Finale: The protagonist confronts the main conflict.
+Final Image: Reflects the protagonist’s transformation.
+When to Use:
+Excellent for structured narratives like screenplays or novels that require tight pacing and clear turning points.
+
+
+
+Seven-Point Story Structure Overview: Focuses on the highs and lows of a narrative, encouraging writers to start with the ending and work backward.
+
+
+Sections:
+
+
+The Hook: Establishes the protagonist’s initial state.
+Plot Point 1: The inciting incident that sets the story in motion.
+Pinch Point 1: A setback that increases tension.
+Midpoint: The protagonist takes control of their fate.
+Pinch Point 2: Another major setback.
+Plot Point 2: The protagonist discovers a solution.
+Resolution: The story’s main conflict is resolved.
+When to Use:
+Ideal for stories focused on dramatic transformations, especially in genres like fantasy, sci-fi, or adventure.
+
+Choosing the right story structure is about aligning your narrative's needs with the strengths of each framework. Use this handbook to guide your decision, ensuring that your story is engaging, well-paced, and emotionally resonant.
+
+""",
+    suffix="""
+here is the story:
+{story_prompt}
+""",
+)
+
+summarize_story_structure = PromptParts(
+    prefix="""
+summarize structure analysis and only describe what structure should be used and how. do not tell why
+""",
+    suffix="""here is the structure analysis
+{story_structure}
+""",
+)
+
+blueprint_prompt = PromptParts(
+    prefix="""
+You are an advanced story creation assistant designed to help writers craft compelling narratives. Your task is to generate a long and detailed story outline, including settings, characters, world-building, and timeline. Afterward, you will provide a fitting title for the story and then list out multiple chapters from start to finish. Each chapter should include a title, a long and detailed synopsis of what happens, and a note on how it connects to the next chapter. The chapter outlines should describe the actual events, key developments, and turning points with careful attention to story structure. Finally, you will offer writing advice on dialogues, story writing techniques, and adherence to story structure. This will all be achieved in response to the user's prompt about the story's theme or subject.
+
+
+Synopsis:
+
+
+Story Synopsis:
+Begin by crafting an intriguing synopsis that summarizes the story in a way that hooks the reader. This should resemble the synopsis found on the back of a book, giving an overview of the central plot, main conflicts, and the stakes involved. The synopsis should be descriptive, engaging, and leave the reader wanting to know more.
+Detailed Story Outline:
+
+
+Story Theme and Core Concept:
+
+
+Describe the central theme of the story. What is the core concept around which the narrative revolves?
+Identify the key messages or moral lessons intended for the reader.
+Setting:
+
+
+Provide a detailed description of the story’s setting(s). Include information about the geographical locations, time periods, and significant environmental or cultural elements.
+If applicable, outline the political, social, and economic conditions that define this world.
+World-Building:
+
+
+If the story takes place in a fictional or fantastical world, describe its history, key events, myths, and lore.
+Describe the rules of magic, technology, or any other unique systems within the world.
+Include details on different species, races, or civilizations that inhabit the world.
+Character Profiles:
+
+
+Generate detailed profiles for the main and significant secondary characters.
+Include their background, motivations, key relationships, and character arcs.
+Mention how each character’s development will influence the story.
+Timeline:
+
+
+Provide a chronological timeline of major events leading up to the story’s beginning.
+Outline key events within the story that drive the plot forward.
+Story Title:
+
+
+Based on the details provided above, suggest a creative and fitting title for the story.
+Chapter Breakdown:
+
+
+Chapter Titles and Synopses:
+
+
+List the titles of each chapter in the story.
+For each chapter, write a long and detailed synopsis of what happens. The chapter outlines should describe the actual events, key developments, and turning points in the story with careful attention to story structure. Ensure each chapter’s synopsis includes character actions, emotional beats, conflicts, and resolutions, providing a clear sense of progression.
+Indicate how each chapter logically connects to the next, ensuring smooth story progression and maintaining coherence in the narrative structure.
+Chapter Structure and Pacing:
+
+
+Offer advice on maintaining the pacing and structure within each chapter.
+Highlight the importance of balancing action, dialogue, and exposition to keep the story engaging.
+Writing Advice:
+
+
+Dialogue Writing:
+
+
+Provide tips on how to write realistic and impactful dialogues.
+Explain how dialogues can be used to reveal character traits, advance the plot, and build tension.
+Story Structure:
+
+
+Offer guidance on maintaining a coherent and engaging story structure.
+Discuss common narrative structures (e.g., three-act structure, hero’s journey) and how they can be applied to the story.
+Character Development:
+
+
+Explain the importance of character arcs and how they should evolve throughout the story.
+Offer techniques for making characters feel multi-dimensional and relatable.
+Maintaining Reader Engagement:
+
+
+Provide strategies for keeping the reader engaged throughout the story.
+Discuss the use of cliffhangers, foreshadowing, and plot twists.
+
+
+""",
+    suffix="""here is the suggested story structure:
+{story_structure}
+
+
+here is the prompt for the story:
+{story_prompt}
+
+
+using advices above now write out the blueprint for the story
+""",
+)
+
+chapter_json_prompt = PromptParts(
+    prefix="""
+You are an advanced story analysis assistant. Your task is to take a detailed story blueprint, which includes a list of chapters with their corresponding descriptions, and convert it into a JSON object. Each chapter title should correspond to its chapter description in the JSON format.
+
+Instructions:
+
+Extract Chapter Information:
+
+Review the provided story blueprint and identify the chapters and their corresponding descriptions.
+For each chapter, ensure that the title and description are accurately paired.
+Convert the extracted chapter information into a JSON object. Each chapter title should be the key, and the corresponding description should be the value.
+JSON Format Example:
+{{
+  "chapters": 
+    {{
+      "The Awakening": "In this chapter, the protagonist wakes up in a strange world with no memory of how they arrived. They encounter a mysterious guide who hints at a grand quest that lies ahead.",
+      "Journey Begins": "The protagonist sets out on their journey, facing their first set of challenges. Along the way, they meet allies who will join them in their quest.",
+      "The Hidden Threat": "Unbeknownst to the protagonist, a dark force is tracking their every move. This chapter introduces the antagonist and the looming danger that will test the hero's resolve.",
+      "Clash at the Crossroads": "The protagonist and their allies face a critical battle at a crossroads. This battle tests their strength and unity, setting the stage for the larger conflict to come.",
+      "Revelation": "In this pivotal chapter, a shocking truth about the protagonist’s past is revealed, altering the course of their journey and forcing them to reconsider their mission.",
+      "The Final Stand": "The story reaches its climax as the protagonist faces the antagonist in a final showdown. The stakes are higher than ever, and the outcome will determine the fate of the world.",
+      "New Dawn": "The story concludes with the aftermath of the final battle. The protagonist reflects on their journey, and the world begins to heal. A sense of hope for the future is established."
+  }}
+}}
+
+Output Requirements:
+Ensure the JSON object is properly formatted, with each chapter title as a unique key and the chapter description as the corresponding value.
+Verify that all chapters from the blueprint are included in the JSON output.
+when writing the json make sure that the chapter titles doesn't include the chapter name or number. just the title provided for chapter. for example "chapter 1: the awakening" or "1 - awakening" is incorrect and only "awakening: is correct
+
+""",
+    suffix="""here is the story blueprint
+{story_blueprint}
+
+
+now generate the chapters json, only the json with no pretext or post text
+""",
+)
+
+act_generator_prompt = PromptParts(
+    prefix="""
+You are an advanced story structuring assistant. Your task is to take a given chapter and its blueprint, and break it down into a detailed three-act structure. Each act should be described in two full paragraphs, elaborating on the key events, character actions, and story progression. This breakdown serves as both a narrative guide and a writing roadmap. Each act's structure and focus should naturally emerge from the chapter's needs. While the primary focus is on crafting detailed descriptions, include concise writing advice on dialogue, pacing, and character interactions where appropriate.
+
+Instructions:
+
+Act Descriptions:
+For each act, provide a detailed, two-paragraph description that thoroughly explains what happens, focusing on key events, character actions, and how the story progresses. Allow the narrative needs of the chapter to dictate the structure and focus of each act.
+Although writing advice should be brief, ensure it addresses crucial elements such as dialogue, pacing, and character dynamics, guiding the writer on how to effectively convey the scene.
+Output Example:
+
+Here’s how the LLM should format the response based on a sample chapter:
+
+Chapter Title: The Awakening
+
+Chapter Blueprint:
+In this chapter, the protagonist wakes up in a strange world with no memory of how they arrived. They encounter a mysterious guide who hints at a grand quest that lies ahead.
+
+Three-Act Structure:
+
+Act 1
+Alex awakens in a dense, fog-covered forest, disoriented and unable to recall how they arrived. The scene is one of eerie quiet, with only the distant murmur of water breaking the silence. As Alex stumbles through the mist, they come across a flowing stream, which seems to be the only sign of life in this otherwise desolate place. The tension builds as Alex explores further, driven by a mix of fear and curiosity. It is at the stream’s edge that they encounter Seraphine, a figure draped in a dark, hooded cloak. Seraphine’s presence is as unsettling as it is intriguing; she speaks in riddles, offering hints about a grand quest but leaving Alex with more questions than answers. Their conversation is brief, but laden with subtext—Seraphine seems to know more about Alex than she reveals, and her cryptic words suggest that the path ahead will be fraught with challenges.
+
+The interaction with Seraphine serves as a catalyst for the chapter, pushing Alex towards a journey that they do not fully understand. The act concludes with a palpable sense of unease, as Alex realizes they are far from home and bound to a destiny they cannot yet comprehend. The mist, symbolic of Alex’s confusion, only thickens as Seraphine disappears into the shadows, leaving Alex to ponder the weight of her words. This opening act sets the tone for the chapter, establishing the mysterious world and the beginning of Alex’s internal and external journey.
+
+Writing Advice:
+Keep dialogue minimal but impactful, allowing subtext to convey the underlying tension. Focus on descriptive language to build atmosphere and immerse the reader in Alex’s disoriented state.
+
+Act 2
+The narrative tension escalates as Alex ventures deeper into the forest, driven by an uneasy mix of dread and determination. The fog thickens around them, distorting the landscape and making every step feel like a leap into the unknown. Suddenly, the tranquility is shattered by the rustling of leaves and the emergence of shadowy creatures from the underbrush. These creatures, formless and dark, represent the first real threat in this new world, and their attack is swift and disorienting. Seraphine’s sudden reappearance is equally jarring; she instructs Alex to defend themselves, her tone urgent and unyielding. Alex’s initial attempts at self-defense are clumsy and ineffective, revealing their lack of experience and deepening their sense of vulnerability.
+
+As the creatures close in, Seraphine urges Alex to focus, pushing them to tap into a power they didn’t know they possessed. Desperation fuels Alex’s actions, and in a moment of intense concentration, they manage to summon water from the stream, creating a barrier that momentarily holds the creatures at bay. This newfound ability surprises both Alex and Seraphine, though the latter’s reaction is one of careful observation rather than shock. The act ends with the creatures retreating into the shadows, leaving Alex exhausted but alive. This confrontation not only tests Alex’s physical limits but also hints at the latent powers that will become crucial in the chapters to come.
+
+Writing Advice:
+Use action sequences to reveal character strengths and weaknesses. Dialogue during combat should be terse and functional, focusing on the urgency of the situation. Balance descriptive action with moments of introspection to maintain narrative depth.
+
+Act 3
+With the immediate threat neutralized, the forest begins to transform—fog lifts slightly, revealing a narrow path that winds deeper into the unknown. The air is still tense, but there is a moment of calm as Alex catches their breath and Seraphine offers a few final words of guidance. Seraphine’s demeanor remains enigmatic; she speaks of the trials ahead and the importance of trusting one’s instincts over fragmented memories. Her words are less about comfort and more about preparation, underscoring the gravity of the journey Alex is about to undertake. There is a sense of a looming challenge, a foreshadowing of the dangers that lie ahead, and the choices Alex will have to make.
+
+As Seraphine vanishes once more into the forest, Alex is left alone, standing at the edge of the path that has suddenly appeared. This act focuses on reflection and resolution, allowing Alex to process the events that have just unfolded and what they might signify. The chapter closes with Alex stepping onto the path, a symbolic act that marks the beginning of their quest. The resolution is quiet but charged with anticipation, setting the stage for the challenges that await in the next chapter.
+
+Writing Advice:
+End the chapter with a reflective tone, using dialogue to foreshadow future events without giving too much away. Create a smooth transition from action to introspection, maintaining the reader’s engagement through character-driven narrative.
+
+Output Requirements:
+
+Ensure each act is described in two full paragraphs, elaborating on the events, character actions, and story progression.
+Provide brief but insightful writing advice on key elements such as dialogue, pacing, and character dynamics.
+
+here is the general story blueprint:
+{story_blue_print}
+""",
+    suffix="""
+we are writing the acts of the chapter {chapter_number} with title {chapter_title}. it is about:
+{chapter_desc}
+
+using above structure now generate three acts for chapter {chapter_number}: {chapter_title}
+""",
+)
+
+acts_json = PromptParts(
+    prefix="""
+You are an advanced language model tasked with converting detailed written acts into a structured JSON format. Each act of the chapter should be represented as a key-value pair in the JSON object. The keys should be labeled as "act-1", "act-2", and "act-3", corresponding to the description of each act. Your goal is to take the provided descriptions and accurately format them into JSON.
+
+Instructions:
+
+Input
+You will be provided with detailed descriptions of three acts from a chapter.
+
+Output
+the acts include description and writing advice for each act, write them down in json format
+
+example output:
+{{
+    "act-1": {{ "description": "act-1 description", "writingAdvice": "act-1 writing advice"}},
+    "act-2": {{ "description": "act-2 description", "writingAdvice": "act-2 writing advice"}},
+    "act-3": {{ "description": "act-3 description", "writingAdvice": "act-3 writing advice"}},
+}}
+""",
+    suffix="""
+here are the acts:
+{acts}
+""",
+)
+
+write_act_prompt = PromptParts(
+    prefix="""
+You are an advanced story-writing assistant. Your task is to take a detailed act description and craft a compelling manuscript for that act. You will write the narrative, dialogue, and action sequences, ensuring the story is engaging, immersive, and believable. The manuscript should feel natural, with characters speaking and acting in ways that are consistent with their personalities and the story’s tone.
+
+Instructions:
+
+Input
+You will be provided with:
+the prompt of the story
+A story blueprint that outlines the overall plot, setting, and character motivations.
+A detailed act description that outlines key events and interactions within the act.
+Output
+Using the information provided, write the actual manuscript (which is very long, at least 3 pages) for the act, including:
+
+Engaging narration that vividly describes the setting, actions, and emotions.
+Natural dialogue that reflects the characters’ personalities, relationships, and the situation they are in.
+Believable pacing that maintains the reader’s interest and drives the story forward.
+Writing Tips:
+
+Show, Don’t Tell: Use descriptive language to paint vivid scenes and convey emotions. Instead of stating how a character feels, show it through their actions, expressions, and dialogue.
+Dynamic Dialogue: Ensure that conversations between characters feel real and contribute to character development or plot progression. Avoid overly formal or stilted language unless it fits a character’s personality.
+Pacing: Balance action, dialogue, and description to keep the story engaging. Vary sentence lengths and structures to create rhythm and momentum.
+Character Consistency: Keep characters’ voices, behaviors, and decisions consistent with their established traits and motivations. Refer back to the story blueprint as needed.
+Emotion and Tension: Infuse scenes with appropriate emotions and tension, using inner monologue and subtle details to deepen the reader’s connection to the characters.
+
+now here is the story blueprint:
+{story_blueprint}
+
+here is the original prompt for this story:
+{original_prompt}
+
+""",
+    suffix="""here is the what chapter is about:
+{chapter_desc}
+
+here is the description of this act:
+{act_description}
+
+here are some advice for writing this act:
+{act_writing_advice}
+
+we are wring the act {act_number} of chapter {chapter_number}, try writing a great story for this act (should be long at least 3 pages). nowhere in the text mention that we are on act {act_number} just output the story text
+only give the act text with NO pre text or post text such as "here is the text for act ..." or "anything else i can help with?", this allows the acts to be stitched together in future
+if the original prompt asks for playwright style, do it in playwright style, else do the normal story prose
+""",
+)
+
+write_act_extra = """
+here is the previous text that has been written and we should continue upon this:
+{previous_text}
+we are wring the act {act_number} of chapter {chapter_number}, try writing a great story for this act (should be long at least 3 pages). nowhere in the text mention that we are on act {act_number} just output the story text
+only give the act text with NO pre text or post text such as "here is the text for act ..." or "anything else i can help with?", this allows the acts to be stitched together in future
+"""
+
+# Lets an act be drafted while the acts before it are still being written: their outlines stand in for their text
+write_act_draft_extra = """
+the acts before this one in the chapter are being written at the same time, so here is what happens in them instead of their text:
+{previous_text}
+start right where they end, without retelling them. we are wring the act {act_number} of chapter {chapter_number}, try writing a great story for this act (should be long at least 3 pages). nowhere in the text mention that we are on act {act_number} just output the story text
+only give the act text with NO pre text or post text such as "here is the text for act ..." or "anything else i can help with?", this allows the acts to be stitched together in future
+"""
+
+# Joins an act drafted in parallel onto the text before it, when the local continuity check finds a seam
+bridge_prompt = PromptParts(
+    prefix="""
+You are helping to stitch together a story whose acts were written at the same time. Two consecutive parts do not connect smoothly; your task is to write a short bridging passage that leads from the end of the first part into the beginning of the second, in the same voice, tense and style. Do not summarize or repeat either part.
+
+here is the story blueprint:
+{story_blueprint}
+""",
+    suffix="""
+here is the end of the text so far:
+...{previous_tail}
+
+here is how the next part begins:
+{draft_head}...
+
+the problem with the seam: {issues}
+
+write the bridging passage (one to three paragraphs). only give the passage text with NO pre text or post text
+""",
+)
+# Words of each act around a seam that the bridging prompt sees
+BRIDGE_CONTEXT_WORDS = 300
+
+# Appended to the blueprint prompt so the chapter list comes back with the blueprint instead of from a second call
+blueprint_chapters_suffix = """
+after the blueprint, end your answer with the list of chapters as a json code block, each chapter title (without "chapter" or its number) as a key and its description as the value:
+```json
+{{"chapters": {{"chapter title": "chapter description"}}}}
+```
+"""
+
+# Appended to the act generator prompt so the acts come back as JSON instead of needing a conversion call
+act_generator_json_suffix = """
+give the three acts as a json object only, with no pretext or post text, in this format:
+{{
+    "act-1": {{ "description": "the two paragraphs describing act 1", "writingAdvice": "writing advice for act 1"}},
+    "act-2": {{ "description": "the two paragraphs describing act 2", "writingAdvice": "writing advice for act 2"}},
+    "act-3": {{ "description": "the two paragraphs describing act 3", "writingAdvice": "writing advice for act 3"}}
+}}
+"""
+
+# Asks again for just the act fields that were missing from a structured outline
+acts_repair_prompt = """
+here are the acts of a chapter:
+{acts}
+
+some fields are missing from them. fill in only these fields and give them as a json object with exactly these keys, with no pretext or post text:
+{missing}
+"""
+
+# Set up OpenAI API key (used when the OPENAI_API_KEY environment variable is not set)
+OPENAI_API_KEY = "UR API KEY HERE"
+# Default chat model, built on first use by `get_model`; assign any chat model here to replace it
+model = None
+_model_lock = threading.Lock()
+governor = shared_governor(requests_per_minute=60, tokens_per_minute=200_000)
+# Completion size assumed when reserving tokens/min capacity, corrected once the call returns
+EXPECTED_COMPLETION_TOKENS = 1500
+
+# Sampling settings of each stage on the default model. A routing config (models.json, or the
+# file named by $STORY_MODELS; see model_router.py) can give any stage its own models and fallbacks
+STAGE_MODELS = {
+    "chapters": ModelSpec(temperature=0.0),
+    "acts_json": ModelSpec(temperature=0.0),
+    "act": ModelSpec(max_tokens=4096),
+    "draft": ModelSpec(max_tokens=4096),
+    "bridge": ModelSpec(max_tokens=600),
+}
+# Retries on one model before moving on to the next one in its stage's fallback chain
+FALLBACK_RETRIES = 1
+# Stages whose completions a run's `max_act_tokens` caps
+ACT_STAGES = ("act", "draft")
+# Acts every chapter is outlined as
+ACTS_PER_CHAPTER = 3
+
+# Completions are cached on disk by (model, temperature, prompt); a run can bypass the lookup
+RESPONSE_CACHE_PATH = Path("cache") / "responses.sqlite"
+# Structure analyses are also found by prompts that are merely similar (see similarity_cache.py)
+STRUCTURE_CACHE_PATH = Path("cache") / "structures.sqlite"
+# Prompts go out as a shared prefix block marked for provider prompt caching, then the variable suffix;
+# OpenRouter passes the marker on to the providers that need it. Turn it off for endpoints that reject it
+MARK_CACHEABLE_PREFIX = True
+sent_prefixes = PrefixTracker()
+# The StoryRun whose task is executing, so step functions can honour its options
+current_run = ContextVar("current_run", default=None)
+
+
+@lru_cache(maxsize=None)
+def default_backend():
+    """Provider of the default model; its clients share the process-wide connection pool.
+
+    Retries are left to the governor, which shares the provider's limits across
+    every story in the process, so the backend's own limits are off.
+    """
+    return Backend("default", "https://openrouter.ai/api/v1", api_key=os.environ.get("OPENAI_API_KEY") or OPENAI_API_KEY,
+                   requests_per_minute=None, tokens_per_minute=None, default_model="meta-llama/llama-3.1-8b-instruct:free", temperature=0.75)
+
+def get_model():
+    """The default chat model, building it on first use"""
+    global model
+    with _model_lock:
+        if model is None:
+            model = default_backend().client(None)
+        return model
+
+def completion_cache():
+    """The on-disk response cache, opened on first use"""
+    return shared_cache(str(RESPONSE_CACHE_PATH))
+
+def structure_cache():
+    """The on-disk similarity cache of structure analyses, opened on first use"""
+    return shared_similarity_cache(str(STRUCTURE_CACHE_PATH))
+
+def chat_model(model_name):
+    """Client for another model on the default provider (same settings and connection pool, created once per name)"""
+    return default_backend().client(model_name)
+
+def default_model(model_name=None):
+    return get_model() if model_name is None else chat_model(model_name)
+
+@lru_cache(maxsize=None)
+def model_router():
+    """Router for the stages of every run in this process, built from the routing config if there is one"""
+    path = config_path()
+    if path is None:
+        return ModelRouter(default_model, lambda: governor, STAGE_MODELS)
+    return ModelRouter.from_file(path, default_model, lambda: governor, STAGE_MODELS)
+
+def model_candidates():
+    """Models to try for the running task, in order: only the run's own model if it asked for one by name"""
+    run = current_run.get()
+    span = current_span.get()
+    return model_router().candidates(span.stage if span is not None else None, run.model_name if run is not None else None)
+
+def act_token_cap():
+    """The running run's `max_act_tokens` if the running task writes an act, else None"""
+    run = current_run.get()
+    span = current_span.get()
+    if run is None or span is None or span.stage not in ACT_STAGES:
+        return None
+    return run.max_act_tokens
+
+def call_settings(spec, timeout=None):
+    """Settings of a call on `spec`; acts are cut off at the run's `max_act_tokens`.
+
+    `timeout` (the seconds the governor leaves before the deadline) bounds the
+    request itself, so a hung blocking call cannot outlive its deadline.
+    """
+    settings = spec.call_kwargs()
+    if timeout is not None:
+        settings["timeout"] = timeout
+    cap = act_token_cap()
+    if cap:
+        settings["max_tokens"] = min(settings.get("max_tokens") or cap, cap)
+    return settings
+
+def completion_key(prompt, sample=0, spec=None):
+    """Cache key of a prompt (string or `PromptParts`) for a model spec and its settings.
+
+    `spec` defaults to the first model of the running stage, the one lookups
+    try; a completion is stored under the spec that actually wrote it, so one
+    written by a fallback model is never served as the primary model's.
+    Independent samples of one prompt (`sample` > 0), and acts capped at a
+    run's `max_act_tokens`, are cached separately.
+    """
+    if spec is None:
+        spec = model_candidates()[0]
+    llm = model_router().model(spec)
+    temperature = spec.temperature if spec.temperature is not None else getattr(llm, "temperature", None)
+    text = prompt_text(prompt) if not sample else f"{prompt_text(prompt)}\x00sample {sample}"
+    cap = act_token_cap()
+    if cap:
+        text = f"{text}\x00max_tokens {cap}"
+    return cache_key(getattr(llm, "model_name", type(llm).__name__), temperature, text)
+
+def cached_completion(key):
+    """Look up a completion in the response cache; returns (status, text) with status "hit", "miss" or "bypass" """
+    run = current_run.get()
+    if run is not None and not run.use_cache:
+        return "bypass", None
+    text = completion_cache().get(key)
+    if run is not None:
+        run.count_cache(text is not None)
+    return ("miss", None) if text is None else ("hit", text)
+
+def store_completion(key, text, parse=None):
+    """Parse the completion (when asked to) and cache it only once it is known to be usable.
+
+    A run that bypasses the cache neither reads nor writes it.
+    """
+    result = parse(text) if parse else text
+    run = current_run.get()
+    if run is None or run.use_cache:
+        completion_cache().put(key, text)
+    return result
+
+def trace_call(prompt, text, cache, response=None):
+    """Add a model call to the span of the running task, preferring the provider's token counts.
+
+    Besides the prompt tokens the provider served from its prefix cache, the
+    span gets the tokens of a prefix that was already sent earlier: what a
+    prefix cache could have reused.
+    """
+    usage = getattr(response, "usage_metadata", None) or {}
+    prompt_tokens = usage.get("input_tokens") or count_tokens(prompt_text(prompt))
+    completion_tokens = usage.get("output_tokens") or count_tokens(text)
+    span = current_span.get()
+    if span is not None:
+        prefix = prompt_prefix(prompt)
+        reusable = count_tokens(prefix) if cache != "hit" and sent_prefixes.seen(prefix) else 0
+        span.record_call(prompt_tokens, completion_tokens, cache, cached_prompt_tokens(response), reusable)
+    return prompt_tokens + completion_tokens
+
+def note_retry(error, delay):
+    """Count a governor retry against the running task"""
+    span = current_span.get()
+    if span is not None:
+        span.retries += 1
+
+class StreamInterrupted(RuntimeError):
+    """A streamed completion failed after some of its text was already shown; it cannot be retried"""
+
+def note_model(spec, failed=False):
+    """Record which model served the running task, and count the ones it fell back from"""
+    span = current_span.get()
+    if span is not None:
+        span.model = spec.label
+        span.fallbacks += failed
+
+def routed_call(call, estimate):
+    """Run `call(llm, settings)` on the running stage's models in turn until one succeeds.
+
+    Each model but the last gets `FALLBACK_RETRIES` retries from its governor;
+    the last one gets the governor's full retry allowance. Returns the result,
+    the governor that admitted the call and the spec of the model that answered.
+    """
+    router = model_router()
+    candidates = model_candidates()
+    for position, spec in enumerate(candidates):
+        last = position == len(candidates) - 1
+        llm, limiter = router.model(spec), router.governor(spec)
+        started = time.monotonic()
+        try:
+            result = limiter.call(lambda timeout: call(llm, call_settings(spec, timeout)), tokens=estimate, deadline=spec.timeout,
+                                  on_retry=note_retry, max_retries=None if last else FALLBACK_RETRIES)
+        except fallback_errors():
+            router.record(spec, time.monotonic() - started, ok=False)
+            if last:
+                raise
+            note_model(spec, failed=True)
+            continue
+        router.record(spec, time.monotonic() - started)
+        note_model(spec)
+        return result, limiter, spec
+
+async def arouted_call(call, estimate):
+    """Async version of routed_call; `call(llm, settings)` returns an awaitable"""
+    router = model_router()
+    candidates = model_candidates()
+    for position, spec in enumerate(candidates):
+        last = position == len(candidates) - 1
+        llm, limiter = router.model(spec), router.governor(spec)
+        started = time.monotonic()
+        try:
+            result = await limiter.acall(lambda timeout: call(llm, call_settings(spec, timeout)), tokens=estimate, deadline=spec.timeout,
+                                         on_retry=note_retry, max_retries=None if last else FALLBACK_RETRIES)
+        except fallback_errors():
+            router.record(spec, time.monotonic() - started, ok=False)
+            if last:
+                raise
+            note_model(spec, failed=True)
+            continue
+        router.record(spec, time.monotonic() - started)
+        note_model(spec)
+        return result, limiter, spec
+
+def get_completion(prompt, parse=None, sample=0):
+    """Helper function to get completion from ChatOpenAI; `parse` post-processes the text"""
+    key = completion_key(prompt, sample)
+    status, text = cached_completion(key)
+    if text is not None:
+        trace_call(prompt, text, status)
+        return parse(text) if parse else text
+    messages = prompt_messages(prompt, MARK_CACHEABLE_PREFIX)
+    estimate = count_tokens(prompt_text(prompt)) + EXPECTED_COMPLETION_TOKENS
+    response, limiter, spec = routed_call(lambda llm, settings: llm.invoke(messages, **settings), estimate)
+    limiter.charge(estimate, trace_call(prompt, response.content, status, response))
+    return store_completion(completion_key(prompt, sample, spec), response.content, parse)
+
+async def aget_completion(prompt, parse=None, sample=0):
+    """Async version of get_completion; runs on the shared event loop and connection pool.
+
+    The response cache is read and written on a worker thread, off the loop.
+    """
+    key = completion_key(prompt, sample)
+    status, text = await asyncio.to_thread(cached_completion, key)
+    if text is not None:
+        trace_call(prompt, text, status)
+        return parse(text) if parse else text
+    messages = prompt_messages(prompt, MARK_CACHEABLE_PREFIX)
+    estimate = count_tokens(prompt_text(prompt)) + EXPECTED_COMPLETION_TOKENS
+    response, limiter, spec = await arouted_call(lambda llm, settings: llm.ainvoke(messages, **settings), estimate)
+    limiter.charge(estimate, trace_call(prompt, response.content, status, response))
+    return await asyncio.to_thread(store_completion, completion_key(prompt, sample, spec), response.content, parse)
+
+def stream_completion(prompt, on_token):
+    """Stream a completion, calling `on_token` with each piece of text, and return the full text"""
+    key = completion_key(prompt)
+    status, text = cached_completion(key)
+    if text is not None:
+        trace_call(prompt, text, status)
+        on_token(text)
+        return text
+    messages = prompt_messages(prompt, MARK_CACHEABLE_PREFIX)
+
+    def consume(llm, settings):
+        chunks = []
+        try:
+            for chunk in llm.stream(messages, **settings):
+                if chunk.content:
+                    chunks.append(chunk.content)
+                    on_token(chunk.content)
+        except Exception as e:
+            # Retrying is only safe while nothing has been shown yet
+            if chunks:
+                raise StreamInterrupted(f"Stream failed after {len(chunks)} chunks") from e
+            raise
+        return "".join(chunks)
+
+    estimate = count_tokens(prompt_text(prompt)) + EXPECTED_COMPLETION_TOKENS
+    text, limiter, spec = routed_call(consume, estimate)
+    limiter.charge(estimate, trace_call(prompt, text, status))
+    return store_completion(completion_key(prompt, spec=spec), text)
+
+async def astream_completion(prompt, on_token):
+    """Async version of stream_completion"""
+    key = completion_key(prompt)
+    status, text = await asyncio.to_thread(cached_completion, key)
+    if text is not None:
+        trace_call(prompt, text, status)
+        on_token(text)
+        return text
+    messages = prompt_messages(prompt, MARK_CACHEABLE_PREFIX)
+
+    async def consume(llm, settings):
+        chunks = []
+        try:
+            async for chunk in llm.astream(messages, **settings):
+                if chunk.content:
+                    chunks.append(chunk.content)
+                    on_token(chunk.content)
+        except Exception as e:
+            if chunks:
+                raise StreamInterrupted(f"Stream failed after {len(chunks)} chunks") from e
+            raise
+        return "".join(chunks)
+
+    estimate = count_tokens(prompt_text(prompt)) + EXPECTED_COMPLETION_TOKENS
+    text, limiter, spec = await arouted_call(consume, estimate)
+    limiter.charge(estimate, trace_call(prompt, text, status))
+    return await asyncio.to_thread(store_completion, completion_key(prompt, spec=spec), text)
+
+def get_story_structure(story_prompt):
+    """Determine the appropriate story structure based on the given prompt"""
+    prompt = story_structure_chooser.format(story_prompt=story_prompt)
+    return get_completion(prompt)
+
+async def aget_story_structure(story_prompt):
+    """Async version of get_story_structure"""
+    prompt = story_structure_chooser.format(story_prompt=story_prompt)
+    return await aget_completion(prompt)
+
+def get_story_structure_summerize(story_structure):
+    """Summarize the determined story structure"""
+    prompt = summarize_story_structure.format(story_structure=story_structure)
+    return get_completion(prompt)
+
+async def aget_story_structure_summerize(story_structure):
+    """Async version of get_story_structure_summerize"""
+    prompt = summarize_story_structure.format(story_structure=story_structure)
+    return await aget_completion(prompt)
+
+def get_story_blue_print(story_structure_summarized, story_prompt):
+    """Generate a detailed story blueprint based on the summarized structure and original prompt"""
+    prompt = blueprint_prompt.format(story_structure=story_structure_summarized, story_prompt=story_prompt)
+    return get_completion(prompt)
+
+async def aget_story_blue_print(story_structure_summarized, story_prompt):
+    """Async version of get_story_blue_print"""
+    prompt = blueprint_prompt.format(story_structure=story_structure_summarized, story_prompt=story_prompt)
+    return await aget_completion(prompt)
+
+def get_story_blue_print_with_chapters(story_structure_summarized, story_prompt):
+    """Generate the blueprint with its chapter list as a JSON block at the end, in one call"""
+    prompt = blueprint_prompt.extend(blueprint_chapters_suffix).format(story_structure=story_structure_summarized, story_prompt=story_prompt)
+    return get_completion(prompt)
+
+async def aget_story_blue_print_with_chapters(story_structure_summarized, story_prompt):
+    """Async version of get_story_blue_print_with_chapters"""
+    prompt = blueprint_prompt.extend(blueprint_chapters_suffix).format(story_structure=story_structure_summarized, story_prompt=story_prompt)
+    return await aget_completion(prompt)
+
+def with_format_instructions(prompt, parser):
+    """`prompt` with the parser's format instructions at the end of its prefix, escaped for `format`"""
+    instructions = parser.get_format_instructions().replace("{", "{{").replace("}", "}}")
+    return PromptParts(f"{prompt.prefix}\n{instructions}\n", prompt.suffix)
+
+@lru_cache(maxsize=None)
+def chapter_json_request():
+    """Prompt template and parser that extract the chapters from a blueprint; the reply is read with `parse_chapters`.
+
+    Built once per process: the format instructions are the same for every
+    story, so they are filled into the prefix up front.
+    """
+    from langchain_core.output_parsers import JsonOutputParser
+    from output_schemas import Chapters
+    parser = JsonOutputParser(pydantic_object=Chapters)
+    return with_format_instructions(chapter_json_prompt, parser), parser
+
+def get_chapter_json(blueprint):
+    """Create a JSON object of chapters based on the story blueprint"""
+    prompt, parser = chapter_json_request()
+    return get_completion(prompt.format(story_blueprint=blueprint), parse=parse_chapters)
+
+async def aget_chapter_json(blueprint):
+    """Async version of get_chapter_json"""
+    prompt, parser = chapter_json_request()
+    return await aget_completion(prompt.format(story_blueprint=blueprint), parse=parse_chapters)
+
+def generate_acts(blueprint, chapter_number, chapter_title, chapter_desc):
+    """Generate three acts for a given chapter"""
+    prompt = act_generator_prompt.format(
+        story_blue_print=blueprint,
+        chapter_number=chapter_number,
+        chapter_title=chapter_title,
+        chapter_desc=chapter_desc
+    )
+    return get_completion(prompt)
+
+async def agenerate_acts(blueprint, chapter_number, chapter_title, chapter_desc):
+    """Async version of generate_acts"""
+    prompt = act_generator_prompt.format(
+        story_blue_print=blueprint,
+        chapter_number=chapter_number,
+        chapter_title=chapter_title,
+        chapter_desc=chapter_desc
+    )
+    return await aget_completion(prompt)
+
+def generate_acts_json(blueprint, chapter_number, chapter_title, chapter_desc):
+    """Generate the three acts of a chapter directly as JSON text"""
+    prompt = act_generator_prompt.extend(act_generator_json_suffix).format(
+        story_blue_print=blueprint,
+        chapter_number=chapter_number,
+        chapter_title=chapter_title,
+        chapter_desc=chapter_desc
+    )
+    return get_completion(prompt)
+
+async def agenerate_acts_json(blueprint, chapter_number, chapter_title, chapter_desc):
+    """Async version of generate_acts_json"""
+    prompt = act_generator_prompt.extend(act_generator_json_suffix).format(
+        story_blue_print=blueprint,
+        chapter_number=chapter_number,
+        chapter_title=chapter_title,
+        chapter_desc=chapter_desc
+    )
+    return await aget_completion(prompt)
+
+@lru_cache(maxsize=None)
+def acts_json_request():
+    """Prompt template and parser that turn plain-text acts into JSON; the reply is read with `parse_acts` (built once)"""
+    from langchain_core.output_parsers import JsonOutputParser
+    from output_schemas import Acts
+    parser = JsonOutputParser(pydantic_object=Acts)
+    return with_format_instructions(acts_json, parser), parser
+
+def convert_acts_to_json(acts_plain_text):
+    """Convert the generated acts into JSON format"""
+    prompt, parser = acts_json_request()
+    return get_completion(prompt.format(acts=acts_plain_text), parse=parse_acts)
+
+async def aconvert_acts_to_json(acts_plain_text):
+    """Async version of convert_acts_to_json"""
+    prompt, parser = acts_json_request()
+    return await aget_completion(prompt.format(acts=acts_plain_text), parse=parse_acts)
+
+def acts_repair_request(acts_plain_text, missing):
+    """Prompt asking only for the act fields that could not be read from a structured outline"""
+    return acts_repair_prompt.format(acts=acts_plain_text, missing=missing_fields_template(missing))
+
+def acts_from_outline(acts_plain_text):
+    """Read the acts of a structured outline locally; only missing fields cost another (small) call"""
+    try:
+        acts, missing = normalize_acts(extract_json(acts_plain_text))
+    except JsonRepairError:
+        # Not JSON after all: fall back to the conversion call
+        return convert_acts_to_json(acts_plain_text)
+    patch = get_completion(acts_repair_request(acts_plain_text, missing), parse=extract_json) if missing else None
+    return complete_acts(acts, patch)
+
+async def aacts_from_outline(acts_plain_text):
+    """Async version of acts_from_outline"""
+    try:
+        acts, missing = normalize_acts(extract_json(acts_plain_text))
+    except JsonRepairError:
+        return await aconvert_acts_to_json(acts_plain_text)
+    patch = await aget_completion(acts_repair_request(acts_plain_text, missing), parse=extract_json) if missing else None
+    return complete_acts(acts, patch)
+
+def format_act_prompt(prompt, blueprint, chapter_desc, act_number, chapter_number, act_description, act_writing_advice, previous_text="", original_prompt=""):
+    """Fill in the act-writing prompt; the instructions, blueprint and original prompt form its shared prefix"""
+    writing_advice = act_writing_advice if act_writing_advice != None else ""
+    format_dict = {
+        "story_blueprint": blueprint,
+        "chapter_desc": chapter_desc,
+        "act_number": act_number + 1,
+        "chapter_number": chapter_number,
+        "act_description": act_description,
+        "act_writing_advice": writing_advice,
+        "original_prompt": original_prompt
+    }
+    
+    # Only include previous_text if the placeholder exists in the prompt
+    if "{previous_text}" in prompt.suffix:
+        format_dict["previous_text"] = previous_text
+
+    return prompt.format(**format_dict)
+
+def write_act(prompt, blueprint, chapter_desc, act_number, chapter_number, act_description, act_writing_advice, previous_text="", original_prompt="", on_token=None, sample=0):
+    """Write the actual story text for a given act; with `on_token`, stream the text as it is generated"""
+    full_prompt = format_act_prompt(prompt, blueprint, chapter_desc, act_number, chapter_number, act_description, act_writing_advice, previous_text, original_prompt)
+    if on_token is None:
+        return get_completion(full_prompt, sample=sample)
+    return stream_completion(full_prompt, on_token)
+
+async def awrite_act(prompt, blueprint, chapter_desc, act_number, chapter_number, act_description, act_writing_advice, previous_text="", original_prompt="", on_token=None, sample=0):
+    """Async version of write_act"""
+    full_prompt = format_act_prompt(prompt, blueprint, chapter_desc, act_number, chapter_number, act_description, act_writing_advice, previous_text, original_prompt)
+    if on_token is None:
+        return await aget_completion(full_prompt, sample=sample)
+    return await astream_completion(full_prompt, on_token)
+
+class StoryRun:
+    """Options, task graph, checkpoint and trace for one run of the story pipeline"""
+
+    def __init__(self, prompt, max_concurrency=4, use_async=False, stream_acts=False, use_cache=True, checkpoint=None, context_budget=None, report_path=None, structured_output=False, model_name=None, max_chapters=None, speculative_acts=False, drafts_per_act=1, max_act_tokens=None, deadline=None, reuse_structure=True, structure_similarity=SIMILARITY_THRESHOLD, writer=None):
+        self.prompt = prompt
+        # Draft every act of a chapter at once from the act outlines, then bridge the seams that need it
+        self.speculative_acts = speculative_acts
+        self.drafts_per_act = drafts_per_act
+        self.structured_output = structured_output
+        self.model_name = model_name
+        self.max_chapters = max_chapters
+        # Caps the plan enforces once the chapters are known: completion tokens of every act, and
+        # seconds the whole run should take (chapters are dropped from the end to fit)
+        self.max_act_tokens = max_act_tokens
+        self.deadline = deadline
+        self.plan = None
+        # Take the structure analysis and summary of an earlier prompt at least this similar
+        # (when the response cache is used at all); the match is kept as `similar_structure`
+        self.reuse_structure = reuse_structure
+        self.structure_similarity = structure_similarity
+        self.similar_structure = None
+        self.max_concurrency = max_concurrency
+        self.use_async = use_async
+        self.stream_acts = stream_acts
+        self.use_cache = use_cache
+        self.checkpoint = checkpoint
+        self.context_budget = context_budget
+        self.report_path = report_path
+        # The story's `StoryWriter`: acts it has written are read back from the story file
+        self.writer = writer
+        self.trace = RunTrace()
+        graph_class = AsyncTaskGraph if use_async else TaskGraph
+        self.graph = graph_class(max_workers=max_concurrency, on_error=self._task_failed)
+        self.streams = {}
+        # Acts whose task failed (or never ran because a task before it failed); they get no stream
+        self._failed_acts = set()
+        # Tokens of each finished act as it appears in an act prompt, by (chapter number, act index)
+        self._act_tokens = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._lock = threading.Lock()
+
+    def add(self, key, func, deps=(), then=None):
+        """Add a task to the graph; while it runs, `current_run` points at this run.
+
+        Results are recorded in the checkpoint, and a stage the checkpoint already
+        has is restored instead of run again. `then` is called with the result
+        (fresh or restored) before the task counts as done, to queue follow-up tasks.
+        """
+        def finish(result):
+            if self.checkpoint is not None and key not in self.checkpoint:
+                self.checkpoint.record(key, result)
+            if then is not None:
+                then(result)
+            return result
+
+        if self.use_async:
+            # Checkpoint writes (and reads of restored stages) go to a worker thread,
+            # so they never hold up the other runs on the shared event loop
+            async def task(*args):
+                with self.task_context(key) as span:
+                    if self.restored(key):
+                        span.cache = "restored"
+                        return await asyncio.to_thread(lambda: finish(self.checkpoint.get(key)))
+                    result = await func(*args)
+                    return await asyncio.to_thread(finish, result)
+        else:
+            def task(*args):
+                with self.task_context(key) as span:
+                    if self.restored(key):
+                        span.cache = "restored"
+                        return finish(self.checkpoint.get(key))
+                    return finish(func(*args))
+        return self.graph.add(key, task, deps)
+
+    @contextmanager
+    def task_context(self, key):
+        """Point `current_run` and `current_span` at this run and task while it executes, and time it"""
+        span = self.trace.start(key, self.graph.queued_seconds(key))
+        run_token = current_run.set(self)
+        span_token = current_span.set(span)
+        started = time.monotonic()
+        try:
+            yield span
+        except BaseException as e:
+            span.error = repr(e)
+            raise
+        finally:
+            span.wall_seconds = time.monotonic() - started
+            current_span.reset(span_token)
+            current_run.reset(run_token)
+
+    def restored(self, key):
+        """Whether the stage `key` comes from the checkpoint of an earlier run"""
+        return self.checkpoint is not None and key in self.checkpoint
+
+    def count_cache(self, hit):
+        with self._lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def act_stream(self, chapter_number, act_index):
+        """Token stream of an act; shared by the task writing it and whoever displays it"""
+        # Drafted acts are picked and joined after they are written, so there is nothing to stream
+        if not self.stream_acts or self.speculative_acts or self.restored(("act", chapter_number, act_index)):
+            return None
+        with self._lock:
+            if (chapter_number, act_index) in self._failed_acts:
+                return None
+            return self.streams.setdefault((chapter_number, act_index), TokenStream())
+
+    def _task_failed(self, key, error):
+        """End the stream of a failed act, so whoever reads it stops waiting and gets the error from `result`"""
+        if not (isinstance(key, tuple) and key[0] == "act"):
+            return
+        with self._lock:
+            self._failed_acts.add(key[1:])
+            stream = self.streams.get(key[1:])
+        if stream is not None:
+            stream.close()
+
+    def result(self, key):
+        return self.graph.result(key)
+
+    def act_text(self, chapter_number, act_index):
+        """Text of a finished act: from the story file once it was written there, else from its task"""
+        if self.writer is not None and self.writer.has_act(chapter_number, act_index + 1):
+            return self.writer.act_text(chapter_number, act_index + 1)
+        text = self.result(("act", chapter_number, act_index))
+        if text is None:
+            # Released since: the writer has it now
+            return self.writer.act_text(chapter_number, act_index + 1)
+        return text
+
+    def act_tokens(self, chapter_number, act_index):
+        """Tokens of a finished act in an act prompt; the act is read and counted once per run"""
+        key = (chapter_number, act_index)
+        with self._lock:
+            tokens = self._act_tokens.get(key)
+        if tokens is None:
+            tokens = count_tokens("\n" + self.act_text(chapter_number, act_index))
+            with self._lock:
+                self._act_tokens[key] = tokens
+        return tokens
+
+    def release_act(self, chapter_number, act_index):
+        """Forget the texts of an act, its drafts and its bridge once the writer has put the act in the story file"""
+        self.graph.release(("act", chapter_number, act_index))
+        self.graph.release(("bridge", chapter_number, act_index))
+        for sample in range(self.drafts_per_act):
+            self.graph.release(("draft", chapter_number, act_index, sample))
+        self.streams.pop((chapter_number, act_index), None)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.graph.__exit__(exc_type, exc, tb)
+        self.trace.finish()
+        if self.report_path is not None:
+            # Written for failed runs too, which are often the interesting ones
+            self.trace.write_json(self.report_path.with_name(self.report_path.name + ".json"))
+            self.trace.write_csv(self.report_path.with_name(self.report_path.name + ".csv"))
+
+def act_prompt_for(act_index):
+    """Acts after the first also get the text written so far in the chapter"""
+    act_prompt = write_act_prompt
+    if act_index > 0:
+        act_prompt = act_prompt.extend(write_act_extra)
+    return act_prompt
+
+class EarlierActs(Sequence):
+    """The acts before `act_index` in a chapter, each read only when it is asked for"""
+
+    def __init__(self, run, chapter_number, act_index):
+        self.run = run
+        self.chapter_number = chapter_number
+        self.act_index = act_index
+
+    def __len__(self):
+        return self.act_index
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.run.act_text(self.chapter_number, index)
+
+def act_request(run, blueprint, chapter_title, chapter_desc, chapter_number, acts, act_index, previous_acts):
+    """Keyword arguments for write_act; with a context budget the blueprint and earlier text are condensed"""
+    act_content = list(acts.values())[act_index]
+    request = {
+        "prompt": act_prompt_for(act_index),
+        "blueprint": blueprint,
+        "chapter_desc": chapter_desc,
+        "act_number": act_index,
+        "chapter_number": chapter_number,
+        "act_description": act_content["description"],
+        "act_writing_advice": act_content.get("writingAdvice", None),
+        "previous_text": "",
+        "original_prompt": run.prompt,
+    }
+    budget = run.context_budget
+    if budget is None:
+        return dict(request, previous_text="".join("\n" + text for text in previous_acts))
+    earlier_descriptions = [content["description"] for content in list(acts.values())[:act_index]]
+    bounded = dict(
+        request,
+        blueprint=budget.blueprint_for(blueprint, chapter_title),
+        previous_text=budget.previous_text(previous_acts, earlier_descriptions),
+    )
+    # The unbounded prompt is counted in parts: the earlier acts by their token counts, not their text
+    full_tokens = count_tokens(format_act_prompt(**request).text) + sum(run.act_tokens(chapter_number, index) for index in range(len(previous_acts)))
+    budget.record(count_tokens(format_act_prompt(**bounded).text), full_tokens)
+    return bounded
+
+def write_act_task(run, blueprint, chapter_title, chapter_desc, chapter_number, acts, act_index, previous_act=None):
+    """Write one act, continuing from the acts of the same chapter written before it.
+
+    The task waits for the act just before it (`previous_act`); the earlier
+    text is read on demand, from the story file where it is already written.
+    """
+    stream = run.act_stream(chapter_number, act_index)
+    try:
+        request = act_request(run, blueprint, chapter_title, chapter_desc, chapter_number, acts, act_index, EarlierActs(run, chapter_number, act_index))
+        return write_act(**request, on_token=stream and stream.put)
+    finally:
+        if stream:
+            stream.close()
+
+async def awrite_act_task(run, blueprint, chapter_title, chapter_desc, chapter_number, acts, act_index, previous_act=None):
+    """Async version of write_act_task; the earlier acts are read from disk on a worker thread"""
+    stream = run.act_stream(chapter_number, act_index)
+    try:
+        request = await asyncio.to_thread(act_request, run, blueprint, chapter_title, chapter_desc, chapter_number, acts, act_index, EarlierActs(run, chapter_number, act_index))
+        return await awrite_act(**request, on_token=stream and stream.put)
+    finally:
+        if stream:
+            stream.close()
+
+def draft_prompt_for(act_index):
+    act_prompt = write_act_prompt
+    if act_index > 0:
+        act_prompt = act_prompt.extend(write_act_draft_extra)
+    return act_prompt
+
+def draft_request(run, blueprint, chapter_title, chapter_desc, chapter_number, acts, act_index):
+    """Keyword arguments for write_act when drafting an act before the acts ahead of it are written"""
+    request = act_request(run, blueprint, chapter_title, chapter_desc, chapter_number, acts, act_index, ())
+    earlier_descriptions = [content["description"] for content in list(acts.values())[:act_index]]
+    return dict(request, prompt=draft_prompt_for(act_index), previous_text="".join(f"\n- {description}" for description in earlier_descriptions))
+
+def draft_act_task(run, blueprint, chapter_title, chapter_desc, chapter_number, acts, act_index, sample):
+    """Draft one act from the outlines alone; sample n of an act is an independent completion"""
+    return write_act(**draft_request(run, blueprint, chapter_title, chapter_desc, chapter_number, acts, act_index), sample=sample)
+
+async def adraft_act_task(run, blueprint, chapter_title, chapter_desc, chapter_number, acts, act_index, sample):
+    """Async version of draft_act_task"""
+    return await awrite_act(**draft_request(run, blueprint, chapter_title, chapter_desc, chapter_number, acts, act_index), sample=sample)
+
+def bridge_request(run, blueprint, chapter_title, previous_act, draft, issues):
+    if run.context_budget is not None:
+        blueprint = run.context_budget.blueprint_for(blueprint, chapter_title)
+    return bridge_prompt.format(
+        story_blueprint=blueprint,
+        previous_tail=" ".join(words(previous_act)[-BRIDGE_CONTEXT_WORDS:]),
+        draft_head=" ".join(draft.split()[:BRIDGE_CONTEXT_WORDS]),
+        issues="; ".join(issues),
+    )
+
+def pick_draft(acts, act_index, drafts):
+    return best_draft(drafts, list(acts.values())[act_index]["description"])
+
+def bridge_task(run, blueprint, chapter_title, chapter_number, acts, act_index, previous_act, *drafts):
+    """Pick the best draft of an act and check it follows on from the act before it; write a bridge only if not.
+
+    The task waits for the act before it (`previous_act`), whose text is read
+    through the run: by now it may only be in the story file.
+    """
+    previous_act = run.act_text(chapter_number, act_index - 1)
+    choice = pick_draft(acts, act_index, drafts)
+    issues = continuity_issues(previous_act, drafts[choice])
+    bridge = get_completion(bridge_request(run, blueprint, chapter_title, previous_act, drafts[choice], issues)) if issues else ""
+    return {"draft": choice, "issues": issues, "bridge": bridge}
+
+async def abridge_task(run, blueprint, chapter_title, chapter_number, acts, act_index, previous_act, *drafts):
+    """Async version of bridge_task"""
+    previous_act = await asyncio.to_thread(run.act_text, chapter_number, act_index - 1)
+    choice = pick_draft(acts, act_index, drafts)
+    issues = continuity_issues(previous_act, drafts[choice])
+    bridge = await aget_completion(bridge_request(run, blueprint, chapter_title, previous_act, drafts[choice], issues)) if issues else ""
+    return {"draft": choice, "issues": issues, "bridge": bridge}
+
+def join_act(acts, act_index, seam, *drafts):
+    """Final text of a drafted act: the chosen draft, after its bridge if it needed one"""
+    if seam is None:
+        return drafts[pick_draft(acts, act_index, drafts)]
+    draft = drafts[seam["draft"]]
+    return f"{seam['bridge'].strip()}\n\n{draft}" if seam["bridge"].strip() else draft
+
+async def ajoin_act(acts, act_index, seam, *drafts):
+    return join_act(acts, act_index, seam, *drafts)
+
+def queue_drafted_acts(run, blueprint, chapter_number, chapter_title, chapter_desc, acts):
+    """Queue every act of a chapter as parallel drafts, then a cheap join per act.
+
+    Each act only waits for the join of the act before it, which is local
+    unless the continuity check asks the model for a bridging passage.
+    """
+    draft = adraft_act_task if run.use_async else draft_act_task
+    bridge = abridge_task if run.use_async else bridge_task
+    join = ajoin_act if run.use_async else join_act
+    for act_index in range(len(acts)):
+        key = ("act", chapter_number, act_index)
+        if run.restored(key):
+            run.add(key, join)
+            continue
+        draft_keys = [("draft", chapter_number, act_index, sample) for sample in range(run.drafts_per_act)]
+        for sample, draft_key in enumerate(draft_keys):
+            run.add(draft_key, partial(draft, run, blueprint, chapter_title, chapter_desc, chapter_number, acts, act_index, sample))
+        if act_index == 0:
+            run.add(key, partial(join, acts, act_index, None), deps=draft_keys)
+            continue
+        bridge_key = ("bridge", chapter_number, act_index)
+        run.add(bridge_key, partial(bridge, run, blueprint, chapter_title, chapter_number, acts, act_index), deps=[("act", chapter_number, act_index - 1)] + draft_keys)
+        run.add(key, partial(join, acts, act_index), deps=[bridge_key] + draft_keys)
+
+def queue_chapter_acts(run, blueprint, chapter_number, chapter_title, chapter_desc, acts):
+    """Queue one task per act, each waiting for the act before it in the chapter"""
+    if run.speculative_acts:
+        return queue_drafted_acts(run, blueprint, chapter_number, chapter_title, chapter_desc, acts)
+    task = awrite_act_task if run.use_async else write_act_task
+    for act_index in range(len(acts)):
+        key = ("act", chapter_number, act_index)
+        deps = [("act", chapter_number, act_index - 1)] if act_index else []
+        run.add(key, partial(task, run, blueprint, chapter_title, chapter_desc, chapter_number, acts, act_index), deps=deps)
+
+def queue_chapters(run, blueprint, chapters):
+    """Queue the act outline of every chapter at once; each only depends on the blueprint"""
+    if run.structured_output:
+        outline = agenerate_acts_json if run.use_async else generate_acts_json
+        convert = aacts_from_outline if run.use_async else acts_from_outline
+    else:
+        outline = agenerate_acts if run.use_async else generate_acts
+        convert = aconvert_acts_to_json if run.use_async else convert_acts_to_json
+    for chapter_index, (chapter_title, chapter_desc) in enumerate(chapters.items()):
+        chapter_number = chapter_index + 1
+        run.add(("acts", chapter_number), partial(outline, blueprint, chapter_number, chapter_title, chapter_desc))
+        run.add(("acts_json", chapter_number), convert, deps=[("acts", chapter_number)], then=partial(queue_chapter_acts, run, blueprint, chapter_number, chapter_title, chapter_desc))
+
+def get_chapters(blueprint):
+    """Chapter titles and descriptions of a blueprint"""
+    return get_chapter_json(blueprint)["chapters"]
+
+async def aget_chapters(blueprint):
+    """Async version of get_chapters"""
+    return (await aget_chapter_json(blueprint))["chapters"]
+
+def blueprint_from_draft(draft):
+    """The blueprint text of a structured draft, without its chapter JSON block"""
+    return split_blueprint(draft)[0]
+
+async def ablueprint_from_draft(draft):
+    return blueprint_from_draft(draft)
+
+def chapters_from_draft(draft, blueprint):
+    """Chapters from the JSON block of a structured draft; asks the model only if the block is unusable"""
+    chapters = split_blueprint(draft)[1]
+    return chapters["chapters"] if chapters is not None else get_chapters(blueprint)
+
+async def achapters_from_draft(draft, blueprint):
+    """Async version of chapters_from_draft"""
+    chapters = split_blueprint(draft)[1]
+    return chapters["chapters"] if chapters is not None else await aget_chapters(blueprint)
+
+def structure_namespace(run):
+    """Structure cache entries are kept apart per model that analysed the prompt"""
+    spec = model_router().candidates("structure", run.model_name)[0]
+    llm = model_router().model(spec)
+    return f"structure/{getattr(llm, 'model_name', type(llm).__name__)}"
+
+def reuse_structure(run, func):
+    """Wrap the structure step so a run that allows it takes the analysis stored for a similar prompt instead"""
+    def similar():
+        if not (run.use_cache and run.reuse_structure):
+            return None
+        match = structure_cache().lookup(structure_namespace(run), run.prompt, run.structure_similarity)
+        if match is not None:
+            run.similar_structure = match
+            current_span.get().cache = "similar"
+        return match
+
+    if run.use_async:
+        async def step(prompt):
+            match = await asyncio.to_thread(similar)
+            return match.value["structure"] if match is not None else await func(prompt)
+    else:
+        def step(prompt):
+            match = similar()
+            return match.value["structure"] if match is not None else func(prompt)
+    return step
+
+def remember_structure(run, func):
+    """Wrap the summary step: reuse the summary that came with a similar prompt's structure, or store a fresh one"""
+    def similar():
+        match = run.similar_structure
+        if match is not None:
+            current_span.get().cache = "similar"
+        return match
+
+    def store(structure, summary):
+        structure_cache().put(structure_namespace(run), run.prompt, {"structure": structure, "structure_summary": summary})
+        return summary
+
+    if run.use_async:
+        async def step(structure):
+            match = similar()
+            return match.value["structure_summary"] if match is not None else await asyncio.to_thread(store, structure, await func(structure))
+    else:
+        def step(structure):
+            match = similar()
+            return match.value["structure_summary"] if match is not None else store(structure, func(structure))
+    return step
+
+def first_chapters(chapters, max_chapters):
+    return dict(list(chapters.items())[:max_chapters])
+
+def plan_calls(stats, chapters, blueprint=None, prompt="", after=(), structured_output=False, speculative_acts=False, drafts_per_act=1, max_act_tokens=None, context_budget=None):
+    """The calls writing `chapters` will make, mirroring `queue_chapters` and `queue_chapter_acts`.
+
+    With the `blueprint`, prompt sizes are counted from the actual prompts
+    (the outlines and text acts continue from are estimated); without it, they
+    are the sizes earlier runs saw. The act outlines wait for the calls in
+    `after`. Every seam between drafted acts is counted as needing a bridge.
+    """
+    act_tokens = stats.completion_tokens("act", max_act_tokens)
+    draft_tokens = stats.completion_tokens("draft", max_act_tokens)
+    # Each act prompt gets about a third of the chapter's act outlines
+    outline_tokens = stats.completion_tokens("acts_json") // ACTS_PER_CHAPTER
+    outline_prompt = act_generator_prompt.extend(act_generator_json_suffix) if structured_output else act_generator_prompt
+    calls = []
+
+    def call(key, prompt_tokens, completion_tokens, deps):
+        calls.append(PlannedCall(key, prompt_tokens, completion_tokens, stats.seconds(completion_tokens), deps))
+
+    def act_prompt_tokens(stage, act_prompt, chapter_blueprint, chapter_desc, chapter_number, act_index, context_tokens):
+        if blueprint is None:
+            return stats.prompt_tokens(stage)
+        instructions = format_act_prompt(act_prompt, chapter_blueprint, chapter_desc, act_index, chapter_number, "", "", "", prompt)
+        return count_tokens(instructions.text) + outline_tokens + context_tokens
+
+    for chapter_index, (chapter_title, chapter_desc) in enumerate(chapters.items()):
+        chapter_number = chapter_index + 1
+        chapter_blueprint = blueprint
+        if blueprint is not None and context_budget is not None:
+            chapter_blueprint = context_budget.blueprint_for(blueprint, chapter_title)
+        outline_key = ("acts", chapter_number)
+        if blueprint is None:
+            outline_size = stats.prompt_tokens("acts")
+        else:
+            outline_size = count_tokens(outline_prompt.format(story_blue_print=blueprint, chapter_number=chapter_number, chapter_title=chapter_title, chapter_desc=chapter_desc).text)
+        call(outline_key, outline_size, stats.completion_tokens("acts"), after)
+        acts_key = outline_key
+        if not structured_output:
+            acts_key = ("acts_json", chapter_number)
+            if blueprint is None:
+                conversion_size = stats.prompt_tokens("acts_json")
+            else:
+                conversion_size = count_tokens(acts_json_request()[0].format(acts="").text) + stats.completion_tokens("acts")
+            call(acts_key, conversion_size, stats.completion_tokens("acts_json"), [outline_key])
+
+        if not speculative_acts:
+            previous = []
+            for act_index in range(ACTS_PER_CHAPTER):
+                # The chapter so far, or its condensed form under a context budget
+                context_tokens = act_tokens * act_index
+                if context_budget is not None:
+                    context_tokens = min(context_tokens, context_budget.recent_tokens + outline_tokens * act_index)
+                key = ("act", chapter_number, act_index)
+                size = act_prompt_tokens("act", act_prompt_for(act_index), chapter_blueprint, chapter_desc, chapter_number, act_index, context_tokens)
+                call(key, size, act_tokens, [acts_key] + previous[-1:])
+                previous.append(key)
+            continue
+
+        # A drafted act is done once its bridge is (the first act, once its drafts are)
+        done = []
+        for act_index in range(ACTS_PER_CHAPTER):
+            drafts = [("draft", chapter_number, act_index, sample) for sample in range(drafts_per_act)]
+            size = act_prompt_tokens("draft", draft_prompt_for(act_index), chapter_blueprint, chapter_desc, chapter_number, act_index, outline_tokens * act_index)
+            for key in drafts:
+                call(key, size, draft_tokens, [acts_key])
+            if not act_index:
+                done = drafts
+                continue
+            key = ("bridge", chapter_number, act_index)
+            if blueprint is None:
+                size = stats.prompt_tokens("bridge")
+            else:
+                size = count_tokens(bridge_prompt.format(story_blueprint=chapter_blueprint, previous_tail="", draft_head="", issues="").text)
+                size += round(2 * BRIDGE_CONTEXT_WORDS * TOKENS_PER_WORD)
+            call(key, size, stats.completion_tokens("bridge"), done + drafts)
+            done = [key]
+    return calls
+
+def plan_story(run, chapters, blueprint):
+    """Plan the rest of a run once its chapters are known, cut to its `max_chapters` and `deadline`.
+
+    The plan is kept as `run.plan`; its chapters are the ones the run writes.
+    """
+    folder = run.checkpoint.story_file.parent if run.checkpoint is not None else STORIES_FOLDER
+    stats = StageStats.from_traces(folder)
+    notes = []
+    if run.max_chapters is not None and len(chapters) > run.max_chapters:
+        notes.append(f"kept the first {run.max_chapters} of {len(chapters)} chapters")
+        chapters = first_chapters(chapters, run.max_chapters)
+    calls = plan_calls(stats, chapters, blueprint, run.prompt, (), run.structured_output, run.speculative_acts, run.drafts_per_act, run.max_act_tokens, run.context_budget)
+    run.plan = StoryPlan(chapters, calls, run.max_concurrency, run.trace.wall_seconds, notes).fit_deadline(run.deadline)
+    return run.plan
+
+def plan_chapters(run, func):
+    """Wrap a chapters step (whose last argument is the blueprint) so it returns the chapters `plan_story` keeps"""
+    if run.use_async:
+        async def planned(*args):
+            # Reads the traces of earlier runs, so off the event loop
+            chapters = await func(*args)
+            return (await asyncio.to_thread(plan_story, run, chapters, args[-1])).chapters
+    else:
+        def planned(*args):
+            return plan_story(run, func(*args), args[-1]).chapters
+    return planned
+
+def estimate_story(max_concurrency=4, max_chapters=None, deadline=None, folder=STORIES_FOLDER, structured_output=False, speculative_acts=False, drafts_per_act=1, max_act_tokens=None, context_budget=None, **options):
+    """Plan of a whole story before any call is made, from the sizes and timings of earlier runs in `folder`.
+
+    Takes the options of `StoryRun` (those that do not change the cost are
+    ignored). The chapter count is `max_chapters`, or what earlier runs had.
+    """
+    stats = StageStats.from_traces(folder)
+    prelude = ["structure", "structure_summary", "blueprint_draft" if structured_output else "blueprint"]
+    if not structured_output:
+        prelude.append("chapters")
+    calls = [PlannedCall(stage, stats.prompt_tokens(stage), stats.completion_tokens(stage), stats.seconds(stats.completion_tokens(stage)), prelude[:index][-1:])
+             for index, stage in enumerate(prelude)]
+    count = min(max_chapters, stats.chapters) if max_chapters else stats.chapters
+    chapters = {f"Chapter {number}": "" for number in range(1, count + 1)}
+    calls += plan_calls(stats, chapters, after=prelude[-1:], structured_output=structured_output, speculative_acts=speculative_acts,
+                        drafts_per_act=drafts_per_act, max_act_tokens=max_act_tokens, context_budget=context_budget)
+    return StoryPlan(chapters, calls, max_concurrency).fit_deadline(deadline)
+
+def queue_story(run):
+    """Queue the whole pipeline for a run; chapters and acts are added to the graph as they become known.
+
+    Blocking step functions run on a `TaskGraph`; with `use_async` every call is
+    a coroutine on the shared event loop instead. With `structured_output` the
+    blueprint call also returns the chapter list, which is then read locally.
+    """
+    prompt = run.prompt
+    # The blueprint is a dependency of "chapters", so reading it here never blocks
+    queue_all_chapters = lambda chapters: queue_chapters(run, run.result("blueprint"), chapters)
+    plan = partial(plan_chapters, run)
+    # A blueprint restored from a run without structured output has no chapter block to read
+    if run.structured_output and not run.restored("blueprint"):
+        draft = aget_story_blue_print_with_chapters if run.use_async else get_story_blue_print_with_chapters
+        run.add("structure", partial(reuse_structure(run, aget_story_structure if run.use_async else get_story_structure), prompt))
+        run.add("structure_summary", remember_structure(run, aget_story_structure_summerize if run.use_async else get_story_structure_summerize), deps=["structure"])
+        run.add("blueprint_draft", partial(draft, story_prompt=prompt), deps=["structure_summary"])
+        run.add("blueprint", ablueprint_from_draft if run.use_async else blueprint_from_draft, deps=["blueprint_draft"])
+        run.add("chapters", plan(achapters_from_draft if run.use_async else chapters_from_draft), deps=["blueprint_draft", "blueprint"], then=queue_all_chapters)
+    elif run.use_async:
+        run.add("structure", partial(reuse_structure(run, aget_story_structure), prompt))
+        run.add("structure_summary", remember_structure(run, aget_story_structure_summerize), deps=["structure"])
+        run.add("blueprint", partial(aget_story_blue_print, story_prompt=prompt), deps=["structure_summary"])
+        run.add("chapters", plan(aget_chapters), deps=["blueprint"], then=queue_all_chapters)
+    else:
+        run.add("structure", partial(reuse_structure(run, get_story_structure), prompt))
+        run.add("structure_summary", remember_structure(run, get_story_structure_summerize), deps=["structure"])
+        run.add("blueprint", partial(get_story_blue_print, story_prompt=prompt), deps=["structure_summary"])
+        run.add("chapters", plan(get_chapters), deps=["blueprint"], then=queue_all_chapters)
+    return run
+
+
+def file_name_prompt(prompt):
+    """URL-encoded start of the prompt (at most 50 characters), cut to whole characters within FILE_NAME_PROMPT_CHARS"""
+    encoded = ""
+    for char in prompt[:50]:
+        quoted = quote(char, safe="")
+        if len(encoded) + len(quoted) > FILE_NAME_PROMPT_CHARS:
+            break
+        encoded += quoted
+    return encoded
+
+def new_story_file(prompt, folder=STORIES_FOLDER):
+    """Create a new, empty story file named after its creation time and the URL-encoded start of the prompt.
+
+    Stories with the same prompt started in the same second (batches, parallel
+    jobs) take the next free second instead of sharing a file. Non-Latin
+    prompts encode to long names, so the prompt part is capped; the full prompt
+    is kept in the story's container.
+    """
+    folder = Path(folder)
+    folder.mkdir(exist_ok=True)
+    safe_prompt = file_name_prompt(prompt)
+    created = datetime.now()
+    while True:
+        story_file = folder / f"story_{created.strftime('%Y%m%d_%H%M%S')}_{safe_prompt}.md"
+        try:
+            with open(story_file, "x"):
+                return story_file
+        except FileExistsError:
+            created += timedelta(seconds=1)
+
+def story_library(folder=STORIES_FOLDER):
+    """Library index of the stories saved in `folder`"""
+    return shared_library(str(Path(folder) / LIBRARY_DB.name))
+
+def story_writer(story_file, prompt):
+    """Writer of one story file and its container, indexed in the library of its folder; call `start` to (re)write it from the header"""
+    return StoryWriter(story_file, prompt, story_library(Path(story_file).parent), store=StoryStore(store_path(story_file)))
+
+def write_story(prompt, story_file=None, resume_from=None, on_progress=None, context=None, **options):
+    """Run the whole pipeline without a UI and write the story file; returns its path.
+
+    `options` are `StoryRun` options (acts are never streamed here). `on_progress`
+    is called with a message and the finished fraction of the story as each
+    part is written. With `resume_from`, finished stages come from that checkpoint.
+    Progress is logged through `context` (a job's or session's `RunContext`; by
+    default one of its own, tagged with the story file's name).
+    """
+    progress = on_progress or (lambda message, fraction: None)
+    if resume_from is not None:
+        checkpoint = Checkpoint.load(resume_from)
+        prompt = checkpoint.prompt
+    else:
+        checkpoint = Checkpoint.for_story(story_file if story_file is not None else new_story_file(prompt), prompt)
+    story_file = checkpoint.story_file
+    report_path = story_file.with_name(story_file.stem + ".trace")
+    context = context if context is not None else RunContext(story_file.stem)
+    writer = story_writer(story_file, prompt).start()
+
+    def report(message, fraction):
+        context.log(f"{story_file.name}: {message}")
+        progress(message, fraction)
+
+    options["stream_acts"] = False
+    run = StoryRun(prompt, checkpoint=checkpoint, report_path=report_path, writer=writer, **options)
+    with context.writing(story_file, writer, run), writer, queue_story(run):
+        # The outline stages are a small share of the work; the acts are the rest
+        for stage, fraction in (("structure", 0.02), ("structure_summary", 0.04), ("blueprint", 0.08), ("chapters", 0.1)):
+            run.result(stage)
+            report(f"{stage.replace('_', ' ').capitalize()} done", fraction)
+            if stage == "structure" and run.similar_structure is not None:
+                match = run.similar_structure
+                report(f"Structure reused from a {match.similarity:.0%} similar prompt: {match.prompt}", fraction)
+        writer.set_title(story_title(run.result("blueprint")))
+        chapters = run.result("chapters")
+        if run.plan is not None:
+            report(f"Plan: {run.plan.report()}", 0.1)
+        acts_total = ACTS_PER_CHAPTER * len(chapters)
+        acts_done = 0
+        for chapter_index, chapter_title in enumerate(chapters):
+            chapter_number = chapter_index + 1
+            writer.chapter(chapter_number, chapter_title)
+            acts = run.result(("acts_json", chapter_number))
+            for act_index in range(len(acts)):
+                act_text = run.result(("act", chapter_number, act_index))
+                writer.add_act(chapter_number, chapter_title, act_index + 1, act_text)
+                run.release_act(chapter_number, act_index)
+                acts_done += 1
+                report(f"Chapter {chapter_number}, act {act_index + 1} written", min(1.0, 0.1 + 0.9 * acts_done / acts_total))
+        writer.finish()
+    checkpoint.finish()
+    report("Story complete", 1.0)
+    return story_file
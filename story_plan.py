@@ -0,0 +1,203 @@
+"""Predict the calls, tokens and time a story will take, and trim it to the run's caps before its acts are written.
+
+A plan lists the model calls still to make, each with its prompt size (counted
+locally with `count_tokens` wherever the prompt is already known), its
+expected completion size and duration, and the calls it waits for. Completion
+sizes and the latency model come from the traces earlier runs left next to
+their stories. Replaying the calls on `max_concurrency` workers gives the
+expected wall time, and chapters are dropped from the end until the story
+fits the run's deadline.
+"""
+import heapq
+import json
+import statistics
+from pathlib import Path
+
+# Traces of this many of the newest stories are read for the statistics
+TRACE_HISTORY = 50
+# Prompt and completion tokens per call of each stage until earlier runs have been traced
+DEFAULT_PROMPT_TOKENS = {
+    "structure": 3500, "structure_summary": 900, "blueprint": 1200, "blueprint_draft": 1300, "chapters": 2300,
+    "acts": 2600, "acts_json": 1100, "act": 3500, "draft": 3000, "bridge": 1300,
+}
+DEFAULT_COMPLETION_TOKENS = {
+    "structure": 700, "structure_summary": 300, "blueprint": 1500, "blueprint_draft": 1800, "chapters": 400,
+    "acts": 600, "acts_json": 500, "act": 1500, "draft": 1500, "bridge": 150,
+}
+# Seconds before the first token, and per completion token, until earlier runs have been traced
+DEFAULT_LATENCY = 1.5
+DEFAULT_SECONDS_PER_TOKEN = 1 / 40
+# Chapters assumed before the chapter list is known
+DEFAULT_CHAPTERS = 5
+# Calls a latency fit needs
+MIN_FIT_CALLS = 5
+# Tokens per word of English prose, for text only known by its word count
+TOKENS_PER_WORD = 1.3
+
+
+def duration(seconds):
+    if seconds >= 120:
+        return f"{seconds / 60:.1f} minutes"
+    return f"{round(seconds)} second{'' if round(seconds) == 1 else 's'}"
+
+
+class StageStats:
+    """Typical prompt and completion sizes per stage, and seconds per call, from earlier runs"""
+
+    def __init__(self, prompt_tokens=None, completion_tokens=None, latency=DEFAULT_LATENCY, seconds_per_token=DEFAULT_SECONDS_PER_TOKEN, chapters=DEFAULT_CHAPTERS, runs=0):
+        self.prompt = {**DEFAULT_PROMPT_TOKENS, **(prompt_tokens or {})}
+        self.completion = {**DEFAULT_COMPLETION_TOKENS, **(completion_tokens or {})}
+        self.latency = latency
+        self.seconds_per_token = seconds_per_token
+        self.chapters = chapters
+        self.runs = runs
+
+    @classmethod
+    def from_traces(cls, folder, limit=TRACE_HISTORY):
+        """Statistics of the newest `limit` traces (`story_*.trace.json`) in `folder`; defaults where there are none.
+
+        Only calls that reached a model count: cache hits and stages restored
+        from a checkpoint say nothing about the provider.
+        """
+        paths = sorted(Path(folder).glob("*.trace.json"), key=lambda path: path.stat().st_mtime, reverse=True)[:limit]
+        prompts, completions, points, chapter_counts = {}, {}, [], []
+        for path in paths:
+            try:
+                with open(path, "r") as f:
+                    spans = json.load(f)["spans"]
+            except (OSError, ValueError, KeyError):
+                continue
+            chapters = {span["key"].split("/")[1] for span in spans if span["stage"] == "act" and "/" in span["key"]}
+            if chapters:
+                chapter_counts.append(len(chapters))
+            for span in spans:
+                if not span["calls"] or span["cache"] not in ("miss", "bypass"):
+                    continue
+                completion = span["completion_tokens"] / span["calls"]
+                prompts.setdefault(span["stage"], []).append(span["prompt_tokens"] / span["calls"])
+                completions.setdefault(span["stage"], []).append(completion)
+                points.append((completion, span["wall_seconds"] / span["calls"]))
+        latency, seconds_per_token = fit_latency(points)
+        return cls(
+            {stage: round(statistics.median(values)) for stage, values in prompts.items()},
+            {stage: round(statistics.median(values)) for stage, values in completions.items()},
+            latency, seconds_per_token,
+            round(statistics.median(chapter_counts)) if chapter_counts else DEFAULT_CHAPTERS,
+            len(paths),
+        )
+
+    def prompt_tokens(self, stage):
+        return self.prompt.get(stage, DEFAULT_PROMPT_TOKENS["act"])
+
+    def completion_tokens(self, stage, cap=None):
+        tokens = self.completion.get(stage, DEFAULT_COMPLETION_TOKENS["act"])
+        return min(tokens, cap) if cap else tokens
+
+    def seconds(self, completion_tokens):
+        """Expected seconds of a call that generates `completion_tokens` tokens"""
+        return self.latency + self.seconds_per_token * completion_tokens
+
+
+def fit_latency(points):
+    """Least-squares (latency, seconds per token) of (completion tokens, seconds) points; defaults if they are too few"""
+    if len(points) < MIN_FIT_CALLS:
+        return DEFAULT_LATENCY, DEFAULT_SECONDS_PER_TOKEN
+    mean_tokens = statistics.fmean(tokens for tokens, _ in points)
+    mean_seconds = statistics.fmean(seconds for _, seconds in points)
+    spread = sum((tokens - mean_tokens) ** 2 for tokens, _ in points)
+    if not spread:
+        return DEFAULT_LATENCY, DEFAULT_SECONDS_PER_TOKEN
+    slope = sum((tokens - mean_tokens) * (seconds - mean_seconds) for tokens, seconds in points) / spread
+    if slope <= 0:
+        # Latency does not grow with length here (e.g. a mock model): all of it is per call
+        return mean_seconds, 0.0
+    return max(0.0, mean_seconds - slope * mean_tokens), slope
+
+
+class PlannedCall:
+    """One model call the plan expects, keyed like the task that makes it"""
+
+    __slots__ = ("key", "prompt_tokens", "completion_tokens", "seconds", "deps")
+
+    def __init__(self, key, prompt_tokens, completion_tokens, seconds, deps=()):
+        self.key = key
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.seconds = seconds
+        self.deps = tuple(deps)
+
+    @property
+    def chapter(self):
+        """Chapter number of the call, or None for the calls before the chapters are known"""
+        return self.key[1] if isinstance(self.key, tuple) else None
+
+
+def simulate(calls, workers):
+    """Seconds until every call is done when at most `workers` run at once and each waits for its deps.
+
+    Calls start in dependency order (a call's deps outside the plan count as
+    done), each on the worker that frees up first.
+    """
+    keys = {call.key for call in calls}
+    depth = {}
+    for call in calls:
+        depth[call.key] = 1 + max((depth.get(dep, 0) for dep in call.deps if dep in keys), default=0)
+    finished = {}
+    free = [0.0] * max(1, workers)
+    for call in sorted(calls, key=lambda call: depth[call.key]):
+        ready = max((finished.get(dep, 0.0) for dep in call.deps if dep in keys), default=0.0)
+        start = max(ready, heapq.heappop(free))
+        finished[call.key] = start + call.seconds
+        heapq.heappush(free, finished[call.key])
+    return max(finished.values(), default=0.0)
+
+
+class StoryPlan:
+    """The calls a story still needs, their expected cost, and what was cut to meet the run's caps"""
+
+    def __init__(self, chapters, calls, max_concurrency, elapsed=0.0, notes=()):
+        self.chapters = chapters
+        self.calls = calls
+        self.max_concurrency = max_concurrency
+        # Seconds the run had already taken when the plan was made
+        self.elapsed = elapsed
+        self.notes = list(notes)
+
+    @property
+    def seconds(self):
+        """Expected wall time of the whole story, from the start of the run"""
+        return self.elapsed + simulate(self.calls, self.max_concurrency)
+
+    def totals(self):
+        return {
+            "chapters": len(self.chapters),
+            "calls": len(self.calls),
+            "prompt_tokens": sum(call.prompt_tokens for call in self.calls),
+            "completion_tokens": sum(call.completion_tokens for call in self.calls),
+            "seconds": self.seconds,
+        }
+
+    def without_last_chapter(self):
+        last = len(self.chapters)
+        return StoryPlan(dict(list(self.chapters.items())[:-1]), [call for call in self.calls if call.chapter != last], self.max_concurrency, self.elapsed, self.notes)
+
+    def fit_deadline(self, deadline):
+        """This plan with chapters dropped from the end until it fits `deadline` seconds (one chapter always stays)"""
+        if deadline is None:
+            return self
+        plan = self
+        while len(plan.chapters) > 1 and plan.seconds > deadline:
+            plan = plan.without_last_chapter()
+        dropped = len(self.chapters) - len(plan.chapters)
+        if dropped:
+            plan.notes.append(f"dropped the last {dropped} of {len(self.chapters)} chapters to fit the {duration(deadline)} deadline")
+        if plan.seconds > deadline:
+            plan.notes.append(f"over the {duration(deadline)} deadline even so")
+        return plan
+
+    def report(self):
+        totals = self.totals()
+        calls = f"{totals['calls']} more model calls" if self.elapsed else f"{totals['calls']} model calls"
+        text = (f"{totals['chapters']} chapter{'s' if totals['chapters'] != 1 else ''}: {calls}, about {totals['prompt_tokens']} prompt and "
+                f"{totals['completion_tokens']} completion tokens, about {duration(totals['seconds'])}")
+        return f"{text} ({'; '.join(self.notes)})" if self.notes else text
@@ -0,0 +1,236 @@
+"""Structured container of one story: a SQLite file next to its markdown, read a chapter at a time.
+
+The container holds a manifest (the full prompt, title, creation time,
+whether the story is finished), the chapter titles and one blob per act
+(optionally compressed). The pipeline's intermediate results stay in the run's
+checkpoint. Listing a story's chapters or reading one of them only touches
+those rows; `markdown` rebuilds the text of the story file.
+
+    python story_store.py stories/story_20240101_120000_A%20dragon.store.sqlite --output story.md
+"""
+import argparse
+import gzip
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+STORE_SUFFIX = ".store.sqlite"
+# Bumped when the tables change in a way older readers cannot handle
+STORE_FORMAT = 1
+# Compression of new act blobs: "gzip", "zstd" (needs the zstandard package) or "none"
+STORY_COMPRESSION = os.environ.get("STORY_COMPRESSION", "gzip")
+
+
+def store_path(story_file):
+    """Container that sits next to a `stories/story_*.md` file"""
+    story_file = Path(story_file)
+    return story_file.with_name(story_file.stem + STORE_SUFFIX)
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd compression needs the zstandard package (pip install zstandard)") from None
+    return zstandard
+
+
+def compress(text, compression):
+    data = text.encode("utf-8")
+    if compression == "gzip":
+        return gzip.compress(data, mtime=0)
+    if compression == "zstd":
+        return _zstd().ZstdCompressor().compress(data)
+    if compression == "none":
+        return data
+    raise ValueError(f"Unknown compression {compression!r}")
+
+
+def decompress(blob, compression):
+    if compression == "gzip":
+        data = gzip.decompress(blob)
+    elif compression == "zstd":
+        data = _zstd().ZstdDecompressor().decompress(blob)
+    elif compression == "none":
+        data = blob
+    else:
+        raise ValueError(f"Unknown compression {compression!r}")
+    return data.decode("utf-8")
+
+
+class StoryStore:
+    """Manifest, chapters and act blobs of one story, in SQLite.
+
+    Acts are compressed one by one with `compression`; each blob records how it
+    was compressed, so stores written with another setting stay readable.
+    Writes after `close` are dropped (the story file and the run's checkpoint
+    have them). A `readonly` store opens an existing file without creating
+    tables or changing its journal mode, so reading a story never writes to it.
+    """
+
+    def __init__(self, path, compression=STORY_COMPRESSION, readonly=False):
+        self.path = Path(path)
+        self.compression = compression
+        self._lock = threading.Lock()
+        if readonly:
+            self._conn = sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True, check_same_thread=False, timeout=30)
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS manifest (key TEXT PRIMARY KEY, value TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS chapters (chapter INTEGER PRIMARY KEY, title TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS acts ("
+            "chapter INTEGER NOT NULL, act INTEGER NOT NULL, compression TEXT NOT NULL, text BLOB NOT NULL, "
+            "words INTEGER NOT NULL, PRIMARY KEY (chapter, act));"
+        )
+        self._conn.commit()
+
+    @classmethod
+    def existing(cls, story_file):
+        """The container of a story file, opened read-only, or None if the story was written without one"""
+        path = store_path(story_file)
+        return cls(path, readonly=True) if path.exists() else None
+
+    def start(self, story_file, prompt):
+        """(Re)start the story: a fresh manifest and no chapters yet"""
+        with self._lock:
+            if self._conn is None:
+                return
+            created_at = self._get("created_at") or time.time()
+            title = self._get("title")
+            self._conn.execute("DELETE FROM chapters")
+            self._conn.execute("DELETE FROM acts")
+            self._conn.execute("DELETE FROM manifest")
+            self._put_manifest({
+                "format": STORE_FORMAT,
+                "story_file": Path(story_file).name,
+                "prompt": prompt,
+                "title": title,
+                "created_at": created_at,
+                "finished": False,
+            })
+            self._conn.commit()
+
+    def add_chapter(self, chapter_number, chapter_title):
+        with self._lock:
+            if self._conn is None:
+                return
+            self._conn.execute("INSERT OR REPLACE INTO chapters (chapter, title) VALUES (?, ?)", (chapter_number, chapter_title))
+            self._conn.commit()
+
+    def add_act(self, chapter_number, act_number, text):
+        blob = compress(text, self.compression)
+        with self._lock:
+            if self._conn is None:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO acts (chapter, act, compression, text, words) VALUES (?, ?, ?, ?, ?)",
+                (chapter_number, act_number, self.compression, blob, len(text.split())),
+            )
+            self._conn.commit()
+
+    def set_title(self, title):
+        with self._lock:
+            if self._conn is None:
+                return
+            self._put_manifest({"title": title})
+            self._conn.commit()
+
+    def finish(self):
+        with self._lock:
+            if self._conn is None:
+                return
+            self._put_manifest({"finished": True})
+            self._conn.commit()
+
+    def manifest(self):
+        """Prompt, title, creation time and the like, with the number of chapters, acts and words"""
+        with self._lock:
+            manifest = {key: json.loads(value) for key, value in self._conn.execute("SELECT key, value FROM manifest")}
+            manifest["chapters"] = self._conn.execute("SELECT COUNT(*) FROM chapters").fetchone()[0]
+            manifest["acts"], manifest["words"] = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(words), 0) FROM acts").fetchone()
+        return manifest
+
+    def chapters(self):
+        """(chapter number, title) of every chapter started so far"""
+        with self._lock:
+            return self._conn.execute("SELECT chapter, title FROM chapters ORDER BY chapter").fetchall()
+
+    def acts(self, chapter_number):
+        """Texts of the finished acts of one chapter, in order"""
+        with self._lock:
+            rows = self._conn.execute("SELECT compression, text FROM acts WHERE chapter = ? ORDER BY act", (chapter_number,)).fetchall()
+        return [decompress(blob, compression) for compression, blob in rows]
+
+    def act(self, chapter_number, act_number):
+        with self._lock:
+            row = self._conn.execute("SELECT compression, text FROM acts WHERE chapter = ? AND act = ?", (chapter_number, act_number)).fetchone()
+        if row is None:
+            raise KeyError((chapter_number, act_number))
+        return decompress(row[1], row[0])
+
+    def chapter_markdown(self, chapter_number):
+        """One chapter as it appears in the story file, without its heading"""
+        return "".join(f"{text}\n\n" for text in self.acts(chapter_number))
+
+    def markdown(self):
+        """The story as the markdown of its story file, lazily, a chapter at a time"""
+        yield f"# Story based on prompt: {self.manifest()['prompt']}\n\n"
+        for chapter_number, chapter_title in self.chapters():
+            yield f"\n## Chapter {chapter_number}: {chapter_title}\n\n"
+            yield self.chapter_markdown(chapter_number)
+
+    def export_markdown(self, path):
+        """Write the story's markdown to `path` (through a temporary file, so it is replaced whole)"""
+        path = Path(path)
+        temporary = path.with_name(path.name + ".tmp")
+        with open(temporary, "w", encoding="utf-8", newline="") as f:
+            for part in self.markdown():
+                f.write(part)
+        os.replace(temporary, path)
+        return path
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _get(self, key):
+        # Caller must hold self._lock
+        row = self._conn.execute("SELECT value FROM manifest WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def _put_manifest(self, values):
+        # Caller must hold self._lock
+        self._conn.executemany("INSERT OR REPLACE INTO manifest (key, value) VALUES (?, ?)", [(key, json.dumps(value)) for key, value in values.items()])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export story containers to markdown")
+    parser.add_argument("stores", nargs="+", type=Path, help="story_*.store.sqlite files")
+    parser.add_argument("--output", type=Path, help="markdown file to write (only with one store; default: print it)")
+    args = parser.parse_args()
+    if args.output is not None and len(args.stores) > 1:
+        parser.error("--output takes a single store")
+    for path in args.stores:
+        if not path.exists():
+            parser.error(f"{path} does not exist")
+        with StoryStore(path, readonly=True) as store:
+            if args.output is not None:
+                store.export_markdown(args.output)
+            else:
+                for part in store.markdown():
+                    sys.stdout.write(part)
@@ -0,0 +1,208 @@
+import os
+import threading
+from pathlib import Path
+
+# Text is written to the story file in chunks of at least this many characters
+BUFFER_CHARS = 2048
+# Characters per chunk when a story file is read back as a whole
+READ_CHUNK_CHARS = 64 * 1024
+
+
+def fsync_directory(folder):
+    """Make a rename in `folder` durable (a no-op where directories cannot be opened, e.g. Windows)"""
+    try:
+        fd = os.open(str(folder), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def story_text(story_file, chunk_chars=READ_CHUNK_CHARS):
+    """The text of a story file, lazily, in chunks of `chunk_chars` characters"""
+    with open(story_file, "r", encoding="utf-8", newline="") as f:
+        while True:
+            chunk = f.read(chunk_chars)
+            if not chunk:
+                return
+            yield chunk
+
+
+class StoryWriter:
+    """Writes one story file through its own handle and buffer, and keeps the library index in step.
+
+    Every run (a Streamlit session's generation, a job, a batch item) gets its
+    own writer, so concurrent stories in one process never share state. The
+    header is written to a temporary file that atomically replaces the story,
+    text is appended in `buffer_chars` chunks, and every finished act is
+    flushed and fsynced, so a crash loses at most the act being written; the
+    run's checkpoint has everything before it.
+
+    The writer also remembers where each finished act sits in the file (as
+    byte offsets), so an act can be read back from disk instead of being kept
+    in memory by whoever displays or continues the story. With a `store`
+    (a `StoryStore`), chapters, acts and the title also go into the story's
+    structured container.
+    """
+
+    def __init__(self, story_file, prompt, library=None, buffer_chars=BUFFER_CHARS, store=None):
+        self.story_file = Path(story_file)
+        self.prompt = prompt
+        self.library = library
+        self.store = store
+        self.buffer_chars = buffer_chars
+        self._buffer = []
+        self._buffered_chars = 0
+        # Bytes in the file once the buffer is written out, where the act being written started,
+        # and (start, end) of every finished act by (chapter number, act number)
+        self._position = 0
+        self._act_start = 0
+        self.offsets = {}
+        self._file = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """(Re)write the story file with just its prompt header and add it to the library"""
+        header = f"# Story based on prompt: {self.prompt}\n\n"
+        temporary = self.story_file.with_name(self.story_file.name + ".tmp")
+        with self._lock:
+            self._close()
+            self._buffer, self._buffered_chars = [], 0
+            self._position = self._act_start = len(header.encode("utf-8"))
+            self.offsets = {}
+            with open(temporary, "w", encoding="utf-8", newline="") as f:
+                f.write(header)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, self.story_file)
+            fsync_directory(self.story_file.parent)
+            self._file = open(self.story_file, "a", encoding="utf-8", newline="")
+        if self.store is not None:
+            self.store.start(self.story_file, self.prompt)
+        if self.library is not None:
+            self.library.start(self.story_file, self.prompt, header)
+        return self
+
+    def write(self, text):
+        """Append text; it reaches the file once the buffer is full or at the next `sync`"""
+        if not text:
+            return
+        with self._lock:
+            self._buffer.append(text)
+            self._buffered_chars += len(text)
+            self._position += len(text.encode("utf-8"))
+            if self._buffered_chars < self.buffer_chars:
+                return
+            content = self._flush()
+        self._count(content)
+
+    def chapter(self, chapter_number, chapter_title):
+        heading = f"\n## Chapter {chapter_number}: {chapter_title}\n\n"
+        self.write(heading)
+        with self._lock:
+            self._act_start = self._position
+        if self.store is not None:
+            self.store.add_chapter(chapter_number, chapter_title)
+        if self.library is not None:
+            self.library.append(self.story_file, chapters=1, words=len(heading.split()))
+
+    def act_done(self, chapter_number, chapter_title, act_number, act_text):
+        """End an act whose text was already written (e.g. streamed), index it and make it durable"""
+        with self._lock:
+            span = (self._act_start, self._position)
+            self._buffer.append("\n\n")
+            self._buffered_chars += 2
+            self._position += 2
+            content = self._flush()
+            os.fsync(self._file.fileno())
+            # Published only once the act is on disk, so a reader that sees it reads all of it
+            self.offsets[(chapter_number, act_number)] = span
+            self._act_start = self._position
+        self._count(content)
+        if self.store is not None:
+            self.store.add_act(chapter_number, act_number, act_text)
+        if self.library is not None:
+            # Words are counted per act, since a streamed word can be split across two flushed chunks
+            self.library.append(self.story_file, words=len(act_text.split()))
+            self.library.add_passage(self.story_file, chapter_number, chapter_title, act_number, act_text)
+
+    def add_act(self, chapter_number, chapter_title, act_number, act_text):
+        """Append a whole act"""
+        self.write(act_text)
+        self.act_done(chapter_number, chapter_title, act_number, act_text)
+
+    def has_act(self, chapter_number, act_number):
+        """Whether the act is finished and on disk"""
+        with self._lock:
+            return (chapter_number, act_number) in self.offsets
+
+    def act_text(self, chapter_number, act_number):
+        """Text of a finished act, read back from the story file"""
+        with self._lock:
+            start, end = self.offsets[(chapter_number, act_number)]
+        with open(self.story_file, "rb") as f:
+            f.seek(start)
+            return f.read(end - start).decode("utf-8")
+
+    def text(self, chunk_chars=READ_CHUNK_CHARS):
+        """The story so far, lazily, in chunks read from the file"""
+        self.sync()
+        return story_text(self.story_file, chunk_chars)
+
+    def set_title(self, title):
+        if title and self.store is not None:
+            self.store.set_title(title)
+        if title and self.library is not None:
+            self.library.set_title(self.story_file, title)
+
+    def finish(self):
+        """Mark the story complete in its container"""
+        if self.store is not None:
+            self.store.finish()
+
+    def sync(self):
+        """Write out the buffer and fsync the file"""
+        with self._lock:
+            content = self._flush()
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+        self._count(content)
+
+    def close(self):
+        self.sync()
+        with self._lock:
+            self._close()
+        if self.store is not None:
+            self.store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _flush(self):
+        # Caller must hold self._lock; returns the text written
+        if not self._buffer:
+            return ""
+        if self._file is None:
+            raise RuntimeError(f"{self.story_file} was not started")
+        content = "".join(self._buffer)
+        self._file.write(content)
+        self._file.flush()
+        self._buffer, self._buffered_chars = [], 0
+        return content
+
+    def _count(self, content):
+        if content and self.library is not None:
+            self.library.append(self.story_file, size=len(content.encode("utf-8")))
+
+    def _close(self):
+        # Caller must hold self._lock
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,39 @@
+import threading
+
+import pytest
+
+import story_pipeline
+from checkpoint import Checkpoint
+from governor import Governor
+from mock_model import MockChatModel
+from response_cache import ResponseCache
+from similarity_cache import SimilarityCache
+from story_store import StoryStore
+
+
+@pytest.fixture
+def mock_pipeline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(story_pipeline, "model", MockChatModel(latency=0.0, token_delay=0.0, words=60, chapters=2))
+    monkeypatch.setattr(story_pipeline, "governor", Governor(requests_per_minute=None, tokens_per_minute=None))
+
+
+@pytest.mark.parametrize("speculative", [False, True])
+def test_async_run_does_no_file_io_on_the_event_loop(mock_pipeline, monkeypatch, speculative):
+    threads = set()
+
+    def watch(cls, name):
+        original = getattr(cls, name)
+
+        def wrapper(*args, **kwargs):
+            threads.add((f"{cls.__name__}.{name}", threading.current_thread().name))
+            return original(*args, **kwargs)
+        monkeypatch.setattr(cls, name, wrapper)
+
+    for cls, name in [(Checkpoint, "_append"), (ResponseCache, "get"), (ResponseCache, "put"),
+                      (SimilarityCache, "lookup"), (SimilarityCache, "put"), (StoryStore, "add_act")]:
+        watch(cls, name)
+    story_file = story_pipeline.write_story("A lighthouse keeper", use_async=True, speculative_acts=speculative)
+    assert story_file.exists()
+    assert {name for name, _ in threads} >= {"Checkpoint._append", "ResponseCache.get", "ResponseCache.put"}
+    assert not [name for name, thread in threads if thread == "llm-event-loop"]
@@ -0,0 +1,64 @@
+import io
+import json
+
+import pytest
+
+import story_pipeline
+from batch import BatchError, item_options, read_items, run_batch
+from governor import Governor
+from mock_model import MockChatModel
+from story_library import StoryLibrary
+
+
+@pytest.fixture
+def mock_pipeline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(story_pipeline, "model", MockChatModel(latency=0.0, token_delay=0.0, words=60, chapters=2))
+    monkeypatch.setattr(story_pipeline, "governor", Governor(requests_per_minute=None, tokens_per_minute=None))
+
+
+def prompt_file(tmp_path):
+    path = tmp_path / "prompts.jsonl"
+    path.write_text(
+        json.dumps({"prompt": "A lighthouse keeper", "id": "keeper"}) + "\n"
+        "\n"
+        '{"prompt": "unterminated\n'
+        + json.dumps({"id": "no prompt"}) + "\n"
+        + json.dumps({"prompt": "A dragon", "chapters": 1, "use_cache": False}) + "\n"
+    )
+    return path
+
+
+def test_lines_that_cannot_be_used_become_errors(tmp_path):
+    items = read_items(prompt_file(tmp_path))
+    assert [item["line"] for item in items] == [1, 3, 4, 5]
+    assert items[0]["prompt"] == "A lighthouse keeper"
+    assert all(isinstance(item["error"], BatchError) for item in items[1:3])
+    assert str(items[2]["error"]).endswith(':4: expected an object with a non-empty "prompt"')
+
+
+def test_items_override_the_defaults():
+    options = item_options({"prompt": "x", "chapters": 1, "context_tokens": 800}, {"max_chapters": 3, "use_cache": True})
+    assert options["max_chapters"] == 1 and options["use_cache"] is True
+    assert (options["context_budget"].recent_tokens, options["context_budget"].blueprint_tokens) == (800, 800)
+    assert "context_budget" not in item_options({"prompt": "x"}, {"context_tokens": None})
+
+
+def test_every_item_gets_one_metadata_record(mock_pipeline, tmp_path):
+    metadata_path = tmp_path / "stories" / "batch.jsonl"
+    out = io.StringIO()
+    records = run_batch(prompt_file(tmp_path), parallel=2, defaults={"use_cache": False}, folder=tmp_path / "stories", metadata_path=metadata_path, out=out)
+
+    written = [json.loads(line) for line in metadata_path.read_text().splitlines()]
+    assert sorted(written, key=lambda record: record["line"]) == sorted(records, key=lambda record: record["line"])
+    by_line = {record["line"]: record for record in written}
+    assert sorted(by_line) == [1, 3, 4, 5]
+    assert [by_line[line]["status"] for line in (1, 3, 4, 5)] == ["done", "failed", "failed", "done"]
+    assert by_line[1]["id"] == "keeper" and by_line[5]["id"] is None
+    assert "story_file" not in by_line[3] and "BatchError" in by_line[3]["error"]
+    assert by_line[5]["options"] == {"use_cache": False, "max_chapters": 1}
+    assert by_line[5]["calls"] > 0 and by_line[5]["completion_tokens"] > 0
+
+    chapters = {line: StoryLibrary.chapters(by_line[line]["story_file"]) for line in (1, 5)}
+    assert len(chapters[1]) == 2 and len(chapters[5]) == 1
+    assert "2 of 4 stories written" in out.getvalue()
@@ -0,0 +1,51 @@
+import os
+
+from checkpoint import Checkpoint, checkpoint_path, read_results, unfinished_checkpoints
+import checkpoint as checkpoint_module
+
+
+def test_records_are_appended_and_read_back(tmp_path):
+    story_file = tmp_path / "story_20240101_120000_a.md"
+    checkpoint = Checkpoint.for_story(story_file, "a prompt")
+    checkpoint.record("blueprint", "the blueprint")
+    size = checkpoint.path.stat().st_size
+    checkpoint.record(("act", 1, 0), "first act ✓\nwith a line break")
+    # Saving a stage only appends it
+    assert checkpoint.path.read_bytes()[:size].endswith(b'"the blueprint"}\n')
+
+    loaded = Checkpoint.load(checkpoint_path(story_file))
+    assert loaded.prompt == "a prompt"
+    assert ("act", 1, 0) in loaded and len(loaded) == 2
+    assert loaded.get(("act", 1, 0)) == "first act ✓\nwith a line break"
+    assert dict(loaded.items()) == dict(read_results(loaded.path))
+    assert not loaded.finished
+    loaded.finish()
+    assert Checkpoint.load(loaded.path).finished
+
+
+def test_torn_last_line_is_dropped(tmp_path):
+    checkpoint = Checkpoint.for_story(tmp_path / "story_20240101_120000_a.md", "a prompt")
+    checkpoint.record("structure", "kept")
+    with open(checkpoint.path, "ab") as f:
+        f.write(b'{"key": "blueprint", "val')
+    loaded = Checkpoint.load(checkpoint.path)
+    assert loaded.keys() == ["structure"]
+    loaded.record("blueprint", "written again")
+    assert Checkpoint.load(checkpoint.path).get("blueprint") == "written again"
+
+
+def test_unfinished_checkpoints_only_reread_changed_files(tmp_path, monkeypatch):
+    first = Checkpoint.for_story(tmp_path / "story_20240101_120000_a.md", "first")
+    second = Checkpoint.for_story(tmp_path / "story_20240101_120001_b.md", "second")
+    second.record("structure", "x")
+    assert [summary.prompt for summary in unfinished_checkpoints(tmp_path)] == ["second", "first"]
+
+    reads = []
+    summarize = checkpoint_module.summarize
+    monkeypatch.setattr(checkpoint_module, "summarize", lambda path: reads.append(path.name) or summarize(path))
+    assert [summary.stages for summary in unfinished_checkpoints(tmp_path)] == [1, 0]
+    assert reads == []
+    first.finish()
+    os.utime(first.path, ns=(0, 1))
+    assert [summary.prompt for summary in unfinished_checkpoints(tmp_path)] == ["second"]
+    assert reads == [first.path.name]
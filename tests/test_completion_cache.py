@@ -0,0 +1,73 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+import story_pipeline
+from governor import Governor
+from mock_model import MockChatModel
+from model_router import ModelRouter, ModelSpec
+from response_cache import ResponseCache
+
+
+class DownModel:
+    """A primary model whose provider cannot be reached"""
+
+    model_name = "primary"
+    temperature = 0.75
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, messages, **settings):
+        self.calls += 1
+        raise openai.APIConnectionError(request=httpx.Request("POST", "http://primary/v1/chat/completions"))
+
+    async def ainvoke(self, messages, **settings):
+        return self.invoke(messages, **settings)
+
+
+@pytest.fixture
+def router(tmp_path, monkeypatch):
+    primary, fallback = DownModel(), MockChatModel(model_name="fallback", words=20)
+    models = {"primary": primary, "fallback": fallback}
+    limiter = Governor(requests_per_minute=None, tokens_per_minute=None, max_retries=0)
+    router = ModelRouter(lambda name: models[name], lambda: limiter,
+                         routes={None: [[ModelSpec(model="primary")], [ModelSpec(model="fallback")]]})
+    cache = ResponseCache(tmp_path / "responses.sqlite")
+    monkeypatch.setattr(story_pipeline, "model_router", lambda: router)
+    monkeypatch.setattr(story_pipeline, "completion_cache", lambda: cache)
+    monkeypatch.setattr(story_pipeline, "FALLBACK_RETRIES", 0)
+    return router, primary, cache
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_fallback_completion_is_cached_under_the_fallback_model(router, use_async):
+    router, primary, cache = router
+    prompt = "Write one line about a lighthouse."
+    if use_async:
+        text = asyncio.run(story_pipeline.aget_completion(prompt))
+    else:
+        text = story_pipeline.get_completion(prompt)
+    primary_spec, fallback_spec = [group[0] for group in router.routes[None]]
+    assert primary.calls == 1
+    assert cache.get(story_pipeline.completion_key(prompt, spec=primary_spec)) is None
+    assert cache.get(story_pipeline.completion_key(prompt, spec=fallback_spec)) == text
+    # With the primary alone, the fallback's answer is not served in its place
+    router.routes[None] = [[primary_spec]]
+    with pytest.raises(openai.APIConnectionError):
+        story_pipeline.get_completion(prompt)
+
+
+def test_runs_that_bypass_the_cache_do_not_fill_it(router):
+    router, primary, cache = router
+    router.routes[None] = [router.routes[None][1]]
+    run = story_pipeline.StoryRun("A lighthouse keeper", use_cache=False)
+    token = story_pipeline.current_run.set(run)
+    try:
+        story_pipeline.get_completion("Write one line about a harbour.")
+    finally:
+        story_pipeline.current_run.reset(token)
+        run.graph.shutdown()
+    assert cache.stats()["entries"] == 0
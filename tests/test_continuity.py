@@ -0,0 +1,43 @@
+from continuity import best_draft, character_names, continuity_issues, score_draft, words
+
+PREVIOUS = (
+    "Mara climbed the spiral stairs as the storm rolled in from the sea. At the top she trimmed the wick, "
+    "and the lamp threw its beam across the black water toward the harbour where Tomas waited."
+)
+
+
+def test_words_keep_apostrophes_and_hyphens():
+    assert words("Mara’s light-house, 3 ships; don't!") == ["Mara’s", "light-house", "ships", "don't"]
+
+
+def test_names_are_capitalized_words_inside_sentences():
+    assert character_names(PREVIOUS) == {"Tomas"}
+    assert character_names("The keeper met Old Tomas. Then Mara left.") == {"Old", "Tomas", "Mara"}
+
+
+def test_a_draft_that_carries_on_has_no_issues():
+    draft = "Below, Tomas raised his lantern to answer her, and the boat pushed off from the quay into the rain."
+    assert continuity_issues(PREVIOUS, draft) == []
+
+
+def test_a_draft_that_retells_the_text_before_it_is_flagged():
+    [issue] = continuity_issues(PREVIOUS, PREVIOUS + " Then Tomas rowed out.")
+    assert issue.startswith("the next part retells ") and "of its opening from the text before it" in issue
+
+
+def test_a_draft_that_opens_with_other_characters_is_flagged():
+    draft = "In the city, Ines counted the coins while Rafael slept by the door."
+    [issue] = continuity_issues(PREVIOUS, draft)
+    assert issue == "the text so far ends with Tomas but the next part opens with Ines, Rafael and none of them"
+
+
+def test_best_draft_covers_the_description_without_preamble():
+    description = "Tomas rows through the storm to reach the lighthouse"
+    covering = "Tomas leaned into the oars while the storm tore at the boat, and the lighthouse grew closer."
+    unrelated = "The market was busy that morning and nobody noticed the small grey cat."
+    preamble = "Here is act 2: " + covering
+    assert score_draft(covering, description) > score_draft(unrelated, description)
+    assert score_draft(preamble, description) < score_draft(covering, description)
+    assert score_draft("", description) == 0.0
+    assert best_draft([unrelated, preamble, covering], description) == 2
+    assert best_draft([covering, covering], description) == 0
@@ -0,0 +1,145 @@
+import asyncio
+import time
+
+import httpx
+import openai
+import pytest
+
+import governor as governor_module
+from fake_endpoint import FakeEndpoint
+from governor import CircuitOpenError, DeadlineExceeded, Governor, RetryBudget
+
+
+def rate_limit_error(retry_after=None):
+    headers = {"retry-after": str(retry_after)} if retry_after is not None else {}
+    response = httpx.Response(429, headers=headers, request=httpx.Request("POST", "http://provider/v1/chat/completions"))
+    return openai.RateLimitError("Rate limit exceeded", response=response, body=None)
+
+
+def half_open_governor(**limits):
+    governor = Governor(failure_threshold=1, reset_timeout=0.0, **limits)
+    governor.breaker.record_failure()
+    assert governor.breaker.state == "half-open"
+    return governor
+
+
+def test_probe_past_its_deadline_releases_the_breaker():
+    governor = half_open_governor(requests_per_minute=1, tokens_per_minute=None)
+    governor.requests.reserve(1)
+    with pytest.raises(DeadlineExceeded):
+        governor.call(lambda timeout: "late", deadline=0.1)
+    governor.requests = None
+    assert governor.call(lambda timeout: "ok") == "ok"
+    assert governor.breaker.state == "closed"
+
+
+def test_cancelled_probe_releases_the_breaker():
+    governor = half_open_governor(requests_per_minute=None, tokens_per_minute=None)
+
+    async def cancel_probe():
+        probe = asyncio.ensure_future(governor.acall(lambda timeout: asyncio.sleep(60)))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        return await governor.acall(lambda timeout: asyncio.sleep(0, "ok"))
+
+    assert asyncio.run(cancel_probe()) == "ok"
+
+
+def test_only_one_probe_at_a_time():
+    governor = half_open_governor(requests_per_minute=None, tokens_per_minute=None)
+    probe = governor.breaker.before_call()
+    assert probe is not None
+    with pytest.raises(CircuitOpenError):
+        governor.call(lambda timeout: "ok")
+    governor.breaker.release(probe)
+    assert governor.call(lambda timeout: "ok") == "ok"
+
+
+def test_retry_budget_refills_over_time(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(governor_module.time, "monotonic", lambda: now[0])
+    budget = RetryBudget(ratio=0.0, per_minute=60, capacity=2)
+    assert budget.withdraw() and budget.withdraw()
+    assert not budget.withdraw()
+    now[0] += 1.0
+    assert budget.withdraw()
+    assert not budget.withdraw()
+
+
+def test_successes_add_to_the_retry_budget():
+    budget = RetryBudget(ratio=0.5, per_minute=0.001, capacity=1)
+    assert budget.withdraw() and not budget.withdraw()
+    budget.deposit()
+    budget.deposit()
+    assert budget.withdraw()
+
+
+def test_rate_limits_with_retry_after_do_not_spend_the_budget():
+    governor = Governor(requests_per_minute=None, tokens_per_minute=None, max_retries=10, base_delay=0.0)
+    governor.budget = RetryBudget(ratio=0.0, per_minute=0.001, capacity=0)
+    errors = [rate_limit_error(retry_after=0) for _ in range(3)]
+
+    def flaky(timeout):
+        if errors:
+            raise errors.pop()
+        return "ok"
+
+    assert governor.call(flaky) == "ok"
+    errors.append(rate_limit_error())
+    with pytest.raises(openai.RateLimitError):
+        governor.call(flaky)
+
+
+def test_many_calls_get_through_an_endpoint_that_rate_limits_often():
+    endpoint = FakeEndpoint(rate_limit=0.3, retry_after=0, seed=7).start()
+    try:
+        client = openai.OpenAI(base_url=endpoint.base_url, api_key="test", max_retries=0)
+        governor = Governor(requests_per_minute=None, tokens_per_minute=None, base_delay=0.01)
+        started = time.monotonic()
+        for number in range(60):
+            governor.call(lambda timeout: client.chat.completions.create(model="mock", messages=[{"role": "user", "content": f"Hello {number}"}], timeout=timeout))
+        assert endpoint.counters["rate_limited"] > 10
+        assert time.monotonic() - started < 30
+    finally:
+        endpoint.shutdown()
+        endpoint.server_close()
+
+
+def test_rate_limits_do_not_open_the_circuit():
+    governor = Governor(requests_per_minute=None, tokens_per_minute=None, max_retries=20, base_delay=0.0, failure_threshold=2)
+    errors = [rate_limit_error(retry_after=0) for _ in range(10)]
+
+    def limited(timeout):
+        if errors:
+            raise errors.pop()
+        return "ok"
+
+    assert governor.call(limited) == "ok"
+    assert governor.breaker.state == "closed"
+
+
+def test_requests_past_the_deadline_give_their_quota_back():
+    governor = Governor(requests_per_minute=60, tokens_per_minute=1000)
+    governor.call(lambda timeout: "ok", tokens=1000)
+    for _ in range(5):
+        with pytest.raises(DeadlineExceeded):
+            governor.call(lambda timeout: "late", tokens=500, deadline=0.1)
+    # Only the first call's tokens were spent, so the next 500 are a minute's refill of half the bucket away
+    assert 25 < governor.tokens.reserve(500) < 35
+
+
+def test_blocking_calls_get_the_time_left_as_their_timeout():
+    endpoint = FakeEndpoint(delay=5.0).start()
+    try:
+        client = openai.OpenAI(base_url=endpoint.base_url, api_key="test", max_retries=0)
+        governor = Governor(requests_per_minute=None, tokens_per_minute=None, base_delay=0.0)
+        started = time.monotonic()
+        with pytest.raises((openai.APITimeoutError, DeadlineExceeded)):
+            governor.call(lambda timeout: client.chat.completions.create(model="mock", messages=[{"role": "user", "content": "Hello"}], timeout=timeout),
+                          deadline=0.5)
+        assert time.monotonic() - started < 2.0
+    finally:
+        endpoint.shutdown()
+        endpoint.server_close()
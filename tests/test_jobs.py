@@ -0,0 +1,87 @@
+import pytest
+
+import story_pipeline
+from checkpoint import Checkpoint, checkpoint_path
+from governor import Governor
+from jobs import JobQueue, run_job, run_worker, story_options
+from mock_model import MockChatModel
+from story_context import ContextBudget
+
+
+class WorkerKilled(BaseException):
+    """Stands in for a worker process dying mid-story"""
+
+
+@pytest.fixture
+def mock_pipeline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(story_pipeline, "model", MockChatModel(latency=0.0, token_delay=0.0, words=60, chapters=2))
+    monkeypatch.setattr(story_pipeline, "governor", Governor(requests_per_minute=None, tokens_per_minute=None))
+
+
+def test_jobs_are_claimed_oldest_first_and_only_queued_ones_cancel(tmp_path):
+    queue = JobQueue(tmp_path / "jobs.sqlite")
+    first = queue.submit("first", use_cache=False)
+    second = queue.submit("second")
+    claimed = queue.claim("worker-1")
+    assert claimed["id"] == first and claimed["status"] == "running" and claimed["attempts"] == 1
+    assert claimed["options"] == {"use_cache": False}
+    assert not queue.cancel(first)
+    assert queue.cancel(second)
+    assert queue.claim("worker-1") is None
+    assert [job["status"] for job in queue.jobs()] == ["cancelled", "running"]
+
+
+def test_story_options_rebuild_the_context_budget():
+    options = story_options({"use_async": True, "context_budget": {"recent_tokens": 900}})
+    assert options["use_async"] is True
+    assert isinstance(options["context_budget"], ContextBudget) and options["context_budget"].recent_tokens == 900
+
+
+def test_job_survives_a_worker_restart(mock_pipeline, tmp_path):
+    # Slow enough that the later acts of each chapter are still to come when the worker dies
+    story_pipeline.model.latency = 0.02
+    path = tmp_path / "jobs.sqlite"
+    queue = JobQueue(path)
+    job_id = queue.submit("A lighthouse keeper", use_cache=False)
+
+    def progress(job_id, message, fraction):
+        if "act" in message:
+            raise WorkerKilled
+    queue.progress = progress
+    with pytest.raises(WorkerKilled):
+        run_job(queue, queue.claim("worker-1"))
+    job = queue.get(job_id)
+    assert job["status"] == "running" and job["story_file"]
+    written = len(Checkpoint.load(checkpoint_path(job["story_file"])))
+    assert written > 0
+
+    # A fresh worker only takes the job back once the old one stops sending heartbeats
+    run_worker(path, once=True)
+    assert queue.get(job_id)["status"] == "running"
+    assert JobQueue(path, stale_after=0.0).requeue_stale() == 1
+    calls = story_pipeline.model.calls
+    run_worker(path, once=True)
+
+    job = queue.get(job_id)
+    assert job["status"] == "done" and job["attempts"] == 2 and job["progress"] == 1.0
+    assert Checkpoint.load(checkpoint_path(job["story_file"])).finished
+    # Stages the first worker checkpointed are not asked for again (calls it had in flight may still have landed)
+    resumed_calls = story_pipeline.model.calls - calls
+    story_pipeline.model.calls = 0
+    reference = story_pipeline.write_story("A lighthouse keeper", use_cache=False)
+    assert 0 < resumed_calls <= story_pipeline.model.calls - written
+    assert reference.read_text() == open(job["story_file"], encoding="utf-8").read()
+
+
+def test_failed_job_records_its_traceback(mock_pipeline, tmp_path, monkeypatch):
+    queue = JobQueue(tmp_path / "jobs.sqlite")
+    job_id = queue.submit("A lighthouse keeper", use_cache=False)
+
+    def broken(*args, **kwargs):
+        raise RuntimeError("model unavailable")
+    monkeypatch.setattr(story_pipeline, "act_request", broken)
+    run_worker(tmp_path / "jobs.sqlite", once=True)
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and "model unavailable" in job["error"]
+    assert queue.active_story_files() == set()
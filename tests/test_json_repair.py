@@ -0,0 +1,55 @@
+import pytest
+
+from json_repair import JsonRepairError, complete_acts, extract_json, missing_fields_template, normalize_acts, parse_acts, parse_chapters, split_blueprint
+
+
+def test_acts_in_a_fence_with_trailing_commas_and_comments():
+    text = """Here are the acts:
+```json
+{
+  // the opening
+  "Act 1": {"description": "The lamp fails.", "writing_advice": "Keep it quiet.",},
+  "act_2": {"summary": "A ship appears.", "Writing Advice": "Build dread."},
+}
+```
+Hope this helps!"""
+    assert parse_acts(text) == {
+        "act-1": {"description": "The lamp fails.", "writingAdvice": "Keep it quiet."},
+        "act-2": {"description": "A ship appears.", "writingAdvice": "Build dread."},
+    }
+
+
+def test_acts_as_a_list_or_plain_strings_are_keyed_in_order():
+    acts, missing = normalize_acts({"acts": ["The lamp fails.", {"desc": "A ship appears."}]})
+    assert list(acts) == ["act-1", "act-2"]
+    assert missing == [("act-1", "writingAdvice"), ("act-2", "writingAdvice")]
+    acts, _ = normalize_acts({"act-10": "Dawn.", "act-2": "Dusk."})
+    assert list(acts) == ["act-2", "act-10"]
+
+
+def test_missing_fields_are_patched_or_defaulted():
+    acts, missing = normalize_acts({"act-1": {"description": "The lamp fails."}, "act-2": {"advice": "Be brief."}})
+    assert missing == [("act-1", "writingAdvice"), ("act-2", "description")]
+    assert '"act-2"' in missing_fields_template(missing)
+    completed = complete_acts(acts, {"act-2": {"description": "A ship appears."}})
+    assert completed["act-1"]["writingAdvice"] is None
+    assert completed["act-2"] == {"writingAdvice": "Be brief.", "description": "A ship appears."}
+    with pytest.raises(JsonRepairError):
+        complete_acts(normalize_acts({"act-1": {"advice": "Be brief."}})[0])
+
+
+def test_first_object_after_prose_and_a_cut_off_completion():
+    assert extract_json('Sure! {"chapters": {"The Light": "It starts."}} and {"other": 1}') == {"chapters": {"The Light": "It starts."}}
+    assert extract_json('Sure! {"act-1": {"description": "The lamp fa') == {"act-1": {"description": "The lamp fa"}}
+    with pytest.raises(JsonRepairError):
+        extract_json("No JSON here at all.")
+
+
+def test_chapters_from_a_list_and_a_blueprint_block():
+    assert parse_chapters('{"chapters": [{"title": "The Light", "summary": "It starts."}, {"name": "The Storm"}]}') == {
+        "chapters": {"The Light": "It starts.", "The Storm": ""}
+    }
+    blueprint, chapters = split_blueprint('The keeper is alone.\n```json\n{"chapters": {"The Light": "It starts."}}\n```')
+    assert blueprint == "The keeper is alone."
+    assert chapters == {"chapters": {"The Light": "It starts."}}
+    assert split_blueprint("No chapter block.") == ("No chapter block.", None)
@@ -0,0 +1,29 @@
+import pytest
+
+import story_pipeline
+from model_router import Backend
+
+
+@pytest.fixture
+def default_model(monkeypatch):
+    monkeypatch.setattr(story_pipeline, "model", None)
+    story_pipeline.default_backend.cache_clear()
+    yield story_pipeline.get_model()
+    story_pipeline.default_backend.cache_clear()
+
+
+def test_named_models_share_the_default_provider(default_model):
+    named = story_pipeline.chat_model("meta-llama/llama-3.1-70b-instruct")
+    assert named.model_name == "meta-llama/llama-3.1-70b-instruct"
+    assert (named.openai_api_base, named.temperature, named.max_retries) == (default_model.openai_api_base, 0.75, 0)
+    assert named.root_client._client is default_model.root_client._client
+    assert story_pipeline.chat_model("meta-llama/llama-3.1-70b-instruct") is named
+    assert story_pipeline.default_model() is default_model
+
+
+def test_backends_keep_one_client_per_model_and_timeout():
+    backend = Backend("local", "http://127.0.0.1:8765/v1", api_key="local", default_model="stand-in")
+    client = backend.client(None)
+    assert client.model_name == "stand-in"
+    assert backend.client("stand-in") is client
+    assert backend.client("stand-in", timeout=5.0) is not client
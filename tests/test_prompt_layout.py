@@ -0,0 +1,55 @@
+from types import SimpleNamespace
+
+from prompt_layout import PrefixTracker, PromptParts, cached_prompt_tokens, prompt_messages, prompt_prefix, prompt_text
+from story_pipeline import act_prompt_for, format_act_prompt
+
+
+def test_parts_format_and_extend():
+    prompt = PromptParts("Blueprint: {blueprint}\n", "Write act {act}.")
+    filled = prompt.format(blueprint="a keeper", act=2, unused="x")
+    assert (filled.prefix, filled.suffix) == ("Blueprint: a keeper\n", "Write act 2.")
+    extended = filled.extend(" Continue from: {previous}")
+    assert extended.prefix is filled.prefix and extended.text == "Blueprint: a keeper\nWrite act 2. Continue from: {previous}"
+    assert prompt_text("plain") == "plain" and prompt_text(filled) == filled.text
+    assert prompt_prefix("plain") == "" and prompt_prefix(filled) == filled.prefix
+
+
+def test_prefix_is_its_own_message_block():
+    prompt = PromptParts("Instructions", "Act 2")
+    [message] = prompt_messages(prompt)
+    assert message["role"] == "user"
+    assert message["content"] == [
+        {"type": "text", "text": "Instructions", "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": "Act 2"},
+    ]
+    assert prompt_messages(prompt, mark_cacheable=False)[0]["content"][0] == {"type": "text", "text": "Instructions"}
+    assert prompt_messages(PromptParts("Instructions"))[0]["content"] == [{"type": "text", "text": "Instructions", "cache_control": {"type": "ephemeral"}}]
+    assert prompt_messages(PromptParts("", "Act 2")) == [{"role": "user", "content": "Act 2"}]
+    assert prompt_messages("plain") == [{"role": "user", "content": "plain"}]
+
+
+def test_acts_of_a_story_share_their_prefix_byte_for_byte():
+    prompts = [
+        format_act_prompt(act_prompt_for(act_index), "The blueprint.", f"Chapter {chapter}", act_index, chapter, f"Act {act_index}", None, "earlier text", "A keeper")
+        for chapter in (1, 2) for act_index in range(3)
+    ]
+    assert len({prompt.prefix for prompt in prompts}) == 1
+    assert len({prompt.suffix for prompt in prompts}) == len(prompts)
+    assert "The blueprint." in prompts[0].prefix and "A keeper" in prompts[0].prefix
+
+
+def test_cached_tokens_from_either_usage_format():
+    assert cached_prompt_tokens(SimpleNamespace(usage_metadata={"input_token_details": {"cache_read": 1200}})) == 1200
+    openai_style = SimpleNamespace(usage_metadata={}, response_metadata={"token_usage": {"prompt_tokens_details": {"cached_tokens": 640}}})
+    assert cached_prompt_tokens(openai_style) == 640
+    assert cached_prompt_tokens(SimpleNamespace()) == 0
+
+
+def test_tracker_remembers_the_most_recent_prefixes():
+    tracker = PrefixTracker(capacity=2)
+    assert not tracker.seen("a") and tracker.seen("a")
+    assert not tracker.seen("")
+    tracker.seen("b")
+    tracker.seen("a")
+    tracker.seen("c")
+    assert tracker.seen("a") and not tracker.seen("b")
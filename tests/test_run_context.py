@@ -0,0 +1,25 @@
+import pytest
+
+from run_context import RunContext, writing_story_files
+
+
+def test_only_the_story_file_outlives_the_block(tmp_path):
+    context = RunContext("session-a")
+    story_file = tmp_path / "story_20240101_120000_a.md"
+    run, writer = object(), object()
+    with context.writing(story_file, writer, run):
+        assert (context.run, context.writer) == (run, writer)
+        assert story_file.resolve() in writing_story_files()
+    assert context.run is None and context.writer is None
+    assert context.story_file == story_file and context.stories == [story_file]
+    assert story_file.resolve() not in writing_story_files()
+
+
+def test_failed_runs_are_let_go_too(tmp_path):
+    context = RunContext("session-a")
+    story_file = tmp_path / "story_20240101_120000_a.md"
+    with pytest.raises(RuntimeError):
+        with context.writing(story_file, object(), object()):
+            raise RuntimeError("model unavailable")
+    assert context.run is None and context.writer is None and context.story_file == story_file
+    assert story_file.resolve() not in writing_story_files()
@@ -0,0 +1,31 @@
+import logging
+
+from run_log import RunLog, file_logger
+
+
+def test_records_keep_a_preview_and_the_file_the_payload(caplog):
+    logger = logging.getLogger("test_run_log")
+    run_log = RunLog(capacity=3, preview_chars=10, logger=logger, tag="session")
+    with caplog.at_level(logging.INFO, logger="test_run_log"):
+        for number in range(5):
+            run_log.add(f"act {number} " + "x" * 1000)
+    records = run_log.page(1, 10)
+    assert [record.index for record in records] == [2, 3, 4]
+    assert all(len(record.text) == 10 and record.length == 1006 for record in records)
+    assert run_log.preview(records[0]) == "act 2 xxxx… (1006 characters)"
+    assert caplog.records[-1].getMessage() == "[session] act 4 " + "x" * 1000
+
+
+def test_short_records_are_kept_whole():
+    run_log = RunLog(preview_chars=10, logger=logging.getLogger("test_run_log"))
+    record = run_log.add("done")
+    assert record.text == "done" and run_log.preview(record) == "done"
+
+
+def test_previews_point_at_the_file_the_logger_writes(tmp_path):
+    path = tmp_path / "logs" / "run.log"
+    run_log = RunLog(preview_chars=10, logger=file_logger(str(path)))
+    record = run_log.add("act 1 " + "x" * 1000)
+    assert run_log.path == path
+    assert run_log.preview(record) == f"act 1 xxxx… (1006 characters, full text in {path})"
+    assert path.read_text(encoding="utf-8").endswith("act 1 " + "x" * 1000 + "\n")
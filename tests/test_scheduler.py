@@ -0,0 +1,12 @@
+from scheduler import TaskGraph
+
+
+def test_released_results_are_dropped():
+    with TaskGraph(max_workers=2) as graph:
+        graph.add("act", lambda: "a long act")
+        assert graph.result("act") == "a long act"
+        graph.release("act")
+        graph.add("next", lambda previous: previous, deps=["act"])
+        assert graph.result("act") is None
+        assert graph.result("next") is None
+        graph.release("unknown")
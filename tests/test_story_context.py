@@ -0,0 +1,81 @@
+import pytest
+
+import story_pipeline
+from governor import Governor
+from mock_model import MockChatModel
+from story_context import ContextBudget
+from story_pipeline import act_prompt_for, format_act_prompt
+from tokens import count_tokens
+
+ACTS = [f"Act {number} begins. " + "The keeper watched the sea and the sky. " * 120 for number in range(1, 9)]
+DESCRIPTIONS = [f"The keeper's watch, part {number}" for number in range(1, 9)]
+BLUEPRINT = "\n\n".join(
+    [f"Synopsis: a keeper and a storm. " * 10]
+    + [f"Chapter {number}: The Night {number} " + "waves and wind and a lamp. " * 40 for number in range(1, 9)]
+)
+
+
+class ReadLog(list):
+    """Acts that record which of them were read"""
+
+    def __init__(self, acts):
+        super().__init__(acts)
+        self.read = []
+
+    def __getitem__(self, index):
+        self.read.append(index)
+        return super().__getitem__(index)
+
+
+def act_prompt_tokens(budget, act_count):
+    previous = ACTS[:act_count]
+    blueprint = BLUEPRINT if budget is None else budget.blueprint_for(BLUEPRINT, "The Night 3")
+    previous_text = "".join("\n" + act for act in previous) if budget is None else budget.previous_text(previous, DESCRIPTIONS[:act_count])
+    prompt = format_act_prompt(act_prompt_for(act_count), blueprint, "The third night", act_count, 3, DESCRIPTIONS[act_count - 1], None, previous_text, "A keeper")
+    return count_tokens(prompt.text)
+
+
+def test_short_chapters_are_passed_on_whole():
+    budget = ContextBudget(recent_tokens=10_000)
+    assert budget.previous_text(ACTS[:2], DESCRIPTIONS[:2]) == "\n" + ACTS[0] + "\n" + ACTS[1]
+
+
+def test_long_chapters_become_a_summary_and_a_recent_tail():
+    budget = ContextBudget(recent_tokens=300)
+    acts = ReadLog(ACTS[:6])
+    text = budget.previous_text(acts, DESCRIPTIONS[:6])
+    summary, tail = text.split("\n\nthe most recent text, continue directly from it:\n...")
+    assert summary.splitlines()[2:] == [f"- {description}" for description in DESCRIPTIONS[:6]]
+    assert ACTS[5].endswith(tail) and count_tokens(tail) <= 300
+    # Only the acts the tail reaches back into are read
+    assert acts.read == [5]
+
+
+def test_prompt_size_stays_flat_as_acts_grow():
+    budget = ContextBudget(recent_tokens=400, blueprint_tokens=500)
+    bounded = [act_prompt_tokens(budget, count) for count in range(1, 8)]
+    full = [act_prompt_tokens(None, count) for count in range(1, 8)]
+    # Only a summary line per earlier act is added
+    assert max(bounded) - min(bounded) < 100
+    assert all(later - earlier > 600 for earlier, later in zip(full, full[1:]))
+
+
+def test_blueprint_keeps_the_chapter_then_the_opening():
+    budget = ContextBudget(blueprint_tokens=500)
+    blueprint = budget.blueprint_for(BLUEPRINT, "The Night 5")
+    paragraphs = blueprint.split("\n\n")
+    assert count_tokens(blueprint) <= 500
+    assert paragraphs[0].startswith("Synopsis") and paragraphs[1].startswith("Chapter 5: The Night 5 ")
+    assert "The Night 4 " not in blueprint
+    assert ContextBudget(blueprint_tokens=100_000).blueprint_for(BLUEPRINT, "The Night 5") == BLUEPRINT
+
+
+def test_story_run_tallies_the_tokens_it_saved(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(story_pipeline, "model", MockChatModel(latency=0.0, token_delay=0.0, words=600, chapters=2))
+    monkeypatch.setattr(story_pipeline, "governor", Governor(requests_per_minute=None, tokens_per_minute=None))
+    budget = ContextBudget(recent_tokens=200, blueprint_tokens=300)
+    story_pipeline.write_story("A lighthouse keeper", use_cache=False, context_budget=budget)
+    assert budget.acts == 2 * story_pipeline.ACTS_PER_CHAPTER
+    assert 0 < budget.prompt_tokens < budget.full_prompt_tokens
+    assert budget.report().startswith(f"6 act prompts used {budget.prompt_tokens} tokens ({budget.full_prompt_tokens} without")
@@ -0,0 +1,50 @@
+from story_library import StoryLibrary, story_title
+from story_writer import StoryWriter
+
+
+def test_counts_match_the_file_when_words_are_split_across_flushes(tmp_path):
+    library = StoryLibrary(tmp_path / "library.sqlite")
+    story_file = tmp_path / "story_20240101_120000_A%20lighthouse.md"
+    writer = StoryWriter(story_file, "A lighthouse keeper", library, buffer_chars=7).start()
+    for chapter_number in (1, 2):
+        writer.chapter(chapter_number, f"Part {chapter_number}")
+        for act_number in (1, 2):
+            text = "The lamp turned slowly over the harbour. " * 5
+            # Streamed in pieces that cut words in half, each flushed on its own
+            for start in range(0, len(text), 5):
+                writer.write(text[start:start + 5])
+            writer.act_done(chapter_number, f"Part {chapter_number}", act_number, text)
+    writer.close()
+    content = story_file.read_text()
+    [story] = library.page(1, 10)
+    assert (story["chapters"], story["words"]) == StoryLibrary._counts(content)
+    assert story["size"] == story_file.stat().st_size
+
+
+def test_pages_are_newest_first_and_filter_on_prompt_or_title(tmp_path):
+    library = StoryLibrary(tmp_path / "library.sqlite")
+    for second, prompt in enumerate(["A lighthouse keeper", "A dragon", "A lighthouse ghost"]):
+        library.start(tmp_path / f"story_20240101_12000{second}_x.md", prompt)
+    library.set_title(tmp_path / "story_20240101_120001_x.md", "The Last Lighthouse")
+    assert [story["prompt"] for story in library.page(1, 2)] == ["A lighthouse ghost", "A dragon"]
+    assert [story["prompt"] for story in library.page(2, 2)] == ["A lighthouse keeper"]
+    assert library.count("lighthouse") == 3
+    assert library.count("100%_") == 0
+    assert [story["title"] for story in library.page(1, 10, "dragon")] == ["The Last Lighthouse"]
+
+
+def test_sync_indexes_files_written_outside_the_library(tmp_path):
+    library = StoryLibrary(tmp_path / "library.sqlite")
+    story_file = tmp_path / "story_20240101_120000_A%20dragon.md"
+    story_file.write_text("# Story based on prompt: A dragon\n\n\n## Chapter 1: Fire\n\nThe dragon woke.\n\n")
+    assert library.sync(tmp_path) == 1
+    assert library.sync(tmp_path) == 0
+    [story] = library.page(1, 10)
+    assert (story["prompt"], story["chapters"]) == ("A dragon", 1)
+    story_file.unlink()
+    assert library.sync(tmp_path) == 1 and library.count() == 0
+
+
+def test_title_from_blueprint():
+    assert story_title("Intro\n**Title:** \"The Keeper\"\nMore") == "The Keeper"
+    assert story_title("No title here") is None
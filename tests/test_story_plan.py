@@ -0,0 +1,67 @@
+import pytest
+
+import story_pipeline
+from governor import Governor
+from mock_model import MockChatModel
+from story_library import StoryLibrary
+from story_pipeline import ACTS_PER_CHAPTER, StoryRun, plan_story
+from story_plan import PlannedCall, StageStats, duration, fit_latency, simulate
+
+CHAPTERS = {f"Chapter {number}": f"What happens in chapter {number}." for number in range(1, 6)}
+BLUEPRINT = "A keeper tends a lighthouse on a remote island. " * 20
+
+
+@pytest.fixture
+def mock_pipeline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(story_pipeline, "model", MockChatModel(latency=0.0, token_delay=0.0, words=120, chapters=4))
+    monkeypatch.setattr(story_pipeline, "governor", Governor(requests_per_minute=None, tokens_per_minute=None))
+
+
+def test_calls_wait_for_their_deps_and_a_free_worker():
+    calls = [PlannedCall("a", 0, 0, 2.0), PlannedCall("b", 0, 0, 1.0, ["a"]), PlannedCall("c", 0, 0, 3.0), PlannedCall("d", 0, 0, 1.0, ["outside"])]
+    assert simulate(calls, 1) == 7.0
+    assert simulate(calls, 2) == 4.0
+    assert simulate(calls, 4) == 3.0
+    assert simulate([], 4) == 0.0
+
+
+def test_latency_fit():
+    assert fit_latency([(100, 2.0)] * 2) == (StageStats().latency, StageStats().seconds_per_token)
+    latency, per_token = fit_latency([(tokens, 0.5 + tokens / 100) for tokens in (100, 200, 300, 400, 500)])
+    assert latency == pytest.approx(0.5) and per_token == pytest.approx(0.01)
+    assert fit_latency([(tokens, 1.0) for tokens in (100, 200, 300, 400, 500)]) == (1.0, 0.0)
+
+
+def test_plan_keeps_the_first_chapters_and_caps_acts(mock_pipeline):
+    run = StoryRun("A lighthouse keeper", max_chapters=2, max_act_tokens=300)
+    plan = plan_story(run, CHAPTERS, BLUEPRINT)
+    assert run.plan is plan
+    assert list(plan.chapters) == ["Chapter 1", "Chapter 2"]
+    assert {call.chapter for call in plan.calls} == {1, 2}
+    acts = [call for call in plan.calls if call.key[0] == "act"]
+    assert len(acts) == 2 * ACTS_PER_CHAPTER and all(call.completion_tokens == 300 for call in acts)
+    assert plan.report().endswith("(kept the first 2 of 5 chapters)")
+
+
+def test_plan_drops_chapters_from_the_end_to_meet_the_deadline(mock_pipeline):
+    uncapped = plan_story(StoryRun("A lighthouse keeper"), CHAPTERS, BLUEPRINT)
+    one_chapter = uncapped
+    while len(one_chapter.chapters) > 1:
+        one_chapter = one_chapter.without_last_chapter()
+
+    deadline = (uncapped.seconds + one_chapter.seconds) / 2
+    plan = plan_story(StoryRun("A lighthouse keeper", deadline=deadline), CHAPTERS, BLUEPRINT)
+    assert 1 <= len(plan.chapters) < len(CHAPTERS) and plan.seconds <= deadline
+    assert list(plan.chapters) == list(CHAPTERS)[:len(plan.chapters)]
+    assert plan.notes == [f"dropped the last {len(CHAPTERS) - len(plan.chapters)} of 5 chapters to fit the {duration(deadline)} deadline"]
+
+    plan = plan_story(StoryRun("A lighthouse keeper", deadline=1.0), CHAPTERS, BLUEPRINT)
+    assert list(plan.chapters) == ["Chapter 1"] and plan.notes[-1] == "over the 1 second deadline even so"
+
+
+def test_story_is_written_to_the_trimmed_plan(mock_pipeline):
+    story_file = story_pipeline.write_story("A lighthouse keeper", use_cache=False, max_chapters=2, max_act_tokens=20)
+    assert [number for number, title in StoryLibrary.chapters(story_file)] == [1, 2]
+    acts = [part for part in story_file.read_text().split("\n\n") if part.strip() and not part.lstrip().startswith("#")]
+    assert len(acts) == 2 * ACTS_PER_CHAPTER and all(len(act.split()) <= 20 for act in acts)
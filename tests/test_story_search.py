@@ -0,0 +1,43 @@
+from story_library import SNIPPET_WORDS, StoryLibrary, match_expression
+
+
+def library_with_passages(tmp_path):
+    library = StoryLibrary(tmp_path / "library.sqlite")
+    keeper = tmp_path / "story_20240101_120000_keeper.md"
+    dragon = tmp_path / "story_20240101_120001_dragon.md"
+    library.start(keeper, "A lighthouse keeper")
+    library.start(dragon, "A dragon")
+    library.set_title(keeper, "The Keeper")
+    library.add_passage(keeper, 1, "The Light", 1, "The lantern burned, and the lantern lit the harbour.")
+    library.add_passage(keeper, 1, "The Light", 2, "Fog rolled in and the ships waited. " * 4 + "Somewhere a lantern flickered.")
+    library.add_passage(dragon, 1, "Fire", 1, "The dragon circled all night long, far from any harbour.")
+    return library, keeper, dragon
+
+
+def test_more_relevant_passages_come_first(tmp_path):
+    library, keeper, dragon = library_with_passages(tmp_path)
+    results = library.search("lantern")
+    assert [(result["story_file"], result["act"]) for result in results] == [(str(keeper), 1), (str(keeper), 2)]
+    assert results[0]["title"] == "The Keeper" and results[0]["chapter_title"] == "The Light"
+
+
+def test_every_word_must_match(tmp_path):
+    library, keeper, dragon = library_with_passages(tmp_path)
+    assert [result["story_file"] for result in library.search("harbour dragon")] == [str(dragon)]
+    assert [result["act"] for result in library.search("lanterns harbours")] == [1]
+
+
+def test_snippet_marks_matches_within_a_window(tmp_path):
+    library, keeper, dragon = library_with_passages(tmp_path)
+    [result] = library.search("fog")
+    assert result["snippet"].startswith("**Fog** rolled in")
+    assert result["snippet"].endswith("…")
+    assert len(result["snippet"].split()) <= SNIPPET_WORDS
+
+
+def test_typed_text_is_not_parsed_as_query_syntax(tmp_path):
+    library, keeper, dragon = library_with_passages(tmp_path)
+    assert match_expression('lantern" OR dragon*') == '"lantern" "OR" "dragon"'
+    assert [result["act"] for result in library.search('lantern" (')] == [1, 2]
+    assert library.search("dragon OR lantern") == []
+    assert library.search(' "*" ') == []
@@ -0,0 +1,57 @@
+import sqlite3
+
+from story_store import StoryStore, store_path
+
+
+def write_story(story_file):
+    store = StoryStore(store_path(story_file), compression="gzip")
+    store.start(story_file, "A lighthouse keeper")
+    store.add_chapter(1, "The Light")
+    store.add_act(1, 1, "The lamp turned.")
+    store.add_act(1, 2, "A ship answered.")
+    return store
+
+
+def test_writes_after_close_are_dropped(tmp_path):
+    store = write_story(tmp_path / "story.md")
+    store.close()
+    store.add_chapter(2, "The Storm")
+    store.add_act(2, 1, "Waves.")
+    store.set_title("The Keeper")
+    store.finish()
+    store.start(tmp_path / "story.md", "Another prompt")
+    with StoryStore.existing(tmp_path / "story.md") as reopened:
+        assert reopened.chapters() == [(1, "The Light")]
+        assert reopened.manifest()["finished"] is False
+
+
+def test_existing_stores_are_read_without_writing(tmp_path):
+    story_file = tmp_path / "story.md"
+    write_story(story_file).close()
+    path = store_path(story_file)
+    before = path.stat().st_mtime_ns, path.read_bytes()
+    with StoryStore.existing(story_file) as store:
+        assert store.chapter_markdown(1) == "The lamp turned.\n\nA ship answered.\n\n"
+        try:
+            store.add_chapter(2, "The Storm")
+        except sqlite3.OperationalError:
+            pass
+        else:
+            raise AssertionError("a read-only store accepted a write")
+    assert (path.stat().st_mtime_ns, path.read_bytes()) == before
+
+
+def test_existing_store_reads_a_story_still_being_written(tmp_path):
+    story_file = tmp_path / "story.md"
+    writing = write_story(story_file)
+    with StoryStore.existing(story_file) as store:
+        assert store.act(1, 2) == "A ship answered."
+    writing.add_act(1, 3, "Dawn.")
+    writing.close()
+
+
+def test_container_keeps_no_pipeline_stages(tmp_path):
+    write_story(tmp_path / "story.md").close()
+    with sqlite3.connect(store_path(tmp_path / "story.md")) as conn:
+        tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert tables == {"manifest", "chapters", "acts"}
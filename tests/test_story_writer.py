@@ -0,0 +1,68 @@
+import sys
+import threading
+
+from story_writer import StoryWriter
+
+
+def test_acts_read_back_while_the_next_ones_are_written(tmp_path):
+    writer = StoryWriter(tmp_path / "story.md", "A lighthouse keeper", buffer_chars=1 << 20).start()
+    acts = {(1, number): f"Act {number}. " + "The lamp turned. " * (50 + number) for number in range(1, 201)}
+    finished = threading.Event()
+    problems = []
+
+    def read():
+        # Each act is read the moment it shows up as finished
+        for key, text in acts.items():
+            while not writer.has_act(*key):
+                if finished.is_set():
+                    return
+            if writer.act_text(*key) != text:
+                problems.append(key)
+
+    # Switch threads as often as possible, so the reader runs in the middle of `act_done`
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        reader = threading.Thread(target=read)
+        reader.start()
+        writer.chapter(1, "The Light")
+        for (chapter_number, act_number), text in acts.items():
+            # Streamed in pieces, which stay in the buffer until the act is done
+            for start in range(0, len(text), 64):
+                writer.write(text[start:start + 64])
+            writer.act_done(chapter_number, "The Light", act_number, text)
+        reader.join(timeout=30)
+        finished.set()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    writer.close()
+    assert problems == []
+    assert all(writer.act_text(*key) == text for key, text in acts.items())
+
+
+class WatchedFile:
+    """Story file handle that checks, whenever text is written out, that no indexed act is still in the buffer"""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.file = writer._file
+        self.problems = []
+
+    def write(self, content):
+        on_disk = self.writer.story_file.stat().st_size
+        self.problems += [key for key, (start, end) in self.writer.offsets.items() if end > on_disk]
+        return self.file.write(content)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def test_acts_are_indexed_only_once_on_disk(tmp_path):
+    writer = StoryWriter(tmp_path / "story.md", "A lighthouse keeper", buffer_chars=1 << 20).start()
+    watched = writer._file = WatchedFile(writer)
+    writer.chapter(1, "The Light")
+    for act_number in range(1, 4):
+        writer.add_act(1, "The Light", act_number, f"Act {act_number}: the lamp turned.")
+    writer.close()
+    assert watched.problems == []
+    assert writer.act_text(1, 2) == "Act 2: the lamp turned."
@@ -0,0 +1,60 @@
+import threading
+from pathlib import Path
+
+import pytest
+
+import story_pipeline
+from governor import Governor
+from mock_model import MockChatModel
+
+APP = Path(__file__).resolve().parent.parent / "story_generator.py"
+
+
+@pytest.fixture
+def mock_pipeline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(story_pipeline, "model", MockChatModel(latency=0.0, token_delay=0.0, words=80, chapters=2))
+    monkeypatch.setattr(story_pipeline, "governor", Governor(requests_per_minute=None, tokens_per_minute=None))
+
+
+def write_in_app(prompt, stream_acts):
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(str(APP), default_timeout=120).run()
+    app.text_input[0].input(prompt)
+    checkboxes = {checkbox.label: checkbox for checkbox in app.checkbox}
+    checkboxes["Use response cache"].uncheck()
+    checkboxes["Stream act text"].set_value(stream_acts)
+    next(button for button in app.button if button.label == "Generate Story").click()
+    app.run()
+    assert not app.exception
+    return app.session_state["run_context"].story_file
+
+
+def test_streamed_story_file_matches_the_unstreamed_one(mock_pipeline):
+    streamed = write_in_app("A lighthouse keeper", stream_acts=True)
+    unstreamed = write_in_app("A lighthouse keeper", stream_acts=False)
+    assert streamed != unstreamed
+    assert streamed.read_bytes() == unstreamed.read_bytes()
+
+
+@pytest.mark.parametrize("use_async", [False, True])
+def test_failed_act_ends_its_stream(mock_pipeline, monkeypatch, use_async):
+    def broken_request(*args):
+        raise ValueError("no request")
+
+    monkeypatch.setattr(story_pipeline, "act_request", broken_request)
+    run = story_pipeline.StoryRun("A lighthouse keeper", use_async=use_async, stream_acts=True, use_cache=False)
+    with run, story_pipeline.queue_story(run):
+        chapters = run.result("chapters")
+        assert chapters
+        for act_index in range(2):
+            chunks = []
+            stream = run.act_stream(1, act_index)
+            if stream is not None:
+                reader = threading.Thread(target=lambda: chunks.extend(stream), daemon=True)
+                reader.start()
+                reader.join(timeout=10)
+                assert not reader.is_alive(), f"stream of act {act_index} never ended"
+            with pytest.raises(ValueError):
+                run.result(("act", 1, act_index))
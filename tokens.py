@@ -0,0 +1,39 @@
+import re
+from functools import lru_cache
+
+# Rough characters-per-token ratio for English prose, used when no tokenizer is available
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=None)
+def _encoding():
+    # tiktoken downloads its vocabulary on first use, which fails on offline machines
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text):
+    """Number of tokens in `text` (cl100k_base, or an estimate without tiktoken)"""
+    if not text:
+        return 0
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def tail_tokens(text, max_tokens):
+    """The last `max_tokens` tokens of `text`, starting at a word boundary"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _encoding()
+    if encoding is not None:
+        tail = encoding.decode(encoding.encode(text, disallowed_special=())[-max_tokens:])
+    else:
+        tail = text[-max_tokens * CHARS_PER_TOKEN:]
+    # Drop the partial word (or sentence piece) the cut landed in
+    match = re.search(r"\s", tail)
+    return tail[match.end():] if match else tail
@@ -0,0 +1,135 @@
+import csv
+import json
+import threading
+import time
+from contextvars import ContextVar
+
+# Span of the pipeline task that is currently executing, for the step functions to annotate
+current_span = ContextVar("current_span", default=None)
+
+SPAN_FIELDS = [
+    "key", "stage", "queue_seconds", "wall_seconds", "prompt_tokens", "cached_tokens", "reusable_tokens",
+    "completion_tokens", "calls", "retries", "model", "fallbacks", "cache", "error",
+]
+
+
+def stage_of(key):
+    """Stage name of a task key: ("act", 2, 1) -> "act" """
+    return key[0] if isinstance(key, tuple) else key
+
+
+class Span:
+    """Timing and token counts of one pipeline task"""
+
+    def __init__(self, key, queue_seconds=0.0):
+        self.key = key
+        self.stage = stage_of(key)
+        self.queue_seconds = queue_seconds
+        self.wall_seconds = 0.0
+        self.prompt_tokens = 0
+        # Prompt tokens the provider served from its prefix cache
+        self.cached_tokens = 0
+        # Prompt tokens in a prefix that had already been sent, which a prefix cache could reuse
+        self.reusable_tokens = 0
+        self.completion_tokens = 0
+        self.calls = 0
+        self.retries = 0
+        # Model that answered the task's last call ("backend:model"), and models it fell back from
+        self.model = None
+        self.fallbacks = 0
+        self.cache = None
+        self.error = None
+
+    def record_call(self, prompt_tokens, completion_tokens, cache, cached_tokens=0, reusable_tokens=0):
+        """Add one model call (or cache lookup) made by this task"""
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        self.reusable_tokens += reusable_tokens
+        self.completion_tokens += completion_tokens
+        # A task that mixes hits and misses is reported as a miss
+        self.cache = cache if self.cache in (None, cache) else "miss"
+
+    def as_dict(self):
+        data = {field: getattr(self, field) for field in SPAN_FIELDS}
+        data["key"] = "/".join(str(part) for part in self.key) if isinstance(self.key, tuple) else self.key
+        return data
+
+
+class RunTrace:
+    """Spans of every task in one story run, exportable as JSON or CSV"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.finished = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def start(self, key, queue_seconds=0.0):
+        span = Span(key, queue_seconds)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def finish(self):
+        self.finished = time.monotonic()
+
+    @property
+    def wall_seconds(self):
+        return (self.finished or time.monotonic()) - self.started
+
+    def summary(self):
+        """Per-stage totals, slowest stage first"""
+        stages = {}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            row = stages.setdefault(span.stage, {
+                "stage": span.stage, "tasks": 0, "wall_seconds": 0.0, "max_seconds": 0.0,
+                "queue_seconds": 0.0, "prompt_tokens": 0, "cached_tokens": 0, "reusable_tokens": 0,
+                "completion_tokens": 0, "cache_hits": 0, "fallbacks": 0,
+            })
+            row["tasks"] += 1
+            row["wall_seconds"] += span.wall_seconds
+            row["max_seconds"] = max(row["max_seconds"], span.wall_seconds)
+            row["queue_seconds"] += span.queue_seconds
+            row["prompt_tokens"] += span.prompt_tokens
+            row["cached_tokens"] += span.cached_tokens
+            row["reusable_tokens"] += span.reusable_tokens
+            row["completion_tokens"] += span.completion_tokens
+            row["cache_hits"] += span.cache in ("hit", "restored", "similar")
+            row["fallbacks"] += span.fallbacks
+        for row in stages.values():
+            row["mean_seconds"] = row["wall_seconds"] / row["tasks"]
+            row["tokens_per_second"] = row["completion_tokens"] / row["wall_seconds"] if row["wall_seconds"] else 0.0
+        return sorted(stages.values(), key=lambda row: row["wall_seconds"], reverse=True)
+
+    def totals(self):
+        with self._lock:
+            spans = list(self.spans)
+        completion_tokens = sum(span.completion_tokens for span in spans)
+        return {
+            "wall_seconds": self.wall_seconds,
+            "tasks": len(spans),
+            "calls": sum(span.calls for span in spans),
+            "prompt_tokens": sum(span.prompt_tokens for span in spans),
+            "cached_tokens": sum(span.cached_tokens for span in spans),
+            "reusable_tokens": sum(span.reusable_tokens for span in spans),
+            "completion_tokens": completion_tokens,
+            "fallbacks": sum(span.fallbacks for span in spans),
+            "tokens_per_second": completion_tokens / self.wall_seconds if self.wall_seconds else 0.0,
+        }
+
+    def write_json(self, path):
+        with self._lock:
+            spans = [span.as_dict() for span in self.spans]
+        with open(path, "w") as f:
+            json.dump({"totals": self.totals(), "stages": self.summary(), "spans": spans}, f, indent=2)
+
+    def write_csv(self, path):
+        with self._lock:
+            spans = [span.as_dict() for span in self.spans]
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=SPAN_FIELDS)
+            writer.writeheader()
+            writer.writerows(spans)